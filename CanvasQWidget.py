@@ -1,12 +1,23 @@
-from typing import List
+import heapq
+import math
+from typing import List, Optional
 
-from PySide6.QtCore import Signal, QRectF, QPointF, QTimer
-from PySide6.QtGui import QPainter, QMouseEvent, QWheelEvent, QColor, Qt, QTransform
+import numpy as np
+from PySide6.QtCore import Signal, QRectF, QPointF, QSizeF, QTimer, QElapsedTimer
+from PySide6.QtGui import QPainter, QMouseEvent, QWheelEvent, QColor, Qt, QTransform, QImage
 from PySide6.QtWidgets import QWidget
 
 from Drawable import Drawable
+from LinkRouter import LinkRouter
 from ModelDrawable import ModelDrawable
+from RenderBatch import RenderBatch, DrawStyle
+from Selection import Selection
+from TileCache import TileCache, TileKey
+from TileRenderer import TileRenderer, rasterize_tile
 from events import CanvasPointerEvent, CanvasZoomEvent, CanvasKeyEvent
+import tracing
+
+log = tracing.get_logger("canvas")
 
 
 class CanvasQWidget(QWidget):
@@ -16,27 +27,156 @@ class CanvasQWidget(QWidget):
     zoomFinished = Signal(CanvasZoomEvent)  # (scale, centerPoint)
     bufferChanged = Signal(CanvasKeyEvent)  # (scale, centerPoint)
     bufferFinished = Signal(CanvasKeyEvent)  # (scale, centerPoint)
+    # Emitted after every painted frame with its timings while instrumentation is on (see tracing.FrameStats).
+    frameStatsUpdated = Signal(dict)
     feedbackDrawables:List[Drawable] = []
+    # Level-of-detail policy, in screen pixels.
+    lodTextMinPixels = 8.0  # box labels are skipped when the box is shorter than this on screen
+    lodPointMaxPixels = 3.0  # drawables smaller than this on screen collapse into a single point
+    # Links are picked within this many screen pixels of their line.
+    linkPickPixels = 4.0
+    # Model-space margin added around the viewport so pen strokes on the border are not culled.
+    cullMargin = 4.0
+    # Pointer moves are coalesced and processed at most this many times per second (0 processes every event).
+    pointerRate = 60.0
+    # Gestures. Wheel zoom eases towards its target with this time constant, in seconds (0 zooms immediately).
+    zoomSmoothing = 0.05
+    # Kinetic pan (middle button drag): the release velocity decays with this time constant, in seconds,
+    # until it drops under panStopSpeed screen pixels per second.
+    panFriction = 0.3
+    panStopSpeed = 20.0
+    # Seconds per frame spent on missing tiles while a gesture runs (rasterized in draft quality) or with
+    # render workers (culled and queued); the remaining tiles are handled by the following frames.
+    interactiveBudget = 0.008
+    animationInterval = 16  # ms
+    # Tile rasterization threads: 0 rasterizes on the GUI thread, None uses every core (see set_render_workers).
+    renderWorkers = 0
+    placeholderColor = QColor(240, 240, 240)
+    # Outline of the selected drawables, padded by selectionPadPixels, and the rubber band.
+    selectionStyle = DrawStyle("#2a82da", 1.5, True)
+    selectionPadPixels = 3.0
+    rubberBandColor = QColor(42, 130, 218, 48)
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.inputBuffer=""
-        self.model = ModelDrawable()
+        # Rasterized static layer; invalidated per region by model change notifications.
+        self.tileCache = TileCache()
+        self._emptyTile = QImage()
+        self.renderer = None
+        self.model = None
+        # Optional selection (set_selection), outlined over the tiles. While dragged, the outlines are
+        # shifted by `selectionOffset` (model units) and the model is only edited on release.
+        self.selection = None
+        self.selectionOffset = QPointF()
+        self._selectionBounds = None
+        self.rubberBand = None
+        # Optional link router (set_router): links are drawn along their routes.
+        self.router = None
+        self.set_model(ModelDrawable())
         self.setMinimumSize(400, 400)
         # viewport parameters
         self.offset = QPointF(0, 0)
         self.scale = 1.0
 
-        # For zoom finish detection.
+        # Settle timer: fires once zoom and pan gestures have been idle for a while; full quality is then restored.
         self._zoomTimer = QTimer(self)
         self._zoomTimer.setInterval(300)
         self._zoomTimer.setSingleShot(True)
         self._zoomTimer.timeout.connect(self._onZoomFinished)
+        # Gesture animation: zoom target and anchor, kinetic pan velocity, stepped once per display frame.
+        self._zoomTarget = None
+        self._zoomAnchor = QPointF()
+        self._zoomed = False
+        self._panLast = None
+        self._panVelocity = QPointF()
+        self._panClock = QElapsedTimer()
+        self._kinetic = False
+        self._animTimer = QTimer(self)
+        self._animTimer.setInterval(self.animationInterval)
+        self._animTimer.timeout.connect(self._animate)
+        self._animClock = QElapsedTimer()
+        # During a gesture: the static layer captured when it started (image, offset, scale), drawn transformed
+        # under the tiles, and draft tiles (no antialiasing, no text) that are dropped once the gesture settles.
+        self._snapshot = None
+        self.draftTiles = TileCache(self.tileCache.tileSize, 128, self.tileCache.bucketsPerOctave)
+        self.set_render_workers(self.renderWorkers)
+
+        # Pointer move coalescing: only the latest position is kept and processed once per frame.
+        self._pendingMove = None
+        self._moveTimer = QTimer(self)
+        self._moveTimer.setSingleShot(True)
+        self._moveTimer.timeout.connect(self.flush_pointer_move)
+        self._lastMoveFlush = QElapsedTimer()
+        self._lastMoveFlush.start()
+        self.pointerMovesReceived = 0
+        self.pointerMovesDropped = 0
+        self.pointerMovesProcessed = 0
+        # Optional frame instrumentation (set_instrumentation) and its on-canvas HUD.
+        self.frameStats = None
+        self.showHud = False
+        # Set by update(), so instrumentation knows whether a pointer move gets a paint.
+        self._updateRequested = False
         # Enable mouse tracking so we receive mouse move events even without button presses.
         self.setMouseTracking(True)
         self.setFocusPolicy(Qt.StrongFocus)
         self.setFocus()
 
+    def set_model(self, model: ModelDrawable):
+        if self.model is not None:
+            self.model.remove_listener(self._onModelChanged)
+        self.model = model
+        model.add_listener(self._onModelChanged)
+        self.tileCache.clear()
+        if self.renderer is not None:
+            self.renderer.cancel_all()
+        if self.selection is not None:
+            self.selection.set_model(model)
+        self.update()
+
+    def set_router(self, router: Optional[LinkRouter]):
+        """Draws links along the routes of `router` (a LinkRouter of the canvas model), or straight with None."""
+        if self.router is not None:
+            self.router.routesChanged.disconnect(self._onModelChanged)
+        self.router = router
+        if router is not None:
+            router.routesChanged.connect(self._onModelChanged)
+        self.tileCache.clear()
+        self.draftTiles.clear()
+        self.update()
+
+    def with_routed_links(self, drawables: List[Drawable], rect: QRectF) -> List[Drawable]:
+        """Adds the links whose route, rather than their own bounds, crosses `rect`, keeping the z-order."""
+        if self.router is None:
+            return drawables
+        found = set(drawables)
+        routed = [link for link in self.router.routed_links_in_rect(rect) if link not in found]
+        if not routed:
+            return drawables
+        return list(heapq.merge(drawables, routed, key=self.model.id_of))
+
+    def set_selection(self, selection: Optional[Selection]):
+        """Outlines the drawables of `selection` (a Selection of the canvas model), or nothing with None."""
+        if self.selection is not None:
+            self.selection.remove_listener(self._onSelectionChanged)
+        self.selection = selection
+        if selection is not None:
+            selection.add_listener(self._onSelectionChanged)
+        self._onSelectionChanged()
+
+    def set_selection_offset(self, offset: QPointF):
+        """Shifts the selection outlines, e.g. to preview a drag before the move is applied."""
+        self.selectionOffset = QPointF(offset)
+        self.update()
+
+    def set_rubber_band(self, screenRect: Optional[QRectF]):
+        self.rubberBand = screenRect
+        self.update()
+
+    def _onSelectionChanged(self):
+        self._selectionBounds = None
+        self.update()
+
     def get_transform(self):
         """Returns the current transform matrix (model to screen)."""
         transform = QTransform()
@@ -63,8 +203,35 @@ class CanvasQWidget(QWidget):
             # Should not happen if scale != 0.
             return point
 
+    def set_render_workers(self, workers):
+        """
+        Moves tile rasterization to a pool of `workers` threads (None uses every core), or back to
+        the GUI thread with 0. Pending tiles show their draft or a placeholder until they are ready.
+        """
+        self.renderWorkers = workers
+        if workers == 0:
+            if self.renderer is not None:
+                self.renderer.shutdown()
+                self.renderer.deleteLater()
+                self.renderer = None
+        elif self.renderer is None:
+            self.renderer = TileRenderer(self.tileCache, workers, self)
+            self.renderer.tileReady.connect(self._onTileReady)
+        else:
+            self.renderer.set_workers(workers)
+        self.update()
+
+    def set_instrumentation(self, enabled: bool, hud: bool = True):
+        """Turns per-frame instrumentation on or off; `hud` also shows the stats on the canvas."""
+        self.frameStats = tracing.FrameStats() if enabled else None
+        self.showHud = enabled and hud
+        self.update()
+
     def paintEvent(self, event):
-        print("paintEvent triggered")  # Debug statement
+        recorder = tracing.recorder
+        stats = self.frameStats
+        timed = recorder is not None or stats is not None
+        start = tracing.now() if timed else 0.0
 
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing)
@@ -72,22 +239,302 @@ class CanvasQWidget(QWidget):
         # Fill background with white.
         painter.fillRect(self.rect(), QColor("white"))
 
-        # Apply transform.
+        # Static layer: cached model tiles covering the repainted region.
+        if self.renderer is not None:
+            # Tiles queued for a previous view and no longer visible are not worth rasterizing.
+            cache = self.tileCache
+            self.renderer.retain(cache.tiles_for_rect(cache.bucket_for(self.scale), self.viewportRect()))
+        self.paint_static_layer(painter, QRectF(event.rect()))
+        staticEnd = tracing.now() if timed else 0.0
+
+        # Overlay layer: selection and live feedback drawables, drawn on top of the tiles every frame.
+        self.paint_selection(painter)
+        painter.save()
         painter.translate(self.offset)
         painter.scale(self.scale, self.scale)
-
-        # Draw each drawable from the model.
-        painter.fillRect(self.get_transform().mapRect(self.rect()), QColor("white"))
-        for drawable in self.model.drawables:
-            drawable.draw(painter, self.model, self)
         for drawable in self.feedbackDrawables:
             drawable.draw(painter, self.model, self)
+        painter.restore()
+        if self.rubberBand is not None:
+            painter.fillRect(self.rubberBand, self.rubberBandColor)
+            painter.setPen(RenderBatch.pen_for(self.selectionStyle))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(self.rubberBand)
+        if timed:
+            end = tracing.now()
+            if recorder is not None:
+                recorder.record("paint", "paintEvent", start, end, tiles=len(self.tileCache))
+            if stats is not None:
+                # Culling happens while rasterizing missing tiles; it is reported apart from the static layer.
+                stats.add_time("static_ms", staticEnd - start - stats.current["cull_ms"] / 1000.0)
+                stats.add_time("feedback_ms", end - staticEnd)
+                stats.add_time("total_ms", end - start)
+                stats.count("feedback", len(self.feedbackDrawables))
+                frame = stats.end_frame(end, len(self.model.drawables))
+                if self.showHud:
+                    self.paint_hud(painter, stats)
+                self.frameStatsUpdated.emit(frame)
+        painter.end()
+
+    def paint_hud(self, painter: QPainter, stats: tracing.FrameStats):
+        """Draws a summary of the recent frame stats in the top-left corner of the widget."""
+        summary = stats.summary()
+        last = stats.last()
+
+        def times(key):
+            t = summary.get(key)
+            return f"{t['p50']:.1f}/{t['p99']:.1f}" if t else "-"
+
+        lines = [
+            f"frame {times('total_ms')} ms (p50/p99, {summary['frames']} frames)",
+            f"cull {times('cull_ms')}  static {times('static_ms')}  feedback {times('feedback_ms')}",
+            f"hit-test {times('hit_test_ms')}  dispatch {times('dispatch_ms')}  latency {times('latency_ms')}",
+            f"drawn {last['drawn']}  culled {last['culled']}  lod {last['collapsed']}  "
+            f"tiles {last['tiles_rendered']}+{last['tiles_cached']} cached",
+        ]
+        metrics = painter.fontMetrics()
+        lineHeight = metrics.height()
+        width = max(metrics.horizontalAdvance(line) for line in lines)
+        painter.fillRect(QRectF(4, 4, width + 12, lineHeight * len(lines) + 8), QColor(0, 0, 0, 160))
+        painter.setPen(QColor("white"))
+        for i, line in enumerate(lines):
+            painter.drawText(QPointF(10, 8 + metrics.ascent() + i * lineHeight), line)
+
+    def paint_static_layer(self, painter: QPainter, screenRect: QRectF, cachedOnly: bool = False):
+        """
+        Draws the model tiles covering `screenRect`, rasterizing missing ones. During a gesture, missing
+        tiles are rasterized in draft quality within `interactiveBudget`; the rest of the frame shows the
+        snapshot taken when the gesture started, and another frame is scheduled to keep refining.
+        With render workers, missing tiles are queued instead and show their draft tile, the snapshot
+        or a placeholder until they arrive. `cachedOnly` draws cached tiles only.
+        """
+        cache = self.tileCache
+        bucket = cache.bucket_for(self.scale)
+        ratio = self.scale / cache.bucket_scale(bucket)
+        modelRect = QRectF(self.screen_to_model(screenRect.topLeft()),
+                           self.screen_to_model(screenRect.bottomRight()))
+        size = cache.tileSize
+        interactive = self._snapshot is not None and not cachedOnly
+        background = self.renderer is not None
+        if interactive:
+            self.paint_snapshot(painter)
+        # Culling and batching for the workers also run on this thread, so they share the frame budget.
+        deadline = tracing.now() + self.interactiveBudget
+        refining = False
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, ratio != 1.0 and not interactive)
+        painter.translate(self.offset)
+        painter.scale(ratio, ratio)
+        stats = self.frameStats
+        for key in cache.tiles_for_rect(bucket, modelRect):
+            image = cache.get(key)
+            if image is None and cachedOnly:
+                continue
+            if image is None and interactive:
+                image = self.draftTiles.get(key)
+                if image is None and background and self.renderer.is_pending(key, True):
+                    continue
+                if image is None and tracing.now() > deadline:
+                    refining = True
+                    continue
+                if image is None and background:
+                    image = self.request_tile(key, draft=True)
+                    if image is None:
+                        continue
+                elif image is None:
+                    image = self.render_tile(key, draft=True)
+                    self.draftTiles.put(key, image)
+            elif image is None and background:
+                if self.renderer.is_pending(key, False):
+                    pass
+                elif tracing.now() > deadline:
+                    refining = True
+                else:
+                    image = self.request_tile(key)
+                if image is None:
+                    image = self.draftTiles.get(key)
+                if image is None:
+                    painter.fillRect(QRectF(key[1] * size, key[2] * size, size, size), self.placeholderColor)
+                    continue
+            elif image is None:
+                image = self.render_tile(key)
+                cache.put(key, image)
+            elif stats is not None:
+                stats.count("tiles_cached")
+            if not image.isNull():
+                painter.drawImage(QPointF(key[1] * size, key[2] * size), image)
+            elif interactive:
+                # Empty tile: hide whatever the snapshot shows there.
+                painter.fillRect(QRectF(key[1] * size, key[2] * size, size, size), QColor("white"))
+        painter.restore()
+        if refining:
+            self.update()
+
+    def paint_selection(self, painter: QPainter):
+        """
+        Outlines the selected drawables in the viewport, in one batch. Their bounds are gathered once
+        per selection or model change; selected drawables smaller than lodPointMaxPixels on screen
+        collapse into one point per pixel.
+        """
+        if self.selection is None or not len(self.selection):
+            return
+        if self._selectionBounds is None:
+            self._selectionBounds = self.model.bounds_of(self.selection.ids)
+        dx, dy = self.selectionOffset.x(), self.selectionOffset.y()
+        left, top, right, bottom = (self._selectionBounds + (dx, dy, dx, dy)).T
+        view = self.viewportRect()
+        visible = (left <= view.right()) & (right >= view.left()) & (top <= view.bottom()) & (bottom >= view.top())
+        left, top, right, bottom = left[visible], top[visible], right[visible], bottom[visible]
+        small = np.maximum(right - left, bottom - top) * self.scale < self.lodPointMaxPixels
+        batch = RenderBatch(self.scale)
+        pad = self.selectionPadPixels / self.scale
+        for l, t, r, b in zip(*(a[~small].tolist() for a in (left, top, right, bottom))):
+            batch.add_rect(self.selectionStyle, QRectF(l - pad, t - pad, r - l + 2 * pad, b - t + 2 * pad))
+        if small.any():
+            centers = np.stack([(left[small] + right[small]) / 2, (top[small] + bottom[small]) / 2], axis=1)
+            _, first = np.unique(np.floor(centers * self.scale), axis=0, return_index=True)
+            pointStyle = DrawStyle(self.selectionStyle.color, self.lodPointMaxPixels + 2, True)
+            for x, y in centers[first].tolist():
+                batch.add_point(pointStyle, QPointF(x, y))
+        painter.save()
+        painter.translate(self.offset)
+        painter.scale(self.scale, self.scale)
+        batch.flush(painter)
+        painter.restore()
+
+    def paint_snapshot(self, painter: QPainter):
+        """Draws the gesture snapshot moved and scaled from the view it was taken in to the current one."""
+        image, offset, scale = self._snapshot
+        k = self.scale / scale
+        painter.save()
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, False)
+        painter.translate(self.offset - offset * k)
+        painter.scale(k, k)
+        painter.drawImage(QPointF(0, 0), image)
+        painter.restore()
+
+    def _capture_snapshot(self):
+        dpr = self.devicePixelRatioF()
+        image = QImage(int(self.width() * dpr), int(self.height() * dpr), QImage.Format_RGB32)
+        image.setDevicePixelRatio(dpr)
+        image.fill(QColor("white"))
+        painter = QPainter(image)
+        self.paint_static_layer(painter, QRectF(self.rect()), cachedOnly=True)
         painter.end()
+        self._snapshot = (image, QPointF(self.offset), self.scale)
+
+    def render_tile(self, key: TileKey, draft: bool = False) -> QImage:
+        """
+        Rasterizes the model drawables under one tile; empty tiles share a null image.
+        Draft tiles skip antialiasing and labels.
+        """
+        drawables, points = self.cull_tile(key)
+        if not drawables and not points:
+            return self._emptyTile
+        scale = self.tileCache.bucket_scale(key[0])
+        return rasterize_tile(self.tileCache, key, self.devicePixelRatioF(), not draft,
+                              lambda painter: self.draw_drawables(painter, drawables, scale, points, draft))
+
+    def request_tile(self, key: TileKey, draft: bool = False) -> Optional[QImage]:
+        """
+        Queues a tile on the render workers. Tiles that need no worker (empty, or with drawables that
+        cannot be batched) are produced, cached and returned right away; otherwise returns None.
+        """
+        if self.renderer.is_pending(key, draft):
+            return None
+        drawables, points = self.cull_tile(key)
+        target = self.draftTiles if draft else self.tileCache
+        if not drawables and not points:
+            target.put(key, self._emptyTile)
+            return self._emptyTile
+        batch = self.make_batch(self.tileCache.bucket_scale(key[0]), points, draft)
+        if not all(drawable.batch(batch) for drawable in drawables):
+            image = self.render_tile(key, draft)
+            target.put(key, image)
+            return image
+        self.renderer.submit(key, draft, batch.detached(), self.devicePixelRatioF())
+        return None
+
+    def _onTileReady(self, key: TileKey, draft: bool, image: QImage):
+        (self.draftTiles if draft else self.tileCache).put(key, image)
+        if key[0] == self.tileCache.bucket_for(self.scale):
+            self.update(self.get_transform().mapRect(self.tileCache.tile_model_rect(key)).toAlignedRect())
+
+    def cull_tile(self, key: TileKey):
+        """The drawables and LOD points to draw on a tile (see ModelDrawable.query_rect_lod)."""
+        cache = self.tileCache
+        scale = cache.bucket_scale(key[0])
+        m = self.cullMargin + cache.bleedPixels / scale
+        stats = self.frameStats
+        start = tracing.now() if stats is not None else 0.0
+        rect = cache.tile_model_rect(key).adjusted(-m, -m, m, m)
+        drawables, points = self.model.query_rect_lod(rect, self.lodPointMaxPixels / scale, 1.0 / scale)
+        drawables = self.with_routed_links(drawables, rect)
+        if stats is not None:
+            stats.add_time("cull_ms", tracing.now() - start)
+            stats.count("tiles_rendered")
+            stats.count("drawn", len(drawables))
+            stats.count("collapsed", len(points))
+            stats.visible.update(drawables)
+        return drawables, points
+
+    def make_batch(self, scale: float, points: List[QPointF] = (), draft: bool = False) -> RenderBatch:
+        """A render batch for the current LOD policy, holding `points`; draft batches skip text."""
+        batch = RenderBatch(scale, math.inf if draft else self.lodTextMinPixels)
+        if self.router is not None:
+            batch.routeOf = self.router.route_of
+        pointStyle = DrawStyle("black", self.lodPointMaxPixels, True)
+        for point in points:
+            batch.add_point(pointStyle, point)
+        return batch
+
+    def draw_drawables(self, painter: QPainter, drawables: List[Drawable], scale: float, points: List[QPointF] = (),
+                       draft: bool = False):
+        """
+        Draws drawables through a style-grouped render batch, plus `points` for the
+        drawables collapsed by level of detail. Drawables without batch support are
+        drawn individually, after flushing what precedes them. Draft batches skip text.
+        """
+        batch = self.make_batch(scale, points, draft)
+        for drawable in drawables:
+            if not drawable.batch(batch):
+                batch.flush(painter)
+                drawable.draw(painter, self.model, self)
+        batch.flush(painter)
+
+    def set_feedback_drawables(self, drawables: List[Drawable]):
+        self.feedbackDrawables = [d for d in drawables if d is not None]
+        self.update()
+
+    def _onModelChanged(self, rects: List[QRectF]):
+        # Drop only the cached tiles touched by the change and repaint that part of the screen.
+        self._selectionBounds = None
+        transform = self.get_transform()
+        bleed = int(math.ceil(self.tileCache.bleedPixels))
+        for rect in rects:
+            m = self.cullMargin
+            rect = rect.adjusted(-m, -m, m, m)
+            self.tileCache.invalidate(rect)
+            self.draftTiles.invalidate(rect)
+            if self.renderer is not None:
+                self.renderer.cancel_where(lambda job: self.tileCache.touches(job.key, rect))
+            self.update(transform.mapRect(rect).toAlignedRect().adjusted(-bleed, -bleed, bleed, bleed))
 
     def get_canvas_pointer_event(self,event: QMouseEvent)->CanvasPointerEvent:
-        screenPoint=event.position()
+        return self.canvas_pointer_event_at(QPointF(event.position()))
+
+    def hit_test(self, modelPoint: QPointF) -> List[Drawable]:
+        """The drawables under a model point, in z-order; links are hit along the route they are drawn along."""
+        tolerance = self.linkPickPixels / self.scale
+        under = self.model.query_point(modelPoint, tolerance)
+        if self.router is not None:
+            under = self.router.pick(under, modelPoint, tolerance)
+        return under
+
+    def canvas_pointer_event_at(self, screenPoint: QPointF) -> CanvasPointerEvent:
         modelPoint = self.screen_to_model(screenPoint)
-        under = [d for d in self.model.drawables if d.contains(modelPoint)]
+        under = self.hit_test(modelPoint)
         return CanvasPointerEvent(
             screenPoint=screenPoint,
             modelPoint=modelPoint,
@@ -96,79 +543,281 @@ class CanvasQWidget(QWidget):
         )
 
 
+    def _emit_pointer_event(self, signal: Signal, name: str, screenPoint: QPointF, **fields):
+        """Hit-tests `screenPoint` and emits the pointer event, timing both steps when tracing or instrumentation is on."""
+        recorder = tracing.recorder
+        stats = self.frameStats
+        if recorder is None and stats is None:
+            signal.emit(self.canvas_pointer_event_at(screenPoint))
+            return
+        start = tracing.now()
+        event = self.canvas_pointer_event_at(screenPoint)
+        picked = tracing.now()
+        signal.emit(event)
+        end = tracing.now()
+        if recorder is not None:
+            recorder.record("input", name, start, end, **fields)
+        if stats is not None:
+            stats.add_time("hit_test_ms", picked - start)
+            stats.add_time("dispatch_ms", end - picked)
+
     def mousePressEvent(self, event: QMouseEvent):
-        self.pointerDown.emit(self.get_canvas_pointer_event(event))
+        if event.button() == Qt.MiddleButton:
+            self.begin_pan(QPointF(event.position()))
+            super().mousePressEvent(event)
+            return
+        self.flush_pointer_move()
+        self._emit_pointer_event(self.pointerDown, "pointerDown", QPointF(event.position()))
         super().mousePressEvent(event)
 
     def mouseReleaseEvent(self, event: QMouseEvent):
-        self.pointerUp.emit(self.get_canvas_pointer_event(event))
+        if event.button() == Qt.MiddleButton:
+            self.end_pan()
+            super().mouseReleaseEvent(event)
+            return
+        self.flush_pointer_move()
+        self._emit_pointer_event(self.pointerUp, "pointerUp", QPointF(event.position()))
         super().mouseReleaseEvent(event)
 
     def mouseMoveEvent(self, event: QMouseEvent):
-        self.pointerMove.emit(self.get_canvas_pointer_event(event))
+        if self._panLast is not None:
+            self.pan_to(QPointF(event.position()))
+            super().mouseMoveEvent(event)
+            return
+        self.pointerMovesReceived += 1
+        if self.frameStats is not None:
+            self.frameStats.input_received()
+        if self._pendingMove is not None:
+            self.pointerMovesDropped += 1
+        self._pendingMove = QPointF(event.position())
+        if self.pointerRate <= 0:
+            self.flush_pointer_move()
+        elif not self._moveTimer.isActive():
+            frame = 1000.0 / self.pointerRate
+            self._moveTimer.start(max(0, int(frame - self._lastMoveFlush.elapsed())))
         super().mouseMoveEvent(event)
 
+    def flush_pointer_move(self):
+        """Processes the latest pending pointer move, if any: one hit-test and one pointerMove emission."""
+        self._moveTimer.stop()
+        if self._pendingMove is None:
+            return
+        screenPoint, self._pendingMove = self._pendingMove, None
+        self._lastMoveFlush.restart()
+        self.pointerMovesProcessed += 1
+        stats = self.frameStats
+        self._updateRequested = False
+        self._emit_pointer_event(self.pointerMove, "pointerMove", screenPoint, dropped=self.pointerMovesDropped)
+        if stats is not None:
+            stats.input_handled(self._updateRequested)
+
+    def update(self, *args):
+        """QWidget.update, noting the request for the input latency of frameStats."""
+        self._updateRequested = True
+        super().update(*args)
+
+    def set_pointer_rate(self, rate: float):
+        """Sets how many pointer moves are processed per second; 0 disables coalescing."""
+        self.pointerRate = rate
+        if rate <= 0:
+            self.flush_pointer_move()
+
+    def pointer_stats(self) -> dict:
+        return {
+            "received": self.pointerMovesReceived,
+            "processed": self.pointerMovesProcessed,
+            "dropped": self.pointerMovesDropped,
+        }
+
+    def reset_pointer_stats(self):
+        self.pointerMovesReceived = self.pointerMovesDropped = self.pointerMovesProcessed = 0
+
     def wheelEvent(self, event: QWheelEvent):
+        recorder = tracing.recorder
+        start = tracing.now() if recorder is not None else 0.0
         # Get the mouse pointer position (screen coordinates).
         pointer = QPointF(event.position())
         # Determine zoom factor.
         delta = event.angleDelta().y()
-        zoomFactor = 1.0 + delta / 240.0  # adjust sensitivity as needed
+        zoomFactor = max(0.1, 1.0 + delta / 240.0)  # adjust sensitivity as needed
 
-        # Update scale.
-        oldScale = self.scale
-        self.scale *= zoomFactor
-
-        # Adjust the offset so that the pointer remains fixed.
-        # new_offset = pointer - zoomFactor * (pointer - old_offset)
-        self.offset = pointer - (pointer - self.offset) * zoomFactor
-
-        self.update()
-        screenPoint=event.point(0).position()
-        modelPoint = self.get_transform().map(screenPoint)
-        under = [d for d in self.model.drawables if d.contains(modelPoint)]
-        self.zoomFinished.emit(CanvasZoomEvent(
-            modelPoint=modelPoint,
-            screenPoint=screenPoint,
-            targetPath=under,
-            target=under[0] if len(under)>0 else None,
-            zoomValue=delta,
-            transformMatrix=self.get_transform()
-
-        ))
+        # Wheel notches accumulate into a target scale the animation eases towards, keeping the pointer fixed.
+        self.begin_interaction()
+        self._zoomTarget = (self._zoomTarget or self.scale) * zoomFactor
+        self._zoomAnchor = pointer
+        self._zoomed = True
+        if self.zoomSmoothing <= 0:
+            self.advance_animation(0.0)
+        else:
+            self._start_animation()
         self._zoomTimer.start()  # restart timer to detect zoom finish
+        if recorder is not None:
+            recorder.record("input", "wheel", start, tracing.now(), scale=self.scale)
 
     def keyReleaseEvent(self, event):
         key = event.key()
         if key in (Qt.Key_Return, Qt.Key_Enter):
-            print(f"Enter pressed. raising buffer '{self.inputBuffer}'.")
+            log.debug("Enter pressed. raising buffer '%s'.", self.inputBuffer)
             self.bufferFinished.emit(CanvasKeyEvent(key=key,buffer=self.inputBuffer))
             self.inputBuffer = ""
         elif key == Qt.Key_Escape:
-            print("Escape pressed. Clearing input buffer.")
+            log.debug("Escape pressed. Clearing input buffer.")
             self.inputBuffer = ""
             self.bufferChanged.emit(CanvasKeyEvent(key=key,buffer=self.inputBuffer))
         elif key == Qt.Key_Backspace:
-            print("Escape pressed. deleting last from input buffer.")
+            log.debug("Backspace pressed. deleting last from input buffer.")
             self.inputBuffer = self.inputBuffer[:-1]
             self.bufferChanged.emit(CanvasKeyEvent(key=key,buffer=self.inputBuffer))
         else:
             # Append character to buffer if it's a visible character.
             char = event.text()
-            if char:
+            # Control characters (shortcuts such as Ctrl+Z, Delete) are not typed text.
+            if char and char.isprintable():
                 self.inputBuffer += char
             self.bufferChanged.emit(CanvasKeyEvent(key=key,buffer=self.inputBuffer))
         super().keyPressEvent(event)
 
+    def zoom_at(self, screenPoint: QPointF, factor: float):
+        """Scales the view by `factor` around a fixed screen point."""
+        self.scale *= factor
+        # new_offset = pointer - zoomFactor * (pointer - old_offset)
+        self.offset = screenPoint - (screenPoint - self.offset) * factor
+        self.update()
+
+    def begin_pan(self, screenPoint: QPointF):
+        self._kinetic = False
+        self._panVelocity = QPointF()
+        self._panLast = screenPoint
+        self._panClock.start()
+        self.begin_interaction()
+
+    def pan_to(self, screenPoint: QPointF):
+        """Drags the view with the pointer and tracks its velocity for the kinetic phase."""
+        delta = screenPoint - self._panLast
+        self._panLast = screenPoint
+        dt = max(self._panClock.restart(), 1) / 1000.0
+        # Smoothed velocity, in screen pixels per second.
+        self._panVelocity = self._panVelocity * 0.5 + delta * (0.5 / dt)
+        self.offset += delta
+        self.update()
+
+    def end_pan(self):
+        """Releases a drag: the view keeps moving with the release velocity and slows down."""
+        self._panLast = None
+        # A pointer held still before the release throws nothing.
+        if self._panClock.elapsed() > 50:
+            self._panVelocity = QPointF()
+        speed = math.hypot(self._panVelocity.x(), self._panVelocity.y())
+        self._kinetic = self.panFriction > 0 and speed > self.panStopSpeed
+        if self._kinetic:
+            self._start_animation()
+        self._zoomTimer.start()
+
+    def begin_interaction(self):
+        """Switches rendering to the cheap gesture path until the gesture settles."""
+        if self._snapshot is None:
+            self._capture_snapshot()
+        self._zoomTimer.stop()
+
+    def is_animating(self) -> bool:
+        return self._zoomTarget is not None or self._kinetic
+
+    def _start_animation(self):
+        if not self._animTimer.isActive():
+            self._animClock.start()
+            self._animTimer.start()
+
+    def _animate(self):
+        dt = min(self._animClock.restart() / 1000.0, 0.1)
+        if not self.advance_animation(dt):
+            self._animTimer.stop()
+
+    def advance_animation(self, dt: float) -> bool:
+        """Steps the zoom and kinetic pan animations by `dt` seconds; returns whether they are still running."""
+        if self._zoomTarget is not None:
+            remaining = math.log(self._zoomTarget / self.scale)
+            if self.zoomSmoothing <= 0 or abs(remaining) < 1e-3:
+                self._zoomTarget = None
+                step = remaining
+            else:
+                step = remaining * (1.0 - math.exp(-dt / self.zoomSmoothing))
+            self.zoom_at(self._zoomAnchor, math.exp(step))
+        if self._kinetic:
+            self.offset += self._panVelocity * dt
+            self._panVelocity *= math.exp(-dt / self.panFriction)
+            if math.hypot(self._panVelocity.x(), self._panVelocity.y()) < self.panStopSpeed:
+                self._kinetic = False
+                self._zoomTimer.start()
+            self.update()
+        return self.is_animating()
+
+    def finish_interaction(self):
+        """Leaves the gesture path: drops the snapshot and draft tiles and repaints at full quality."""
+        self._animTimer.stop()
+        if self._zoomTarget is not None:
+            self.zoom_at(self._zoomAnchor, self._zoomTarget / self.scale)
+            self._zoomTarget = None
+        self._kinetic = False
+        self._snapshot = None
+        if self.renderer is None:
+            self.draftTiles.clear()
+        else:
+            # Kept as placeholders while the full quality tiles are rasterized.
+            self.renderer.cancel_where(lambda job: job.draft)
+        self.update()
+
     def _onZoomFinished(self):
-        # Emit zoomFinished event.
-        # For viewport, we simply send current scale and center point.
-        # center = QPointF(self.width() / 2, self.height() / 2)
-        # self.zoomFinished.emit(self.scale, center)
-        pass
+        if self.is_animating() or self._panLast is not None:
+            self._zoomTimer.start()
+            return
+        self.finish_interaction()
+        if not self._zoomed:
+            return
+        self._zoomed = False
+        screenPoint = self._zoomAnchor
+        modelPoint = self.screen_to_model(screenPoint)
+        under = self.hit_test(modelPoint)
+        self.zoomFinished.emit(CanvasZoomEvent(
+            modelPoint=modelPoint,
+            screenPoint=screenPoint,
+            targetPath=under,
+            target=under[0] if len(under)>0 else None,
+            zoomValue=self.scale,
+            transformMatrix=self.get_transform()
+        ))
 
     def viewportRect(self):
         # Returns the current viewport rect in canvas coordinates.
         topLeft = (-self.offset) / self.scale
-        size = self.size() / self.scale
+        size = QSizeF(self.size()) / self.scale
         return QRectF(topLeft, size)
+
+    def fit_rect(self, modelRect: QRectF):
+        """Sets the view so `modelRect` fills the widget, centered, keeping the aspect ratio."""
+        modelRect = modelRect.normalized()
+        if modelRect.width() <= 0 or modelRect.height() <= 0:
+            return
+        self.scale = min(self.width() / modelRect.width(), self.height() / modelRect.height())
+        self.offset = QPointF(self.width() / 2, self.height() / 2) - modelRect.center() * self.scale
+        self.update()
+
+    def paint_model(self, painter: QPainter):
+        """
+        Draws the model in the current view straight to `painter`, without the tile cache or overlays,
+        so vector devices (SVG, PDF) get vector output. Used to export the view.
+        """
+        m = self.cullMargin
+        rect = self.viewportRect().adjusted(-m, -m, m, m)
+        drawables, points = self.model.query_rect_lod(rect, self.lodPointMaxPixels / self.scale, 1.0 / self.scale)
+        drawables = self.with_routed_links(drawables, rect)
+        painter.save()
+        painter.translate(self.offset)
+        painter.scale(self.scale, self.scale)
+        self.draw_drawables(painter, drawables, self.scale, points)
+        painter.restore()
+
+    def drawables_in_rect(self, screenRect: QRectF):
+        """Rubber-band query: drawables intersecting a screen-space rect, in z-order."""
+        modelRect = QRectF(self.screen_to_model(screenRect.topLeft()),
+                           self.screen_to_model(screenRect.bottomRight()))
+        return self.model.query_rect(modelRect)
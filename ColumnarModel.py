@@ -0,0 +1,874 @@
+from collections.abc import MutableMapping, Sequence, Mapping
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PySide6.QtCore import QPointF, QRectF
+
+from Drawable import Drawable, BoxDrawable, LinkDrawable
+from ModelDrawable import MAX_NOTIFIED_RECTS, ModelDrawable, ModelRecords
+from RenderBatch import DrawStyle
+from SpatialIndex import CellIndex
+from geometry import point_segment_distance
+
+# Kind of each stable id.
+NONE, BOX, LINK = 0, 1, 2
+# Ids added or moved since a cell index was built are tested directly; beyond
+# max(SPATIAL_MIN_PENDING, rows / SPATIAL_PENDING_DIVISOR) of them the index is rebuilt.
+SPATIAL_MIN_PENDING = 4096
+SPATIAL_PENDING_DIVISOR = 4
+
+
+class Columns:
+    """Parallel, growable NumPy arrays. Rows are kept dense and in insertion order."""
+
+    def __init__(self, dtypes: Dict[str, type], capacity: int = 1024):
+        self.count = 0
+        self.arrays = {name: np.zeros(capacity, dtype) for name, dtype in dtypes.items()}
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """The live rows of one column (a view, writes go to the storage)."""
+        return self.arrays[name][:self.count]
+
+    def reserve(self, capacity: int):
+        current = len(next(iter(self.arrays.values())))
+        if capacity <= current:
+            return
+        capacity = max(capacity, current * 2)
+        for name, array in self.arrays.items():
+            grown = np.zeros(capacity, array.dtype)
+            grown[:self.count] = array[:self.count]
+            self.arrays[name] = grown
+
+    def extend(self, **columns) -> int:
+        """Appends rows given as equally long arrays; returns the first new row."""
+        n = len(next(iter(columns.values())))
+        first = self.count
+        self.reserve(first + n)
+        for name, values in columns.items():
+            self.arrays[name][first:first + n] = values
+        self.count += n
+        return first
+
+    def compact(self, keep: np.ndarray):
+        """Keeps only the rows where the boolean mask `keep` is set, preserving their order."""
+        n = int(keep.sum())
+        for name, array in self.arrays.items():
+            array[:n] = array[:self.count][keep]
+        self.count = n
+
+
+class StringTable:
+    """Interned strings, referenced from the columns by index."""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.lookup: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, index: int) -> str:
+        return self.strings[index]
+
+    def intern(self, string: str) -> int:
+        index = self.lookup.get(string)
+        if index is None:
+            index = self.lookup[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+
+class MetadataView(MutableMapping):
+    """Dict-like metadata of one columnar drawable. "name" lives in the columns, other keys in a sparse dict."""
+    __slots__ = ("model", "id")
+
+    def __init__(self, model: "ColumnarModelDrawable", drawableId: int):
+        self.model = model
+        self.id = drawableId
+
+    def __getitem__(self, key):
+        if key == "name":
+            return self.model.name_of(self.id)
+        return self.model.extraMetadata[self.id][key]
+
+    def __setitem__(self, key, value):
+        if key == "name":
+            self.model.set_name(self.id, value)
+        else:
+            self.model.extraMetadata.setdefault(self.id, {})[key] = value
+
+    def __delitem__(self, key):
+        if key == "name":
+            raise KeyError("name is a column and cannot be deleted")
+        extra = self.model.extraMetadata[self.id]
+        del extra[key]
+        if not extra:
+            del self.model.extraMetadata[self.id]
+
+    def __iter__(self):
+        yield "name"
+        yield from self.model.extraMetadata.get(self.id, ())
+
+    def __len__(self):
+        return 1 + len(self.model.extraMetadata.get(self.id, ()))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class BoxView(BoxDrawable):
+    """
+    Proxy for one box of a ColumnarModelDrawable, holding only the model and the stable id.
+    `rect` returns a copy: assign it (or use translate) to write geometry back.
+    """
+
+    def __init__(self, model: "ColumnarModelDrawable", boxId: int):
+        self.model = model
+        self.id = boxId
+
+    @property
+    def rect(self) -> QRectF:
+        return self.model.box_rect(self.id)
+
+    @rect.setter
+    def rect(self, rect: QRectF):
+        self.model.set_box_rect(self.id, rect)
+
+    @property
+    def metadata(self) -> MetadataView:
+        return MetadataView(self.model, self.id)
+
+    @metadata.setter
+    def metadata(self, metadata: dict):
+        self.model.set_metadata(self.id, metadata)
+
+    def translate(self, dx: float, dy: float):
+        self.model.translate_boxes(np.array([self.id]), dx, dy)
+
+    def draw_style(self):
+        return self.model.draw_style_of(self.id, self.style)
+
+    def __eq__(self, other):
+        return isinstance(other, BoxView) and other.model is self.model and other.id == self.id
+
+    def __hash__(self):
+        return hash((id(self.model), self.id))
+
+
+class LinkView(LinkDrawable):
+    """Proxy for one link of a ColumnarModelDrawable; its endpoints are box ids."""
+
+    def __init__(self, model: "ColumnarModelDrawable", linkId: int):
+        self.model = model
+        self.id = linkId
+
+    @property
+    def box1(self) -> BoxView:
+        return BoxView(self.model, self.model.link_endpoints(self.id)[0])
+
+    @property
+    def box2(self) -> BoxView:
+        return BoxView(self.model, self.model.link_endpoints(self.id)[1])
+
+    @property
+    def metadata(self) -> MetadataView:
+        return MetadataView(self.model, self.id)
+
+    @metadata.setter
+    def metadata(self, metadata: dict):
+        self.model.set_metadata(self.id, metadata)
+
+    def draw_style(self):
+        return self.model.draw_style_of(self.id, self.style)
+
+    def __eq__(self, other):
+        return isinstance(other, LinkView) and other.model is self.model and other.id == self.id
+
+    def __hash__(self):
+        return hash((id(self.model), self.id))
+
+
+class DrawableSequence(Sequence):
+    """Read-only, z-ordered sequence of views over every drawable of a columnar model."""
+
+    def __init__(self, model: "ColumnarModelDrawable"):
+        self.model = model
+
+    def __len__(self):
+        return len(self.model.boxes) + len(self.model.links)
+
+    def __getitem__(self, index):
+        ids = self.model.all_ids()[index]
+        if isinstance(index, slice):
+            return [self.model.drawable_for(i) for i in ids]
+        return self.model.drawable_for(int(ids))
+
+    def __iter__(self):
+        for drawableId in self.model.all_ids():
+            yield self.model.drawable_for(int(drawableId))
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class MetamodelView(Mapping):
+    """Box metadata keyed by stable id, computed from the columns instead of stored per box."""
+
+    def __init__(self, model: "ColumnarModelDrawable"):
+        self.model = model
+
+    def __getitem__(self, boxId):
+        if self.model.kind_of(boxId) != BOX:
+            raise KeyError(boxId)
+        return MetadataView(self.model, boxId)
+
+    def __iter__(self):
+        return iter(self.model.boxes["id"].tolist())
+
+    def __len__(self):
+        return len(self.model.boxes)
+
+
+class ColumnarModelDrawable(ModelDrawable):
+    """
+    ModelDrawable storing boxes and links in NumPy columns instead of one Python object per item.
+
+    Boxes are rows of x/y/w/h plus a stable id and an interned name; links are rows of
+    (source id, target id). Drawables handed out (from `drawables`, queries or `add_drawable`)
+    are BoxView/LinkView proxies that read and write the columns. Ids are never reused and
+    give the z-order. Bulk edits are vectorized over the columns, and queries go through a
+    vectorized CellIndex per kind (links indexed along their segment), which keeps per-item
+    memory to a few dozen bytes.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        # ModelDrawable.__init__ is not called: there is no per-object list, index or metamodel dict.
+        self.listeners = []
+        self.boxes = Columns({"id": np.int64, "x": np.float64, "y": np.float64,
+                              "w": np.float64, "h": np.float64, "name": np.int32}, capacity)
+        self.links = Columns({"id": np.int64, "source": np.int64, "target": np.int64,
+                              "name": np.int32}, capacity)
+        self.names = StringTable()
+        # Metadata keys other than "name", by id. Sparse: most drawables only have a name.
+        self.extraMetadata: Dict[int, dict] = {}
+        # Per stable id: its kind and its row in `boxes` or `links` (-1 once removed).
+        self.kinds = np.zeros(capacity, np.int8)
+        self.rows = np.full(capacity, -1, np.int64)
+        self._nextId = 0
+        self._allIds = None
+        # Derived per-row geometry (bounds, segments). Box moves patch it in place, other changes drop it.
+        self._geometry = {}
+        # Box id -> incident link ids: CSR arrays sorted by box id, plus links added since they were built.
+        self._adjacency = None
+        self._pendingAdjacency = {}
+        # Per kind (BOX, LINK): a CellIndex of the ids, and the arrays of ids added or moved since it was built.
+        self._spatial: Dict[int, Tuple[CellIndex, List[np.ndarray]]] = {}
+        self._widestLink: Optional[float] = None
+
+    def _notify(self, rects: List[QRectF], keepGeometry: bool = False):
+        if not keepGeometry:
+            self._geometry.clear()
+        self._widestLink = None
+        super()._notify(rects)
+
+    @property
+    def widestLink(self) -> float:
+        """Widest pen of any link, style overrides included; recomputed from the sparse metadata after changes."""
+        if self._widestLink is None:
+            style = LinkDrawable.style
+            self._widestLink = max([style.width] + [style.overridden(extra["style"]).width
+                                                    for i, extra in self.extraMetadata.items()
+                                                    if "style" in extra and self.kinds[i] == LINK])
+        return self._widestLink
+
+    # ------------------ ids ------------------
+
+    def _new_ids(self, n: int, ids=None) -> np.ndarray:
+        """Allocates n fresh ids, or claims the given unused ids (e.g. the ids stored in a model file)."""
+        if ids is None:
+            ids = np.arange(self._nextId, self._nextId + n, dtype=np.int64)
+        else:
+            ids = np.asarray(ids, np.int64)
+        if len(ids) == 0:
+            return ids
+        end = max(self._nextId, int(ids.max()) + 1)
+        if end > len(self.kinds):
+            capacity = max(end, 2 * len(self.kinds))
+            kinds = np.zeros(capacity, np.int8)
+            kinds[:len(self.kinds)] = self.kinds
+            rows = np.full(capacity, -1, np.int64)
+            rows[:len(self.rows)] = self.rows
+            self.kinds, self.rows = kinds, rows
+        if (self.kinds[ids] != NONE).any():
+            raise KeyError("ids already in use")
+        self._nextId = end
+        self._allIds = None
+        return ids
+
+    def _reindex_rows(self, columns: Columns, first: int = 0):
+        ids = columns["id"][first:]
+        self.rows[ids] = np.arange(first, first + len(ids))
+
+    def _name_indices(self, names) -> np.ndarray:
+        """Names as string-table indices; an integer array is taken as already interned."""
+        if isinstance(names, np.ndarray) and names.dtype.kind in "iu":
+            return names.astype(np.int32)
+        return np.fromiter((self.names.intern(n) for n in names), np.int32, len(names))
+
+    def kind_of(self, drawableId: int) -> int:
+        if 0 <= drawableId < self._nextId:
+            return int(self.kinds[drawableId])
+        return NONE
+
+    def all_ids(self) -> np.ndarray:
+        """Every live id, in z-order."""
+        if self._allIds is None:
+            self._allIds = np.sort(np.concatenate([self.boxes["id"], self.links["id"]]))
+        return self._allIds
+
+    def id_of(self, drawable: Drawable) -> int:
+        if isinstance(drawable, (BoxView, LinkView)) and drawable.model is self:
+            return drawable.id
+        raise KeyError(f"{drawable} is not a drawable of this model")
+
+    def drawable_for(self, drawableId: int) -> Drawable:
+        kind = self.kind_of(drawableId)
+        if kind == BOX:
+            return BoxView(self, drawableId)
+        if kind == LINK:
+            return LinkView(self, drawableId)
+        raise KeyError(drawableId)
+
+    @property
+    def drawables(self) -> DrawableSequence:
+        return DrawableSequence(self)
+
+    @property
+    def metamodel(self) -> MetamodelView:
+        return MetamodelView(self)
+
+    # ------------------ columns access ------------------
+
+    def box_rect(self, boxId: int) -> QRectF:
+        row = self.rows[boxId]
+        b = self.boxes
+        return QRectF(b.arrays["x"][row], b.arrays["y"][row], b.arrays["w"][row], b.arrays["h"][row])
+
+    def set_box_rect(self, boxId: int, rect: QRectF):
+        boxIds = np.array([boxId])
+        old = self._bounds_rects(boxIds)
+        rect = rect.normalized()
+        row = self.rows[boxId]
+        b = self.boxes.arrays
+        b["x"][row], b["y"][row], b["w"][row], b["h"][row] = rect.x(), rect.y(), rect.width(), rect.height()
+        self._refresh_geometry(boxIds)
+        self._notify(old + self._bounds_rects(boxIds), keepGeometry=True)
+
+    def link_endpoints(self, linkId: int) -> Tuple[int, int]:
+        row = self.rows[linkId]
+        return int(self.links.arrays["source"][row]), int(self.links.arrays["target"][row])
+
+    def _columns_of(self, drawableId: int) -> Columns:
+        kind = self.kind_of(drawableId)
+        if kind == BOX:
+            return self.boxes
+        if kind == LINK:
+            return self.links
+        raise KeyError(drawableId)
+
+    def name_of(self, drawableId: int) -> str:
+        columns = self._columns_of(drawableId)
+        return self.names[columns.arrays["name"][self.rows[drawableId]]]
+
+    def set_name(self, drawableId: int, name: str):
+        columns = self._columns_of(drawableId)
+        columns.arrays["name"][self.rows[drawableId]] = self.names.intern(name)
+        self._notify(self._bounds_rects([drawableId]), keepGeometry=True)
+
+    def set_metadata(self, drawableId: int, metadata: dict):
+        extra = {k: v for k, v in metadata.items() if k != "name"}
+        if extra:
+            self.extraMetadata[drawableId] = extra
+        else:
+            self.extraMetadata.pop(drawableId, None)
+        self.set_name(drawableId, metadata.get("name", ""))
+
+    def draw_style_of(self, drawableId: int, style: DrawStyle) -> DrawStyle:
+        """`style` with the overrides of the drawable's metadata["style"], read without building a metadata view."""
+        extra = self.extraMetadata.get(drawableId)
+        return style.overridden(extra.get("style")) if extra else style
+
+    def styles_of(self, ids: np.ndarray) -> List[Optional[dict]]:
+        extraMetadata = self.extraMetadata
+        return [extraMetadata.get(i, {}).get("style") for i in np.asarray(ids).tolist()]
+
+    def set_styles(self, ids: np.ndarray, styles: Iterable[Optional[dict]]):
+        ids = np.asarray(ids, np.int64)
+        if ((self.kinds[ids] != BOX) & (self.kinds[ids] != LINK)).any():
+            raise KeyError("ids must be boxes or links of this model")
+        extraMetadata = self.extraMetadata
+        for drawableId, style in zip(ids.tolist(), styles):
+            if style:
+                extraMetadata.setdefault(drawableId, {})["style"] = dict(style)
+            else:
+                extra = extraMetadata.get(drawableId)
+                if extra is not None:
+                    extra.pop("style", None)
+                    if not extra:
+                        del extraMetadata[drawableId]
+        self._notify(self._bounds_rects(ids), keepGeometry=True)
+
+    # ------------------ vectorized geometry ------------------
+
+    def box_bounds(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(left, top, right, bottom) of every box row."""
+        bounds = self._geometry.get("box_bounds")
+        if bounds is None:
+            b = self.boxes
+            x, y = b["x"], b["y"]
+            bounds = self._geometry["box_bounds"] = (x.copy(), y.copy(), x + b["w"], y + b["h"])
+        return bounds
+
+    def link_segments(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(x1, y1, x2, y2) center-to-center segment of every link row."""
+        segments = self._geometry.get("link_segments")
+        if segments is None:
+            b = self.boxes
+            cx = b["x"] + b["w"] / 2
+            cy = b["y"] + b["h"] / 2
+            source = self.rows[self.links["source"]]
+            target = self.rows[self.links["target"]]
+            segments = self._geometry["link_segments"] = (cx[source], cy[source], cx[target], cy[target])
+        return segments
+
+    def link_bounds(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        bounds = self._geometry.get("link_bounds")
+        if bounds is None:
+            x1, y1, x2, y2 = self.link_segments()
+            bounds = self._geometry["link_bounds"] = (np.minimum(x1, x2), np.minimum(y1, y2),
+                                                      np.maximum(x1, x2), np.maximum(y1, y2))
+        return bounds
+
+    @staticmethod
+    def _in_rect(bounds, rect: QRectF) -> np.ndarray:
+        rect = rect.normalized()
+        left, top, right, bottom = bounds
+        return (left <= rect.right()) & (right >= rect.left()) & (top <= rect.bottom()) & (bottom >= rect.top())
+
+    def _spatial_index(self, kind: int) -> Tuple[CellIndex, List[np.ndarray]]:
+        entry = self._spatial.get(kind)
+        if entry is None:
+            index = CellIndex()
+            if kind == BOX:
+                index.build(self.boxes["id"], self.box_bounds())
+            else:
+                index.build(self.links["id"], self.link_bounds(), self.link_segments())
+            entry = self._spatial[kind] = (index, [])
+        return entry
+
+    def _mark_spatial(self, kind: int, ids: np.ndarray):
+        """Flags ids whose geometry the cell index no longer matches; too many of them drop the index."""
+        entry = self._spatial.get(kind)
+        if entry is None or not len(ids):
+            return
+        pending = entry[1]
+        pending.append(np.asarray(ids, np.int64))
+        columns = self.boxes if kind == BOX else self.links
+        if sum(len(p) for p in pending) > max(SPATIAL_MIN_PENDING, len(columns) // SPATIAL_PENDING_DIVISOR):
+            del self._spatial[kind]
+
+    def _candidate_rows(self, kind: int, left: float, top: float, right: float, bottom: float) -> np.ndarray:
+        """Sorted rows of the boxes or links that may intersect the rect: index hits plus ids added or moved since."""
+        index, pending = self._spatial_index(kind)
+        ids = index.query_rect(left, top, right, bottom)
+        if pending:
+            if len(pending) > 1:
+                pending[:] = [np.unique(np.concatenate(pending))]
+            ids = np.union1d(ids, pending[0])
+        # Removed ids stay in the index until it is rebuilt.
+        ids = ids[self.kinds[ids] == kind]
+        return np.sort(self.rows[ids])
+
+    def _rows_in_rect(self, kind: int, rect: QRectF) -> np.ndarray:
+        rect = rect.normalized()
+        rows = self._candidate_rows(kind, rect.left(), rect.top(), rect.right(), rect.bottom())
+        bounds = self.box_bounds() if kind == BOX else self.link_bounds()
+        return rows[self._in_rect([b[rows] for b in bounds], rect)]
+
+    def box_ids_in_rect(self, rect: QRectF) -> np.ndarray:
+        return self.boxes["id"][self._rows_in_rect(BOX, rect)]
+
+    def link_ids_in_rect(self, rect: QRectF) -> np.ndarray:
+        return self.links["id"][self._rows_in_rect(LINK, rect)]
+
+    def box_ids_at(self, point: QPointF) -> np.ndarray:
+        x, y = point.x(), point.y()
+        rows = self._candidate_rows(BOX, x, y, x, y)
+        left, top, right, bottom = (b[rows] for b in self.box_bounds())
+        return self.boxes["id"][rows[(left <= x) & (x <= right) & (top <= y) & (y <= bottom)]]
+
+    def existing_ids(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, np.int64)
+        valid = (ids >= 0) & (ids < self._nextId)
+        valid[valid] = self.kinds[ids[valid]] != NONE
+        return ids[valid]
+
+    def ids_in_rect(self, rect: QRectF, contained: bool = False) -> np.ndarray:
+        if not contained:
+            return np.sort(np.concatenate([self.box_ids_in_rect(rect), self.link_ids_in_rect(rect)]))
+        rect = rect.normalized()
+        found = []
+        for kind, columns, bounds in ((BOX, self.boxes, self.box_bounds()), (LINK, self.links, self.link_bounds())):
+            rows = self._rows_in_rect(kind, rect)
+            left, top, right, bottom = (b[rows] for b in bounds)
+            found.append(columns["id"][rows[(left >= rect.left()) & (right <= rect.right())
+                                            & (top >= rect.top()) & (bottom <= rect.bottom())]])
+        return np.sort(np.concatenate(found))
+
+    def ids_where(self, predicate: Callable[[Drawable], bool]) -> np.ndarray:
+        """Ids of the drawables whose view matches a predicate; see box_ids_where for the vectorized form."""
+        return np.array([i for i in self.all_ids().tolist() if predicate(self.drawable_for(i))], np.int64)
+
+    def box_ids_where(self, condition: Callable[[Columns], np.ndarray]) -> np.ndarray:
+        """
+        Vectorized predicate selection: `condition` maps the box columns to a boolean mask,
+        e.g. `lambda boxes: boxes["w"] > 100`. Returns the matching box ids, sorted.
+        """
+        return np.sort(self.boxes["id"][condition(self.boxes)])
+
+    def bounds_of(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, np.int64)
+        kinds = self.kinds[ids]
+        rows = self.rows[ids]
+        result = np.empty((len(ids), 4), np.float64)
+        for kind, bounds in ((BOX, self.box_bounds()), (LINK, self.link_bounds())):
+            mask = kinds == kind
+            for column, array in enumerate(bounds):
+                result[mask, column] = array[rows[mask]]
+        return result
+
+    def bounding_rect(self, boxIds: np.ndarray = None) -> QRectF:
+        """Bounds of the given boxes (all boxes by default)."""
+        left, top, right, bottom = self.box_bounds()
+        if boxIds is not None:
+            rows = self.rows[boxIds]
+            left, top, right, bottom = left[rows], top[rows], right[rows], bottom[rows]
+        if len(left) == 0:
+            return QRectF()
+        return QRectF(QPointF(left.min(), top.min()), QPointF(right.max(), bottom.max()))
+
+    # ------------------ adjacency ------------------
+
+    def _build_adjacency(self):
+        linkIds = self.links["id"]
+        endpoints = np.concatenate([self.links["source"], self.links["target"]])
+        order = np.argsort(endpoints, kind="stable")
+        self._adjacency = (endpoints[order], np.concatenate([linkIds, linkIds])[order])
+        self._pendingAdjacency = {}
+
+    def incident_link_ids(self, boxIds: np.ndarray) -> np.ndarray:
+        """Ids of the links attached to any of the boxes, in O(log n + degree) per box."""
+        if self._adjacency is None:
+            self._build_adjacency()
+        keys, values = self._adjacency
+        boxIds = np.asarray(boxIds, np.int64)
+        lo = np.searchsorted(keys, boxIds, "left")
+        hi = np.searchsorted(keys, boxIds, "right")
+        lengths = hi - lo
+        # Gather every values[lo[i]:hi[i]] range at once.
+        starts = np.repeat(lo - (np.cumsum(lengths) - lengths), lengths)
+        found = [values[starts + np.arange(lengths.sum())]]
+        if self._pendingAdjacency:
+            for boxId in boxIds.tolist():
+                pending = self._pendingAdjacency.get(boxId)
+                if pending:
+                    found.append(np.array(pending, np.int64))
+        return np.unique(np.concatenate(found))
+
+    def links_of(self, box: BoxDrawable) -> List[LinkDrawable]:
+        return self._views(self.incident_link_ids(np.array([self.id_of(box)])))
+
+    def _refresh_geometry(self, boxIds: np.ndarray):
+        """Patches the cached geometry of moved boxes and their links instead of recomputing every row."""
+        self._mark_spatial(BOX, boxIds)
+        if LINK in self._spatial:
+            self._mark_spatial(LINK, self.incident_link_ids(boxIds))
+        rows = self.rows[boxIds]
+        b = self.boxes
+        bounds = self._geometry.get("box_bounds")
+        if bounds is not None:
+            x, y = b["x"][rows], b["y"][rows]
+            bounds[0][rows], bounds[1][rows] = x, y
+            bounds[2][rows], bounds[3][rows] = x + b["w"][rows], y + b["h"][rows]
+        segments = self._geometry.get("link_segments")
+        if segments is None:
+            self._geometry.pop("link_bounds", None)
+            return
+        linkRows = self.rows[self.incident_link_ids(boxIds)]
+        source = self.rows[self.links["source"][linkRows]]
+        target = self.rows[self.links["target"][linkRows]]
+        x1, y1, x2, y2 = segments
+        x1[linkRows] = b["x"][source] + b["w"][source] / 2
+        y1[linkRows] = b["y"][source] + b["h"][source] / 2
+        x2[linkRows] = b["x"][target] + b["w"][target] / 2
+        y2[linkRows] = b["y"][target] + b["h"][target] / 2
+        bounds = self._geometry.get("link_bounds")
+        if bounds is not None:
+            bounds[0][linkRows] = np.minimum(x1[linkRows], x2[linkRows])
+            bounds[1][linkRows] = np.minimum(y1[linkRows], y2[linkRows])
+            bounds[2][linkRows] = np.maximum(x1[linkRows], x2[linkRows])
+            bounds[3][linkRows] = np.maximum(y1[linkRows], y2[linkRows])
+
+    def _bounds_rects(self, ids: Iterable[int]) -> List[QRectF]:
+        """Model rects covering the given drawables and the links attached to the boxes among them."""
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, dtype=np.int64)
+        boxIds = ids[self.kinds[ids] == BOX]
+        linkIds = ids[self.kinds[ids] == LINK]
+        if len(boxIds):
+            linkIds = np.union1d(linkIds, self.incident_link_ids(boxIds))
+        boxRows = self.rows[boxIds]
+        linkRows = self.rows[linkIds]
+        bounds = [np.concatenate([b[boxRows], l[linkRows]])
+                  for b, l in zip(self.box_bounds(), self.link_bounds())]
+        if len(bounds[0]) == 0:
+            return []
+        if len(bounds[0]) > MAX_NOTIFIED_RECTS:
+            return [QRectF(QPointF(bounds[0].min(), bounds[1].min()), QPointF(bounds[2].max(), bounds[3].max()))]
+        return [QRectF(QPointF(l, t), QPointF(r, b)) for l, t, r, b in zip(*(a.tolist() for a in bounds))]
+
+    # ------------------ mutations ------------------
+
+    def add_boxes(self, x, y, w, h, names, ids=None) -> np.ndarray:
+        """
+        Bulk insert of boxes from columns, with a single change notification; returns their ids.
+        `names` are strings or string-table indices; `ids` reuses stored ids instead of allocating new ones.
+        """
+        ids = self._new_ids(len(names), ids)
+        first = self.boxes.extend(id=ids, x=x, y=y, w=w, h=h, name=self._name_indices(names))
+        self.kinds[ids] = BOX
+        self._reindex_rows(self.boxes, first)
+        self._mark_spatial(BOX, ids)
+        # Cached geometry has no rows for the new boxes yet.
+        self._geometry.clear()
+        self._notify(self._bounds_rects(ids))
+        return ids
+
+    def add_links(self, sources, targets, names, ids=None) -> np.ndarray:
+        """Bulk insert of links between existing box ids, with a single change notification; returns their ids."""
+        sources = np.asarray(sources, np.int64)
+        targets = np.asarray(targets, np.int64)
+        if len(sources) and not ((self.kinds[sources] == BOX).all() and (self.kinds[targets] == BOX).all()):
+            raise KeyError("link endpoints must be boxes of this model")
+        ids = self._new_ids(len(names), ids)
+        first = self.links.extend(id=ids, source=sources, target=targets, name=self._name_indices(names))
+        self.kinds[ids] = LINK
+        self._reindex_rows(self.links, first)
+        self._mark_spatial(LINK, ids)
+        if self._adjacency is not None:
+            if len(ids) > MAX_NOTIFIED_RECTS:
+                self._adjacency = None
+            else:
+                for linkId, source, target in zip(ids.tolist(), sources.tolist(), targets.tolist()):
+                    self._pendingAdjacency.setdefault(source, []).append(linkId)
+                    self._pendingAdjacency.setdefault(target, []).append(linkId)
+        self._geometry.clear()
+        self._notify(self._bounds_rects(ids))
+        return ids
+
+    def add_drawable(self, drawable: Drawable):
+        if isinstance(drawable, BoxDrawable):
+            rect = drawable.rect.normalized()
+            metadata = dict(drawable.metadata)
+            ids = self.add_boxes([rect.x()], [rect.y()], [rect.width()], [rect.height()],
+                                 [metadata.pop("name", "")])
+        elif isinstance(drawable, LinkDrawable):
+            metadata = dict(drawable.metadata)
+            ids = self.add_links([self.id_of(drawable.box1)], [self.id_of(drawable.box2)],
+                                 [metadata.pop("name", "")])
+        else:
+            raise TypeError(f"{type(drawable).__name__} cannot be stored in a columnar model")
+        if metadata:
+            self.extraMetadata[int(ids[0])] = metadata
+        return self.drawable_for(int(ids[0]))
+
+    def add_drawables(self, drawables: List[Drawable], ids: List[int] = None) -> List[Drawable]:
+        """
+        Bulk insert of drawable objects, with one add_boxes and one add_links; returns their views.
+        Links may join boxes of the same batch. Ids are allocated in batch order, which keeps its z-order.
+        """
+        if ids is None:
+            ids = range(self._nextId, self._nextId + len(drawables))
+        ids = [int(i) for i in ids]
+        created = {drawable: drawableId for drawableId, drawable in zip(ids, drawables)
+                   if isinstance(drawable, BoxDrawable)}
+        boxIds, boxes, linkIds, links = [], [], [], []
+        extra = {}
+        for drawableId, drawable in zip(ids, drawables):
+            metadata = dict(drawable.metadata)
+            name = metadata.pop("name", "")
+            if isinstance(drawable, BoxDrawable):
+                r = drawable.rect.normalized()
+                boxIds.append(drawableId)
+                boxes.append((r.x(), r.y(), r.width(), r.height(), name))
+            elif isinstance(drawable, LinkDrawable):
+                ends = [created[box] if box in created else self.id_of(box) for box in (drawable.box1, drawable.box2)]
+                linkIds.append(drawableId)
+                links.append((*ends, name))
+            else:
+                raise TypeError(f"{type(drawable).__name__} cannot be stored in a columnar model")
+            if metadata:
+                extra[drawableId] = metadata
+        if boxes:
+            x, y, w, h, names = zip(*boxes)
+            self.add_boxes(x, y, w, h, list(names), ids=np.array(boxIds, np.int64))
+        if links:
+            sources, targets, names = zip(*links)
+            self.add_links(sources, targets, list(names), ids=np.array(linkIds, np.int64))
+        self.extraMetadata.update(extra)
+        return [self.drawable_for(i) for i in ids]
+
+    def remove_ids(self, ids: np.ndarray):
+        """Removes drawables by id in one pass; links attached to removed boxes go too, and unknown ids are skipped."""
+        ids = self.existing_ids(ids)
+        if not len(ids):
+            return
+        boxIds = ids[self.kinds[ids] == BOX]
+        rects = self._bounds_rects(ids)
+        linkIds = ids[self.kinds[ids] == LINK]
+        if len(boxIds):
+            linkIds = np.union1d(linkIds, self.incident_link_ids(boxIds))
+        linkMask = np.isin(self.links["id"], linkIds)
+        removed = np.concatenate([boxIds, self.links["id"][linkMask]])
+        self.boxes.compact(~np.isin(self.boxes["id"], boxIds))
+        self.links.compact(~linkMask)
+        self.kinds[removed] = NONE
+        self.rows[removed] = -1
+        # Removed ids only count towards rebuilding the cell indexes; queries skip them.
+        self._mark_spatial(BOX, boxIds)
+        self._mark_spatial(LINK, removed[len(boxIds):])
+        self._reindex_rows(self.boxes)
+        self._reindex_rows(self.links)
+        for drawableId in removed.tolist():
+            self.extraMetadata.pop(drawableId, None)
+        self._allIds = None
+        self._adjacency = None
+        self._notify(rects)
+
+    def remove_drawable(self, drawable: Drawable):
+        self.remove_ids(np.array([self.id_of(drawable)]))
+
+    def translate_boxes(self, boxIds: np.ndarray, dx: float, dy: float):
+        """Moves many boxes at once; their links follow since they are stored as box ids."""
+        boxIds = np.asarray(boxIds, np.int64)
+        old = self._bounds_rects(boxIds)
+        rows = self.rows[boxIds]
+        self.boxes.arrays["x"][rows] += dx
+        self.boxes.arrays["y"][rows] += dy
+        self._refresh_geometry(boxIds)
+        self._notify(old + self._bounds_rects(boxIds), keepGeometry=True)
+
+    def set_box_positions(self, boxIds: np.ndarray, positions: np.ndarray):
+        boxIds = np.asarray(boxIds, np.int64)
+        if not len(boxIds):
+            return
+        positions = np.asarray(positions, np.float64)
+        old = self._bounds_rects(boxIds)
+        rows = self.rows[boxIds]
+        self.boxes.arrays["x"][rows] = positions[:, 0]
+        self.boxes.arrays["y"][rows] = positions[:, 1]
+        self._refresh_geometry(boxIds)
+        self._notify(old + self._bounds_rects(boxIds), keepGeometry=True)
+
+    def box_graph(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        b = self.boxes
+        order = np.argsort(b["id"], kind="stable")
+        geometry = np.stack([b["x"][order], b["y"][order], b["w"][order], b["h"][order]], axis=1)
+        # Index of each box row in the sorted ids.
+        rank = np.empty(len(order), np.int64)
+        rank[order] = np.arange(len(order))
+        l = self.links
+        edges = np.stack([rank[self.rows[l["source"]]], rank[self.rows[l["target"]]]], axis=1)
+        return b["id"][order], geometry, edges
+
+    def translate_ids(self, ids: np.ndarray, dx: float, dy: float):
+        ids = np.asarray(ids, np.int64)
+        self.translate_boxes(ids[self.kinds[ids] == BOX], dx, dy)
+
+    def records_for(self, ids: np.ndarray) -> ModelRecords:
+        ids = np.unique(np.asarray(ids, np.int64))
+        boxIds = ids[self.kinds[ids] == BOX]
+        linkIds = ids[self.kinds[ids] == LINK]
+        if len(ids) != len(boxIds) + len(linkIds):
+            raise KeyError("ids must be boxes or links of this model")
+        b, l = self.boxes.arrays, self.links.arrays
+        boxRows, linkRows = self.rows[boxIds], self.rows[linkIds]
+        geometry = np.stack([b["x"][boxRows], b["y"][boxRows], b["w"][boxRows], b["h"][boxRows]], axis=1)
+        ends = np.stack([l["source"][linkRows], l["target"][linkRows]], axis=1)
+        strings = self.names.strings
+        names = [strings[i] for i in np.concatenate([b["name"][boxRows], l["name"][linkRows]]).tolist()]
+        extra = {i: dict(self.extraMetadata[i]) for i in ids.tolist() if i in self.extraMetadata}
+        return ModelRecords(boxIds, geometry, linkIds, ends, names, extra)
+
+    def positions_of(self, ids: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.all_ids(), np.asarray(ids, np.int64))
+
+    def insert_records(self, records: ModelRecords, positions: np.ndarray = None):
+        # Drawables are ordered by id here, so the restored ids already land at their positions.
+        n = len(records.boxIds)
+        g = records.boxGeometry
+        if n:
+            self.add_boxes(g[:, 0], g[:, 1], g[:, 2], g[:, 3], records.names[:n], ids=records.boxIds)
+        if len(records.linkIds):
+            self.add_links(records.linkEnds[:, 0], records.linkEnds[:, 1], records.names[n:], ids=records.linkIds)
+        for drawableId, metadata in records.extra.items():
+            self.extraMetadata[drawableId] = dict(metadata)
+
+    def update_drawable(self, drawable: Drawable):
+        # Views write through to the columns and notify on every change, so cached geometry is current.
+        self._notify(self._bounds_rects([self.id_of(drawable)]), keepGeometry=True)
+
+    def move_drawable(self, drawable: Drawable, dx: float, dy: float):
+        self.translate_boxes(np.array([self.id_of(drawable)]), dx, dy)
+
+    # ------------------ queries ------------------
+
+    def _views(self, ids: np.ndarray) -> List[Drawable]:
+        return [self.drawable_for(i) for i in np.sort(ids).tolist()]
+
+    def link_ids_at(self, point: QPointF, tolerance: float = 0.0) -> np.ndarray:
+        """Links within `tolerance` (at least half their pen width) of the point, by vectorized segment distance."""
+        style = LinkDrawable.style
+        x, y = point.x(), point.y()
+        # Links are only found within the half width of the widest pen, with style overrides.
+        m = max(tolerance, self.widestLink / 2)
+        candidates = self._candidate_rows(LINK, x - m, y - m, x + m, y + m)
+        x1, y1, x2, y2 = (a[candidates] for a in self.link_segments())
+        ids = self.links["id"][candidates]
+        t = max(tolerance, style.width / 2)
+        if m > t:
+            t = np.maximum(tolerance, [self.draw_style_of(i, style).width / 2 for i in ids.tolist()])
+        return ids[point_segment_distance(x, y, x1, y1, x2, y2) <= t]
+
+    def query_point(self, point: QPointF, tolerance: float = 0.0) -> List[Drawable]:
+        return self._views(np.concatenate([self.box_ids_at(point), self.link_ids_at(point, tolerance)]))
+
+    def query_rect(self, rect: QRectF) -> List[Drawable]:
+        return self._views(np.concatenate([self.box_ids_in_rect(rect), self.link_ids_in_rect(rect)]))
+
+    def query_rect_lod(self, rect: QRectF, minExtent: float, pixelSize: float) -> Tuple[List[Drawable], List[QPointF]]:
+        big = []
+        centers = []
+        for kind, columns, bounds in ((BOX, self.boxes, self.box_bounds()), (LINK, self.links, self.link_bounds())):
+            rows = self._rows_in_rect(kind, rect)
+            left, top, right, bottom = (b[rows] for b in bounds)
+            small = np.maximum(right - left, bottom - top) < minExtent
+            big.append(columns["id"][rows[~small]])
+            centers.append(np.stack([(left[small] + right[small]) / 2, (top[small] + bottom[small]) / 2], axis=1))
+        centers = np.concatenate(centers)
+        # Keep one point per pixel cell.
+        _, first = np.unique(np.floor(centers / pixelSize), axis=0, return_index=True)
+        points = [QPointF(x, y) for x, y in centers[first].tolist()]
+        return self._views(np.concatenate(big)), points
@@ -1,36 +1,104 @@
-from PySide6.QtCore import QPointF, QRectF, Qt
-from PySide6.QtGui import QPainter, QPen, QColor
+from typing import Optional
+
+from PySide6.QtCore import QPointF, QRectF, QLineF, Qt
+from PySide6.QtGui import QPainter
+
+from RenderBatch import RenderBatch, DrawStyle
+from geometry import point_segment_distance
+
+# Shared results of BoxDrawable.update_preview, so preview updates do not allocate.
+_ORIGIN = QPointF(0.0, 0.0)
+_NO_MESSAGES = []
+_BOX_START_TYPING = ["start typing the box name then hit ENTER."]
+_BOX_ENTER_NAME = ["enter the box name"]
+
+
+def batch_for(canvas) -> RenderBatch:
+    """A render batch using the canvas' current scale and level-of-detail settings."""
+    batch = RenderBatch(getattr(canvas, "scale", 1.0), getattr(canvas, "lodTextMinPixels", 0.0))
+    router = getattr(canvas, "router", None)
+    if router is not None:
+        batch.routeOf = router.route_of
+    return batch
 
 
 class Drawable:
     def draw(self, painter: QPainter, model, canvas):
         raise NotImplementedError
 
+    def batch(self, batch: RenderBatch) -> bool:
+        """
+        Adds this drawable's geometry to a style-grouped render batch.
+        Returns False when unsupported, in which case the renderer falls back to draw().
+        """
+        return False
+
     def contains(self, point: QPointF) -> bool:
         raise NotImplementedError
 
+    def draw_style(self) -> DrawStyle:
+        """The class `style` with the overrides of metadata["style"] (e.g. {"color": "red", "width": 3}), if any."""
+        return self.style.overridden(self.metadata.get("style"))
+
+    def boundingRect(self) -> QRectF:
+        """Model-space bounds used by the spatial index."""
+        raise NotImplementedError
+
+    def segments(self) -> Optional[list]:
+        """
+        (x1, y1, x2, y2) line segments the spatial index registers the drawable along, instead of every
+        cell of its bounds; None for area drawables.
+        """
+        return None
+
+    def translate(self, dx: float, dy: float):
+        """Moves the drawable by (dx, dy) in model coordinates."""
+        pass
+
     @staticmethod
     def build(inputs: list)  -> (list,'Drawable'):
         raise NotImplementedError
 
+    @staticmethod
+    def update_preview(preview: 'Drawable', inputs: list, lastInput) -> Optional[list]:
+        """
+        Incremental builder protocol: applies `lastInput` (appended to `inputs`) to a preview previously
+        returned by build(), in place, and returns the messages build() would return.
+        Returns None when the preview cannot be updated incrementally; the tool then falls back to build().
+        """
+        return None
+
 
 class BoxDrawable(Drawable):
+    style = DrawStyle("black", 2)
+
     def __init__(self, rect: QRectF, metadata: dict):
         self.rect = rect
         self.metadata = metadata
 
     def draw(self, painter, model, canvas):
-        pen = QPen(QColor("black"))
-        pen.setWidth(2)
-        painter.setPen(pen)
-        painter.drawRect(self.rect)
-        # Optionally draw the box name.
-        painter.drawText(self.rect, Qt.AlignLeft & Qt.AlignTop, self.metadata.get("name", ""))
-        pass
+        batch = batch_for(canvas)
+        self.batch(batch)
+        batch.flush(painter)
+
+    def batch(self, batch: RenderBatch) -> bool:
+        style = self.draw_style()
+        batch.add_rect(style, self.rect)
+        # Skip the label when it would be unreadable at the current zoom; wide enough boxes elide it.
+        if min(self.rect.width(), self.rect.height()) * batch.scale >= batch.lodTextMinPixels:
+            # Optionally draw the box name.
+            batch.add_text(style, self.rect, Qt.AlignLeft | Qt.AlignTop, self.metadata.get("name", ""))
+        return True
 
     def contains(self, point: QPointF) -> bool:
         return self.rect.contains(point)
 
+    def boundingRect(self) -> QRectF:
+        return self.rect
+
+    def translate(self, dx: float, dy: float):
+        self.rect.translate(dx, dy)
+
     @staticmethod
     def build(_inputs: list) -> (list,Drawable):
         """
@@ -58,27 +126,72 @@ class BoxDrawable(Drawable):
             box.metadata["name"] = inputs[1] if isinstance(inputs[1],str) else final_inputs[1]
             return [] if inputs[1] is not None else ["enter the box name"], box
 
+    @staticmethod
+    def update_preview(preview: Drawable, inputs: list, lastInput) -> Optional[list]:
+        """Same rules as build(), applied to the preview's rect and metadata without allocating a new box."""
+        if type(preview) is not BoxDrawable:
+            return None
+        anchor = None
+        name = None
+        for x in inputs:
+            if anchor is None and isinstance(x, QPointF):
+                anchor = x
+            elif name is None and isinstance(x, str):
+                name = x
+        if anchor is None:
+            anchor = lastInput if isinstance(lastInput, QPointF) else _ORIGIN
+        if name is None and isinstance(lastInput, str):
+            name = lastInput
+        preview.rect.setRect(anchor.x(), anchor.y(), 150.0, 50.0)
+        if len(inputs) == 0:
+            preview.metadata["name"] = name
+            return _BOX_START_TYPING
+        preview.metadata["name"] = name if name is not None else "Box"
+        return _NO_MESSAGES if name is not None else _BOX_ENTER_NAME
 
     def __str__(self):
         return f"""Box:{{position:[{self.rect.bottomLeft().x():.02f},{self.rect.bottomLeft().y():.02f}],name:{self.metadata["name"]} }}"""
 
 
 class LinkDrawable(Drawable):
-    def __init__(self, box1: BoxDrawable, box2: BoxDrawable):
+    style = DrawStyle("blue", 2)
+
+    def __init__(self, box1: BoxDrawable, box2: BoxDrawable, metadata: dict = None):
         self.box1 = box1
         self.box2 = box2
+        self.metadata = metadata if metadata is not None else {}
 
     def draw(self, painter: QPainter, model, canvas):
-        pen = QPen(QColor("blue"))
-        pen.setWidth(2)
-        painter.setPen(pen)
+        batch = batch_for(canvas)
+        self.batch(batch)
+        batch.flush(painter)
+
+    def batch(self, batch: RenderBatch) -> bool:
+        route = batch.route_of(self)
+        if route:
+            batch.add_polyline(self.draw_style(), route)
+        else:
+            batch.add_line(self.draw_style(), QLineF(self.box1.rect.center(), self.box2.rect.center()))
+        return True
+
+    def contains(self, point: QPointF, tolerance: float = 0.0, route: Optional[list] = None) -> bool:
+        """
+        True when the point is within `tolerance` (at least half the pen width) of the link line or,
+        when given, of `route`, the polyline the link is drawn along (see LinkRouter).
+        """
+        if not route:
+            route = [self.box1.rect.center(), self.box2.rect.center()]
+        x, y = point.x(), point.y()
+        distance = min(point_segment_distance(x, y, p1.x(), p1.y(), p2.x(), p2.y()) for p1, p2 in zip(route, route[1:]))
+        return distance <= max(tolerance, self.draw_style().width / 2)
+
+    def boundingRect(self) -> QRectF:
+        return QRectF(self.box1.rect.center(), self.box2.rect.center()).normalized()
+
+    def segments(self) -> list:
         p1 = self.box1.rect.center()
         p2 = self.box2.rect.center()
-        painter.drawLine(p1, p2)
-
-    def contains(self, point: QPointF) -> bool:
-        # For simplicity, we return False for link hit testing.
-        return False
+        return [(p1.x(), p1.y(), p2.x(), p2.y())]
 
     @staticmethod
     def build(inputs: list) -> (list,Drawable):
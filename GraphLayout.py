@@ -0,0 +1,370 @@
+import math
+import threading
+import time
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PySide6.QtCore import QCoreApplication, QEvent, QObject, QRunnable, QThreadPool, Signal
+
+from ModelDrawable import ModelDrawable
+
+# Below this many boxes, repulsion is computed exactly between every pair.
+EXACT_MAX = 256
+# Finest quadtree level, i.e. at most 4**MAX_LEVEL leaf cells.
+MAX_LEVEL = 10
+# Targets processed at once by the far-field pass, bounding its (targets, 36) temporaries.
+CHUNK = 32768
+
+# The 6x6 block of cells covered by the children of a cell's parent and of the parent's neighbours.
+_BLOCK_X, _BLOCK_Y = (a.ravel() for a in np.meshgrid(np.arange(6), np.arange(6), indexing="ij"))
+
+
+class LayoutGraph(NamedTuple):
+    """Snapshot of the box graph: sorted box ids, (n, 2) centers and sizes, (m, 2) links as box indices."""
+    ids: np.ndarray
+    centers: np.ndarray
+    sizes: np.ndarray
+    edges: np.ndarray
+
+    def top_lefts(self, centers: np.ndarray) -> np.ndarray:
+        return centers - self.sizes / 2
+
+
+def layout_graph(model: ModelDrawable) -> LayoutGraph:
+    ids, geometry, edges = model.box_graph()
+    sizes = geometry[:, 2:]
+    return LayoutGraph(ids, geometry[:, :2] + sizes / 2, sizes, edges)
+
+
+def neighborhood(edges: np.ndarray, n: int, seeds: np.ndarray, hops: int) -> np.ndarray:
+    """Mask of the boxes at most `hops` links away from the seed boxes (indices)."""
+    mask = np.zeros(n, bool)
+    mask[seeds] = True
+    source, target = edges[:, 0], edges[:, 1]
+    for _ in range(hops):
+        grown = mask.copy()
+        grown[target[mask[source]]] = True
+        grown[source[mask[target]]] = True
+        if np.array_equal(grown, mask):
+            break
+        mask = grown
+    return mask
+
+
+def repulsion(positions: np.ndarray, targets: np.ndarray, leafSize: int = 4) -> np.ndarray:
+    """
+    Sum over every other box of (p_target - p) / |p_target - p|², for each target index.
+
+    Barnes-Hut style approximation: boxes are binned in a quadtree built level by level with
+    np.bincount. At each level a target interacts with the centroids of the cells that are children
+    of its parent's neighbours but not neighbours of its own cell, and at the finest level with the
+    boxes of its neighbouring cells exactly. Every level is one vectorized pass over the targets.
+    """
+    n = len(positions)
+    forces = np.zeros((len(targets), 2))
+    if n < 2 or not len(targets):
+        return forces
+    if n <= EXACT_MAX:
+        d = positions[targets][:, None, :] - positions[None, :, :]
+        r2 = (d * d).sum(axis=2)
+        # Drops the target itself, and coincident boxes, which have no direction to push in.
+        r2[r2 == 0] = np.inf
+        return (d / r2[:, :, None]).sum(axis=1)
+
+    lo = positions.min(axis=0)
+    span = float((positions.max(axis=0) - lo).max()) or 1.0
+    # Leaf level: about `leafSize` boxes per cell, deeper where boxes cluster so that the exact
+    # near-field pairs (about the sum of squared cell counts) stay linear in the box count.
+    levels = int(np.clip(math.ceil(math.log(n / leafSize, 4)), 2, MAX_LEVEL))
+    while True:
+        side = 1 << levels
+        cells = np.minimum(((positions - lo) * (side / span)).astype(np.int64), side - 1)
+        count = np.bincount(cells[:, 0] * side + cells[:, 1], minlength=side * side)
+        if levels == MAX_LEVEL or float(np.dot(count, count)) <= 2 * leafSize * n:
+            break
+        levels += 1
+
+    # Far field: cell masses and centroids per level.
+    tree = []
+    for level in range(2, levels + 1):
+        g = 1 << level
+        key = (cells[:, 0] >> (levels - level)) * g + (cells[:, 1] >> (levels - level))
+        mass = np.bincount(key, minlength=g * g).astype(np.float64)
+        occupied = np.maximum(mass, 1)
+        tree.append((level, mass, np.bincount(key, positions[:, 0], g * g) / occupied,
+                     np.bincount(key, positions[:, 1], g * g) / occupied))
+    for begin in range(0, len(targets), CHUNK):
+        chunk = targets[begin:begin + CHUNK]
+        p = positions[chunk]
+        for level, mass, cx, cy in tree:
+            g = 1 << level
+            t = cells[chunk] >> (levels - level)
+            nx = ((t[:, 0:1] >> 1) * 2 - 2) + _BLOCK_X
+            ny = ((t[:, 1:2] >> 1) * 2 - 2) + _BLOCK_Y
+            valid = ((nx >= 0) & (nx < g) & (ny >= 0) & (ny < g)
+                     & ((np.abs(nx - t[:, 0:1]) > 1) | (np.abs(ny - t[:, 1:2]) > 1)))
+            cell = np.where(valid, nx * g + ny, 0)
+            dx = p[:, 0:1] - cx[cell]
+            dy = p[:, 1:2] - cy[cell]
+            w = np.where(valid, mass[cell], 0.0) / np.maximum(dx * dx + dy * dy, 1e-9)
+            forces[begin:begin + len(chunk), 0] += (w * dx).sum(axis=1)
+            forces[begin:begin + len(chunk), 1] += (w * dy).sum(axis=1)
+
+    # Near field: exact pairs with the boxes of the 3x3 neighbouring leaf cells.
+    key = cells[:, 0] * side + cells[:, 1]
+    order = np.argsort(key, kind="stable")
+    start = np.cumsum(count) - count
+    tc = cells[targets]
+    pairTargets, pairSources = [], []
+    for ox in (-1, 0, 1):
+        for oy in (-1, 0, 1):
+            nx, ny = tc[:, 0] + ox, tc[:, 1] + oy
+            ti = np.nonzero((nx >= 0) & (nx < side) & (ny >= 0) & (ny < side))[0]
+            cellKey = nx[ti] * side + ny[ti]
+            cellCount = count[cellKey]
+            total = int(cellCount.sum())
+            within = np.arange(total) - np.repeat(np.cumsum(cellCount) - cellCount, cellCount)
+            pairTargets.append(np.repeat(ti, cellCount))
+            pairSources.append(order[np.repeat(start[cellKey], cellCount) + within])
+    ti = np.concatenate(pairTargets)
+    d = positions[targets[ti]] - positions[np.concatenate(pairSources)]
+    r2 = (d * d).sum(axis=1)
+    w = np.divide(1.0, r2, out=np.zeros_like(r2), where=r2 > 0)
+    forces[:, 0] += np.bincount(ti, w * d[:, 0], len(targets))
+    forces[:, 1] += np.bincount(ti, w * d[:, 1], len(targets))
+    return forces
+
+
+class ForceLayout:
+    """
+    Force-directed layout (Fruchterman-Reingold) of the box graph, vectorized with NumPy: boxes repel
+    each other with k²/d (approximated, see repulsion), links pull their boxes with d²/k, and the
+    moves are capped by a temperature that cools over the iterations.
+
+    Only the `movable` boxes move; the others still push and pull them. A full layout pulls the boxes
+    towards their centroid (`gravity`) so disconnected parts stay together, while a partial one
+    anchors each movable box to its start position (`anchoring`) so the rest of the diagram stays put.
+    """
+
+    def __init__(self, idealLength: Optional[float] = None, iterations: int = 300, gravity: float = 0.01,
+                 anchoring: float = 0.3, leafSize: int = 4, seed: int = 1):
+        # Preferred link length; None derives it from the box sizes.
+        self.idealLength = idealLength
+        self.iterations = iterations
+        self.gravity = gravity
+        self.anchoring = anchoring
+        self.leafSize = leafSize
+        self.seed = seed
+
+    def ideal_length(self, graph: LayoutGraph) -> float:
+        if self.idealLength:
+            return self.idealLength
+        if not len(graph.sizes):
+            return 1.0
+        return 1.5 * float(np.median(np.hypot(graph.sizes[:, 0], graph.sizes[:, 1]))) or 1.0
+
+    def run(self, graph: LayoutGraph, movable: Optional[np.ndarray] = None,
+            iterations: Optional[int] = None) -> Iterator[np.ndarray]:
+        """Yields the box centers after each iteration; `movable` is a mask, None moves every box."""
+        n = len(graph.ids)
+        iterations = self.iterations if iterations is None else iterations
+        targets = np.arange(n) if movable is None else np.nonzero(movable)[0]
+        if not len(targets) or iterations <= 0:
+            return
+        k = self.ideal_length(graph)
+        partial = len(targets) < n
+        positions = graph.centers.astype(np.float64)
+        # Separates boxes sharing a position, which would otherwise never push each other apart.
+        rng = np.random.default_rng(self.seed)
+        positions[targets] += rng.uniform(-k / 100, k / 100, (len(targets), 2))
+        anchors = positions[targets].copy()
+
+        edges = graph.edges
+        if partial:
+            edges = edges[movable[edges[:, 0]] | movable[edges[:, 1]]]
+        source, target = edges[:, 0], edges[:, 1]
+        # Boxes only need a few iterations to settle among fixed ones.
+        hot = k * max(1.0, math.sqrt(len(targets)) / 4)
+        cooling = (0.01 * k / hot) ** (1.0 / max(1, iterations - 1))
+        temperature = hot
+        for _ in range(iterations):
+            force = k * k * repulsion(positions, targets, self.leafSize)
+            if len(edges):
+                d = positions[target] - positions[source]
+                pull = d * (np.hypot(d[:, 0], d[:, 1]) / k)[:, None]
+                attraction = np.stack([np.bincount(source, pull[:, c], n) - np.bincount(target, pull[:, c], n)
+                                       for c in (0, 1)], axis=1)
+                force += attraction[targets]
+            p = positions[targets]
+            if partial:
+                force += self.anchoring * (anchors - p)
+            else:
+                force += self.gravity * (p.mean(axis=0) - p)
+            length = np.hypot(force[:, 0], force[:, 1])
+            step = np.minimum(length, temperature) / np.maximum(length, 1e-12)
+            positions[targets] = p + force * step[:, None]
+            temperature *= cooling
+            yield positions
+
+
+class LayoutJob(QRunnable):
+    """Runs a layout on a worker thread, keeping only the latest positions for the GUI thread."""
+
+    def __init__(self, runner: "LayoutRunner", graph: LayoutGraph, movable: np.ndarray, iterations: Optional[int]):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.runner = runner
+        self.layout = runner.layout
+        self.graph = graph
+        self.movable = movable
+        self.iterations = iterations
+        self.cancelled = False
+        # Latest (positions, done) published by the worker; guarded by `lock` together with `posted`.
+        self.lock = threading.Lock()
+        self.snapshot: Optional[Tuple[np.ndarray, bool]] = None
+        # True while a frame is queued to the GUI thread: newer frames replace it instead of queueing more.
+        self.posted = False
+
+    def run(self):
+        last = time.perf_counter()
+        positions = None
+        for positions in self.layout.run(self.graph, self.movable, self.iterations):
+            if self.cancelled:
+                return
+            now = time.perf_counter()
+            if now - last >= self.runner.frameInterval:
+                last = now
+                self.post(positions.copy(), False)
+        if positions is not None:
+            self.post(positions, True)
+
+    def post(self, positions: np.ndarray, done: bool):
+        with self.lock:
+            self.snapshot = (positions, done)
+            queue = not self.posted
+            self.posted = True
+        if queue:
+            try:
+                self.runner._frame.emit(self)
+            except RuntimeError:
+                # The runner was destroyed while this job ran.
+                pass
+
+    def take(self) -> Tuple[np.ndarray, bool]:
+        """The latest snapshot; frames posted after this queue a new call."""
+        with self.lock:
+            self.posted = False
+            return self.snapshot
+
+
+class LayoutRunner(QObject):
+    """
+    Lays out a model's boxes on a worker thread and streams intermediate positions to the model, so
+    the canvas shows the layout converging without blocking input.
+
+    Frames are applied on the GUI thread with model.set_box_positions, at most every `frameInterval`
+    seconds. When the layout finishes, is cancelled, or is interrupted by another model edit or by an
+    undo or redo, the whole move is recorded as one "Layout" history entry.
+    """
+
+    # True when the layout ran to the end, False when it was cancelled or interrupted.
+    finished = Signal(bool)
+    # Emitted by the job; queued to the runner's thread.
+    _frame = Signal(object)
+
+    def __init__(self, model: ModelDrawable, history=None, layout: Optional[ForceLayout] = None, parent=None):
+        super().__init__(parent)
+        self.model = None
+        self.history = history
+        self.layout = layout if layout is not None else ForceLayout()
+        self.frameInterval = 1 / 20
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.job: Optional[LayoutJob] = None
+        # (ids, top-left corners) of the moving boxes when the layout started.
+        self._before = None
+        self._applying = False
+        self._frame.connect(self._onFrame)
+        self.set_model(model)
+        if history is not None:
+            # Undo and redo first record the layout so far, so they step over it rather than under it.
+            history.add_settler(self.cancel)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.cancel)
+
+    def set_model(self, model: ModelDrawable):
+        self.cancel()
+        if self.model is not None:
+            self.model.remove_listener(self._onModelChanged)
+        self.model = model
+        model.add_listener(self._onModelChanged)
+
+    def is_running(self) -> bool:
+        return self.job is not None
+
+    def relayout(self, boxIds: Optional[Iterable[int]] = None, iterations: Optional[int] = None):
+        """Lays out the given boxes (every box when None) among the others, which stay in place."""
+        graph = layout_graph(self.model)
+        movable = None
+        if boxIds is not None:
+            movable = np.isin(graph.ids, np.asarray(list(boxIds), np.int64))
+        self._start(graph, movable, iterations)
+
+    def relayout_around(self, boxIds: Iterable[int], hops: int = 1, iterations: int = 60):
+        """Incremental layout after an edit: moves only the boxes within `hops` links of the given ones."""
+        graph = layout_graph(self.model)
+        seeds = np.nonzero(np.isin(graph.ids, np.asarray(list(boxIds), np.int64)))[0]
+        self._start(graph, neighborhood(graph.edges, len(graph.ids), seeds, hops), iterations)
+
+    def cancel(self):
+        if self.job is not None:
+            self.job.cancelled = True
+            self.pool.tryTake(self.job)
+            self._finish(False)
+
+    def wait(self):
+        """Blocks until the running layout is done and applies its final positions."""
+        self.pool.waitForDone()
+        QCoreApplication.sendPostedEvents(self, QEvent.MetaCall)
+
+    def _start(self, graph: LayoutGraph, movable: Optional[np.ndarray], iterations: Optional[int]):
+        self.cancel()
+        if movable is not None and not movable.any():
+            return
+        self.job = LayoutJob(self, graph, movable, iterations)
+        ids = graph.ids if movable is None else graph.ids[movable]
+        self._before = (ids, graph.top_lefts(graph.centers) if movable is None
+                        else graph.top_lefts(graph.centers)[movable])
+        self.pool.start(self.job)
+
+    def _onFrame(self, job: LayoutJob):
+        positions, done = job.take()
+        if job is not self.job or job.cancelled:
+            return
+        graph, movable = job.graph, job.movable
+        topLefts = graph.top_lefts(positions)
+        self._applying = True
+        try:
+            if movable is None:
+                self.model.set_box_positions(graph.ids, topLefts)
+            else:
+                self.model.set_box_positions(graph.ids[movable], topLefts[movable])
+        finally:
+            self._applying = False
+        if done:
+            self._finish(True)
+
+    def _onModelChanged(self, rects):
+        if not self._applying and self.job is not None:
+            # Another edit changed the graph under the layout: keep what was applied so far.
+            self.cancel()
+
+    def _finish(self, completed: bool):
+        self.job = None
+        ids, before = self._before
+        self._before = None
+        if self.history is not None:
+            existing = np.isin(ids, self.model.existing_ids(ids))
+            self.history.record_place(ids[existing], before[existing], "Layout")
+        self.finished.emit(completed)
@@ -0,0 +1,367 @@
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from Drawable import Drawable
+from ModelDrawable import ModelDrawable, ModelRecords
+from RenderBatch import DrawStyle
+
+
+class Delta:
+    """One reversible model change, stored as ids plus the data needed to apply it both ways."""
+
+    def undo(self, model: ModelDrawable):
+        raise NotImplementedError
+
+    def redo(self, model: ModelDrawable):
+        raise NotImplementedError
+
+    def size(self) -> int:
+        """Drawables touched, i.e. the cost of applying the delta."""
+        raise NotImplementedError
+
+
+class InsertDelta(Delta):
+    """Inserted drawables, with their indices in `model.drawables` so they are restored in the same z-order."""
+
+    def __init__(self, records: ModelRecords, positions: np.ndarray):
+        self.records = records
+        self.positions = positions
+
+    def undo(self, model):
+        model.remove_ids(self.records.ids())
+
+    def redo(self, model):
+        model.insert_records(self.records, self.positions)
+
+    def size(self):
+        return self.records.size()
+
+
+class RemoveDelta(InsertDelta):
+    def undo(self, model):
+        super().redo(model)
+
+    def redo(self, model):
+        super().undo(model)
+
+
+class MoveDelta(Delta):
+    """The same translation applied to many drawables: one id array and two floats."""
+
+    def __init__(self, ids: np.ndarray, dx: float, dy: float):
+        self.ids = ids
+        self.dx = dx
+        self.dy = dy
+
+    def undo(self, model):
+        model.translate_ids(self.ids, -self.dx, -self.dy)
+
+    def redo(self, model):
+        model.translate_ids(self.ids, self.dx, self.dy)
+
+    def size(self):
+        return len(self.ids)
+
+
+class PlaceDelta(Delta):
+    """Boxes moved to arbitrary positions (e.g. by a layout): ids and (n, 2) top-left corners before and after."""
+
+    def __init__(self, ids: np.ndarray, before: np.ndarray, after: np.ndarray):
+        self.ids = ids
+        self.before = before
+        self.after = after
+
+    def undo(self, model):
+        model.set_box_positions(self.ids, self.before)
+
+    def redo(self, model):
+        model.set_box_positions(self.ids, self.after)
+
+    def size(self):
+        return len(self.ids)
+
+
+class RenameDelta(Delta):
+    def __init__(self, ids: List[int], before: List[str], after: List[str]):
+        self.ids = ids
+        self.before = before
+        self.after = after
+
+    def undo(self, model):
+        for drawableId, name in zip(self.ids, self.before):
+            model.set_name(drawableId, name)
+
+    def redo(self, model):
+        for drawableId, name in zip(self.ids, self.after):
+            model.set_name(drawableId, name)
+
+    def size(self):
+        return len(self.ids)
+
+
+class StyleDelta(Delta):
+    def __init__(self, ids: np.ndarray, before: List[Optional[dict]], after: List[Optional[dict]]):
+        self.ids = ids
+        self.before = before
+        self.after = after
+
+    def undo(self, model):
+        model.set_styles(self.ids, self.before)
+
+    def redo(self, model):
+        model.set_styles(self.ids, self.after)
+
+    def size(self):
+        return len(self.ids)
+
+
+class Entry:
+    """One undo step: the deltas of an edit or of a whole transaction, applied in order."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.deltas: List[Delta] = []
+
+    def add(self, delta: Delta):
+        last = self.deltas[-1] if self.deltas else None
+        # Consecutive moves of the same drawables (e.g. a drag) collapse into one delta.
+        if (isinstance(delta, MoveDelta) and isinstance(last, MoveDelta)
+                and np.array_equal(delta.ids, last.ids)):
+            last.dx += delta.dx
+            last.dy += delta.dy
+        else:
+            self.deltas.append(delta)
+
+    def undo(self, model: ModelDrawable):
+        for delta in reversed(self.deltas):
+            delta.undo(model)
+
+    def redo(self, model: ModelDrawable):
+        for delta in self.deltas:
+            delta.redo(model)
+
+    def size(self) -> int:
+        return sum(delta.size() for delta in self.deltas)
+
+
+class History:
+    """
+    Undo/redo log of model edits, made through its methods (add, remove, move, rename, restyle).
+
+    Entries store compact deltas (ids, copied records of inserted or removed drawables, a single
+    offset per move), so memory follows what changed rather than the model size, and undoing or
+    redoing an entry costs what the edit touched. Edits made inside `transaction()` form one entry.
+
+    Every `snapshotInterval` entries a snapshot of the whole model is kept (at most `maxSnapshots`).
+    goto() uses the nearest one when restoring it and replaying from there is cheaper than stepping
+    through every entry in between. Set `snapshotInterval` to 0 to keep history memory strictly
+    proportional to the edits.
+    """
+
+    def __init__(self, model: ModelDrawable, maxEntries: int = 1000, snapshotInterval: int = 100,
+                 maxSnapshots: int = 2):
+        self.model = model
+        self.maxEntries = maxEntries
+        self.snapshotInterval = snapshotInterval
+        self.maxSnapshots = maxSnapshots
+        self.entries: List[Entry] = []
+        # Entries dropped from the start of the log, so positions stay absolute.
+        self.base = 0
+        # Absolute position: number of entries applied since the history started.
+        self.position = 0
+        # Records of the whole model at some positions, with their indices in `model.drawables`.
+        self.snapshots: Dict[int, Tuple[ModelRecords, np.ndarray]] = {}
+        self._open: Optional[Entry] = None
+        # Callables notified after every change of the history state (new entry, undo, redo).
+        self.listeners = []
+        # Callables run before undo, redo and goto, to record edits still in progress (e.g. a running layout).
+        self.settlers = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def _notify(self):
+        for listener in self.listeners:
+            listener()
+
+    def add_settler(self, settler):
+        self.settlers.append(settler)
+
+    def remove_settler(self, settler):
+        self.settlers.remove(settler)
+
+    def _settle(self):
+        for settler in list(self.settlers):
+            settler()
+
+    # ------------------ recording ------------------
+
+    @contextmanager
+    def transaction(self, label: str):
+        """Groups every edit made inside into one entry. Nested transactions join the outer one."""
+        if self._open is not None:
+            yield self._open
+            return
+        self._open = Entry(label)
+        try:
+            yield self._open
+        finally:
+            entry, self._open = self._open, None
+            if entry.deltas:
+                self._commit(entry)
+
+    def record(self, delta: Delta, label: str):
+        """Adds a delta for an edit already applied to the model."""
+        if self._open is not None:
+            self._open.add(delta)
+        else:
+            entry = Entry(label)
+            entry.add(delta)
+            self._commit(entry)
+
+    def _commit(self, entry: Entry):
+        del self.entries[self.position - self.base:]
+        self.snapshots = {p: s for p, s in self.snapshots.items() if p <= self.position}
+        self.entries.append(entry)
+        self.position += 1
+        if len(self.entries) > self.maxEntries:
+            drop = len(self.entries) - self.maxEntries
+            del self.entries[:drop]
+            self.base += drop
+            self.snapshots = {p: s for p, s in self.snapshots.items() if p >= self.base}
+        if self.snapshotInterval and self.position % self.snapshotInterval == 0:
+            ids = self.model.all_ids()
+            self.snapshots[self.position] = (self.model.records_for(ids), self.model.positions_of(ids))
+            while len(self.snapshots) > self.maxSnapshots:
+                del self.snapshots[min(self.snapshots)]
+        self._notify()
+
+    # ------------------ edits ------------------
+
+    def add(self, drawables: Iterable[Drawable], label: str = "Add") -> List[Drawable]:
+        """Adds drawables to the model in one bulk insert, as one entry; returns them as stored by the model."""
+        added = self.model.add_drawables(list(drawables))
+        self.record_insert([self.model.id_of(d) for d in added], label)
+        return added
+
+    def record_insert(self, ids: Iterable[int], label: str = "Add"):
+        """Records drawables already inserted by other means (e.g. a bulk add_boxes or an import)."""
+        records = self.model.records_for(ids)
+        self.record(InsertDelta(records, self.model.positions_of(records.ids())), label)
+
+    def remove(self, ids: Iterable[int], label: str = "Delete"):
+        """Removes drawables, and the links attached to removed boxes, as one entry."""
+        ids = list(ids)
+        records = self.model.records_for(list(ids) + list(self.model.incident_link_ids(ids)))
+        positions = self.model.positions_of(records.ids())
+        self.model.remove_ids(records.ids())
+        self.record(RemoveDelta(records, positions), label)
+
+    def move(self, ids: Iterable[int], dx: float, dy: float, label: str = "Move"):
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, np.int64)
+        self.model.translate_ids(ids, dx, dy)
+        self.record(MoveDelta(ids, dx, dy), label)
+
+    def record_place(self, ids: Iterable[int], before: np.ndarray, label: str = "Layout"):
+        """Records boxes already moved to new positions by other means, given their former top-left corners."""
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, np.int64)
+        after = self.model.bounds_of(ids)[:, :2]
+        moved = np.any(after != before, axis=1)
+        if moved.any():
+            self.record(PlaceDelta(ids[moved], before[moved], after[moved]), label)
+
+    def rename(self, ids: Iterable[int], names: Iterable[str], label: str = "Rename"):
+        ids = list(ids)
+        names = list(names)
+        before = [self.model.name_of(i) for i in ids]
+        for drawableId, name in zip(ids, names):
+            self.model.set_name(drawableId, name)
+        self.record(RenameDelta(ids, before, names), label)
+
+    def restyle(self, ids: Iterable[int], style: Optional[dict], label: str = "Restyle"):
+        """Sets the same style override (see Drawable.draw_style) on many drawables; None restores the class style."""
+        unknown = set(style or ()) - set(DrawStyle._fields)
+        if unknown:
+            raise ValueError(f"unknown style keys {sorted(unknown)}, expected some of {DrawStyle._fields}")
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, np.int64)
+        before = self.model.styles_of(ids)
+        after = [style] * len(ids)
+        self.model.set_styles(ids, after)
+        self.record(StyleDelta(ids, before, after), label)
+
+    # ------------------ navigation ------------------
+
+    def can_undo(self) -> bool:
+        return self.position > self.base
+
+    def can_redo(self) -> bool:
+        return self.position < self.base + len(self.entries)
+
+    def undo_label(self) -> Optional[str]:
+        return self.entries[self.position - self.base - 1].label if self.can_undo() else None
+
+    def redo_label(self) -> Optional[str]:
+        return self.entries[self.position - self.base].label if self.can_redo() else None
+
+    def undo(self) -> bool:
+        if self._open is not None:
+            raise RuntimeError("cannot undo inside a transaction")
+        self._settle()
+        if not self.can_undo():
+            return False
+        self.position -= 1
+        self.entries[self.position - self.base].undo(self.model)
+        self._notify()
+        return True
+
+    def redo(self) -> bool:
+        if self._open is not None:
+            raise RuntimeError("cannot redo inside a transaction")
+        self._settle()
+        if not self.can_redo():
+            return False
+        self.entries[self.position - self.base].redo(self.model)
+        self.position += 1
+        self._notify()
+        return True
+
+    def _path_cost(self, start: int, end: int) -> int:
+        lo, hi = sorted((start, end))
+        return sum(entry.size() for entry in self.entries[lo - self.base:hi - self.base])
+
+    def goto(self, position: int):
+        """Brings the model to the state after `position` entries, through a snapshot when that is cheaper."""
+        if self._open is not None:
+            raise RuntimeError("cannot move through the history inside a transaction")
+        self._settle()
+        if not self.base <= position <= self.base + len(self.entries):
+            raise IndexError(position)
+        best = None
+        bestCost = self._path_cost(self.position, position)
+        modelSize = len(self.model.drawables)
+        for snapshotPosition, snapshot in self.snapshots.items():
+            cost = modelSize + snapshot[0].size() + self._path_cost(snapshotPosition, position)
+            if cost < bestCost:
+                best, bestCost = snapshotPosition, cost
+        if best is not None:
+            self.model.remove_ids(self.model.all_ids())
+            self.model.insert_records(*self.snapshots[best])
+            self.position = best
+        while self.position > position:
+            self.position -= 1
+            self.entries[self.position - self.base].undo(self.model)
+        while self.position < position:
+            self.entries[self.position - self.base].redo(self.model)
+            self.position += 1
+        self._notify()
+
+    def clear(self):
+        self.entries.clear()
+        self.snapshots.clear()
+        self.base = self.position
+        self._notify()
@@ -0,0 +1,454 @@
+import heapq
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+import numpy as np
+from PySide6.QtCore import QCoreApplication, QEvent, QObject, QPointF, QRectF, QRunnable, QThread, QThreadPool, QTimer, Signal
+
+from Drawable import Drawable, LinkDrawable
+from ModelDrawable import ModelDrawable, merged_rects
+from SpatialIndex import Bounds, GridIndex, bounds_to_rect
+
+# Directions of route segments: 0 is +x, 1 is -x, 2 is +y, 3 is -y; `direction ^ 1` is the opposite one.
+
+
+class Route(NamedTuple):
+    """A routed link: its polyline (None when no route was found), the polyline bounds, and the corridor searched."""
+    points: Optional[List[QPointF]]
+    bounds: Optional[Bounds]
+    corridor: Bounds
+
+
+def _ports(bounds, margin: float):
+    """(anchor on the box side, grid point `margin` outside it, outward direction) for each side of a box."""
+    left, top, right, bottom = bounds
+    cx, cy = (left + right) / 2, (top + bottom) / 2
+    return (((right, cy), (right + margin, cy), 0), ((left, cy), (left - margin, cy), 1),
+            ((cx, bottom), (cx, bottom + margin), 2), ((cx, top), (cx, top - margin), 3))
+
+
+def _covered(shape, i0, i1, j0, j1) -> np.ndarray:
+    """Mask of the grid cells covered by any of the index ranges [i0, i1) x [j0, j1), via a 2D prefix sum."""
+    counts = np.zeros((shape[0] + 1, shape[1] + 1), np.int32)
+    keep = (i0 < i1) & (j0 < j1)
+    i0, i1, j0, j1 = i0[keep], i1[keep], j0[keep], j1[keep]
+    np.add.at(counts, (i0, j0), 1)
+    np.add.at(counts, (i1, j0), -1)
+    np.add.at(counts, (i0, j1), -1)
+    np.add.at(counts, (i1, j1), 1)
+    return counts.cumsum(axis=0).cumsum(axis=1)[:shape[0], :shape[1]] > 0
+
+
+def route_orthogonal(source: Bounds, target: Bounds, obstacles: np.ndarray, corridor: Bounds,
+                     margin: float = 10.0, bendCost: float = 30.0, maxGridNodes: int = 250000) -> Optional[np.ndarray]:
+    """
+    Shortest orthogonal polyline from a side of `source` to a side of `target` keeping `margin` away
+    from the `obstacles` ((k, 4) left, top, right, bottom rows), searched within `corridor`.
+
+    A* over the sparse grid made of the inflated obstacle edges and the box sides' midpoints. Since
+    every obstacle edge is a grid line, each grid node and segment is either inside an obstacle or
+    clear of it, which is rasterized for all obstacles at once. Each bend costs `bendCost` on top of
+    the length. Returns the (p, 2) points, or None when the corridor has no route or its grid would
+    exceed `maxGridNodes`.
+    """
+    inflated = np.vstack([obstacles.reshape(-1, 4), [source], [target]]) + (-margin, -margin, margin, margin)
+    cl, ct, cr, cb = corridor
+    sourcePorts, targetPorts = _ports(source, margin), _ports(target, margin)
+    portX = [p[1][0] for p in sourcePorts + targetPorts]
+    portY = [p[1][1] for p in sourcePorts + targetPorts]
+    xs = np.unique(np.clip(np.concatenate([inflated[:, 0], inflated[:, 2], portX, [cl, cr]]), cl, cr))
+    ys = np.unique(np.clip(np.concatenate([inflated[:, 1], inflated[:, 3], portY, [ct, cb]]), ct, cb))
+    nx, ny = len(xs), len(ys)
+    if nx * ny > maxGridNodes:
+        return None
+
+    # Grid lines strictly inside each obstacle, and grid intervals within it.
+    left, top, right, bottom = inflated.T
+    innerX = np.searchsorted(xs, left, "right"), np.searchsorted(xs, right, "left")
+    innerY = np.searchsorted(ys, top, "right"), np.searchsorted(ys, bottom, "left")
+    spanX = np.searchsorted(xs, left, "left"), np.searchsorted(xs, right, "right") - 1
+    spanY = np.searchsorted(ys, top, "left"), np.searchsorted(ys, bottom, "right") - 1
+    free = ~_covered((nx, ny), *innerX, *innerY)
+    # Whether the segment from node (i, j) to (i + 1, j), and from (i, j) to (i, j + 1), is clear.
+    hFree = np.zeros((nx, ny), bool)
+    vFree = np.zeros((nx, ny), bool)
+    hFree[:-1] = free[:-1] & free[1:] & ~_covered((nx - 1, ny), *spanX, *innerY)
+    vFree[:, :-1] = free[:, :-1] & free[:, 1:] & ~_covered((nx, ny - 1), *innerX, *spanY)
+    # Nodes are numbered i * ny + j; states are node * 4 + direction of the last segment.
+    gx, gy = np.meshgrid(xs, ys, indexing="ij")
+    px, py = gx.ravel().tolist(), gy.ravel().tolist()
+    free = free.ravel().tolist()
+    hFree = hFree.ravel().tolist()
+    vFree = vFree.ravel().tolist()
+    xIndex = {x: i for i, x in enumerate(xs.tolist())}
+    yIndex = {y: j for j, y in enumerate(ys.tolist())}
+
+    def node(point):
+        i, j = xIndex.get(point[0]), yIndex.get(point[1])
+        return i * ny + j if i is not None and j is not None and free[i * ny + j] else None
+
+    # Goal nodes, with the direction that enters the target side head on.
+    goals = {}
+    for anchor, out, direction in targetPorts:
+        n = node(out)
+        if n is not None:
+            goals[n] = (direction ^ 1, anchor)
+    if not goals:
+        return None
+    # Admissible heuristic: Manhattan distance to the nearest goal, plus one bend when not aligned with it.
+    heuristic = np.min([np.abs(gx - px[n]) + np.abs(gy - py[n])
+                        + bendCost * ((gx != px[n]) & (gy != py[n])) for n in goals], axis=0).ravel().tolist()
+
+    best: Dict[int, float] = {}
+    parents: Dict[int, int] = {}
+    heap = []
+    for anchor, out, direction in sourcePorts:
+        n = node(out)
+        if n is not None:
+            state = n * 4 + direction
+            best[state] = 0.0
+            parents[state] = -1
+            heap.append((heuristic[n], 0.0, state))
+    heapq.heapify(heap)
+    end = -1
+    inf = float("inf")
+    while heap:
+        _, cost, state = heapq.heappop(heap)
+        # Costs are stored negated so that, among equal estimates, the deepest state is expanded first.
+        cost = -cost
+        if cost > best.get(state, inf):
+            continue
+        n, direction = divmod(state, 4)
+        goal = goals.get(n)
+        if goal is not None and direction == goal[0]:
+            end = state
+            break
+        for step in range(4):
+            if step == direction ^ 1:
+                continue
+            if step == 0:
+                if not hFree[n]:
+                    continue
+                m = n + ny
+            elif step == 1:
+                m = n - ny
+                if m < 0 or not hFree[m]:
+                    continue
+            elif step == 2:
+                if not vFree[n]:
+                    continue
+                m = n + 1
+            else:
+                m = n - 1
+                if n % ny == 0 or not vFree[m]:
+                    continue
+            nextCost = cost + abs(px[m] - px[n]) + abs(py[m] - py[n]) + (bendCost if step != direction else 0.0)
+            goal = goals.get(m)
+            if goal is not None and step != goal[0]:
+                # Arriving along the side: one more bend to enter the box.
+                step = goal[0]
+                nextCost += bendCost
+            nextState = m * 4 + step
+            if nextCost < best.get(nextState, inf):
+                best[nextState] = nextCost
+                parents[nextState] = state
+                heapq.heappush(heap, (nextCost + heuristic[m], -nextCost, nextState))
+    if end < 0:
+        return None
+
+    nodes = []
+    state = end
+    while state >= 0:
+        nodes.append((px[state // 4], py[state // 4]))
+        state = parents[state]
+    nodes.reverse()
+    start = next(anchor for anchor, out, _ in sourcePorts if out == nodes[0])
+    points = np.array([start] + nodes + [goals[end // 4][1]])
+    # Drops repeated and collinear points.
+    keep = np.ones(len(points), bool)
+    d1 = points[1:-1] - points[:-2]
+    d2 = points[2:] - points[1:-1]
+    keep[1:-1] = (d1[:, 0] * d2[:, 1] - d1[:, 1] * d2[:, 0] != 0)
+    return points[keep]
+
+
+class RouteJob(QRunnable):
+    """Routes a chunk of links on a worker thread, each from a snapshot of the boxes in its corridor."""
+
+    def __init__(self, router: "LinkRouter", generation: int, links: list):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.router = router
+        self.generation = generation
+        # (link id, source bounds, target bounds, corridor, (k, 4) obstacle bounds) rows.
+        self.links = links
+        self.cancelled = False
+        self.routes: Dict[int, Route] = {}
+
+    def run(self):
+        router = self.router
+        for linkId, source, target, corridor, obstacles in self.links:
+            if self.cancelled:
+                return
+            self.routes[linkId] = router.route(source, target, obstacles, corridor)
+        try:
+            router._finished.emit(self)
+        except RuntimeError:
+            # The router was destroyed while this job ran.
+            pass
+
+
+class LinkRouter(QObject):
+    """
+    Routes the model's links around boxes as orthogonal polylines (see route_orthogonal), on a pool
+    of worker threads, and caches one route per link id.
+
+    Routes are keyed on their corridor, the model rect searched for them: after a model change, only
+    the links whose corridor intersects a changed rect (which covers the moved boxes and their own
+    links) are routed again. Each is routed from the boxes of its corridor, taken from the model's
+    spatial index, and links without a route are retried in a corridor `corridorGrowth` times wider.
+    Until their new route arrives they are drawn straight. Changes are debounced by `rerouteDelay`
+    ms, so a drag or a streamed layout is routed once it settles.
+    `routesChanged` gives the model rects to repaint when routes change (see CanvasQWidget.set_router).
+    """
+
+    routesChanged = Signal(list)
+    # Emitted by jobs; queued to the router's thread.
+    _finished = Signal(object)
+
+    margin = 10.0
+    bendCost = 30.0
+    # Corridor padding around the two boxes of a link; grown 4x, at most `corridorGrowth` times, on failure.
+    corridorPadding = 120.0
+    corridorGrowth = 3
+    rerouteDelay = 100
+    # Links routed per job: a cancelled batch stops after the link in progress.
+    chunkSize = 32
+
+    def __init__(self, model: ModelDrawable, workers: Optional[int] = None, parent=None):
+        super().__init__(parent)
+        self.model = None
+        self.routes: Dict[int, Route] = {}
+        # Route bounds, for drawing, and corridors, for invalidation, by link id.
+        self.paths = GridIndex()
+        self.corridors = GridIndex()
+        # Links whose cached route (if any) is out of date, and the generation of their latest request.
+        self.stale: Set[int] = set()
+        self.generations: Dict[int, int] = {}
+        self._generation = 0
+        self._dirty: Set[int] = set()
+        # Times the corridor of a link is grown for its next routing, for links without a route so far.
+        self.attempts: Dict[int, int] = {}
+        self.jobs: Set[RouteJob] = set()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(workers if workers else QThread.idealThreadCount())
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.schedule)
+        self._finished.connect(self._onJobFinished)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+        self.set_model(model)
+
+    def set_model(self, model: ModelDrawable):
+        self.cancel_all()
+        if self.model is not None:
+            self.model.remove_listener(self._onModelChanged)
+        self.model = model
+        model.add_listener(self._onModelChanged)
+        self.routes.clear()
+        self.paths.clear()
+        self.corridors.clear()
+        self.stale.clear()
+        self.generations.clear()
+        self.attempts.clear()
+        self.route_all()
+
+    def route_all(self):
+        """Routes every link of the model again, in the background."""
+        self.invalidate(self.model.link_ids_in_rect(QRectF(-1e300, -1e300, 2e300, 2e300)).tolist())
+        self.schedule()
+
+    def route_of(self, link: Drawable) -> Optional[List[QPointF]]:
+        """The routed polyline of a link, or None while it is not routed (the link is then drawn straight)."""
+        try:
+            linkId = self.model.id_of(link)
+        except KeyError:
+            # Not in the model, e.g. the preview of the link tool.
+            return None
+        route = self.routes.get(linkId)
+        if route is None or linkId in self.stale:
+            return None
+        return route.points
+
+    def links_at(self, point: QPointF, tolerance: float = 0.0) -> List[Drawable]:
+        """Routed links whose polyline passes within `tolerance` (at least half the pen width) of a model point."""
+        t = tolerance
+        model = self.model
+        found = []
+        for linkId in self.paths.query_rect(QRectF(point.x() - t, point.y() - t, 2 * t, 2 * t)):
+            if linkId not in self.stale:
+                link = model.drawable_for(linkId)
+                if link.contains(point, t, self.routes[linkId].points):
+                    found.append(link)
+        return found
+
+    def pick(self, under: List[Drawable], point: QPointF, tolerance: float = 0.0) -> List[Drawable]:
+        """
+        Corrects a model hit-test (model.query_point) for routed links, which are hit along their route
+        rather than their straight line. Returns the drawables in z-order.
+        """
+        picked = [d for d in under if not (isinstance(d, LinkDrawable) and self.route_of(d) is not None)]
+        return sorted(picked + self.links_at(point, tolerance), key=self.model.id_of)
+
+    def routed_links_in_rect(self, rect: QRectF) -> List[Drawable]:
+        """Links whose routed polyline may cross a model rect, e.g. to add detours to a tile's drawables."""
+        model = self.model
+        return [model.drawable_for(i) for i in sorted(self.paths.query_rect(rect)) if i not in self.stale]
+
+    def corridor(self, source: Bounds, target: Bounds, attempt: int = 0) -> Bounds:
+        """The model rect searched for a route between two boxes, padded more on later attempts."""
+        pad = self.corridorPadding * 4 ** attempt
+        return (min(source[0], target[0]) - pad, min(source[1], target[1]) - pad,
+                max(source[2], target[2]) + pad, max(source[3], target[3]) + pad)
+
+    def route(self, source: Bounds, target: Bounds, obstacles: np.ndarray, corridor: Bounds) -> Route:
+        """Routes one link around the `obstacles` ((k, 4) box bounds) within `corridor`. Safe to call from any thread."""
+        near = obstacles[(obstacles[:, 0] < corridor[2]) & (obstacles[:, 2] > corridor[0])
+                         & (obstacles[:, 1] < corridor[3]) & (obstacles[:, 3] > corridor[1])]
+        # The link's own boxes are passed separately, as ports.
+        near = near[~((near == source).all(axis=1) | (near == target).all(axis=1))]
+        points = route_orthogonal(source, target, near, corridor, self.margin, self.bendCost)
+        if points is None:
+            return Route(None, None, corridor)
+        return Route([QPointF(x, y) for x, y in points.tolist()],
+                     (*points.min(axis=0).tolist(), *points.max(axis=0).tolist()), corridor)
+
+    def invalidate(self, linkIds: Iterable[int]):
+        """Marks links for routing at the next schedule()."""
+        for linkId in linkIds:
+            self._dirty.add(linkId)
+            self.attempts.pop(linkId, None)
+            if linkId in self.routes:
+                self.stale.add(linkId)
+
+    def schedule(self):
+        """Queues the invalidated links on the workers, with a snapshot of the boxes in each one's corridor."""
+        self._timer.stop()
+        # Queued jobs not started yet are merged into this request.
+        for job in list(self.jobs):
+            if self.pool.tryTake(job):
+                self.jobs.discard(job)
+                self._dirty.update(row[0] for row in job.links)
+        if not self._dirty:
+            return
+        model = self.model
+        ids = model.existing_ids(sorted(self._dirty))
+        self._dirty.clear()
+        self._generation += 1
+        generation = self._generation
+        links = []
+        for linkId in ids.tolist():
+            link = model.drawable_for(linkId)
+            ends = model.bounds_of([model.id_of(link.box1), model.id_of(link.box2)])
+            source, target = tuple(ends[0].tolist()), tuple(ends[1].tolist())
+            corridor = self.corridor(source, target, self.attempts.get(linkId, 0))
+            obstacles = model.bounds_of(model.box_ids_in_rect(bounds_to_rect(corridor)))
+            links.append((linkId, source, target, corridor, obstacles))
+            self.generations[linkId] = generation
+        for begin in range(0, len(links), self.chunkSize):
+            job = RouteJob(self, generation, links[begin:begin + self.chunkSize])
+            self.jobs.add(job)
+            self.pool.start(job)
+
+    def is_pending(self) -> bool:
+        return bool(self.jobs or self._dirty)
+
+    def wait(self):
+        """Blocks until every requested route is computed and stored."""
+        # Links without a route are queued again, in a wider corridor, as their jobs finish.
+        while self._dirty or self._timer.isActive() or self.jobs:
+            if self._dirty or self._timer.isActive():
+                self.schedule()
+            self.pool.waitForDone()
+            QCoreApplication.sendPostedEvents(self, QEvent.MetaCall)
+
+    def cancel_all(self):
+        self._timer.stop()
+        self._dirty.clear()
+        for job in self.jobs:
+            job.cancelled = True
+            self.pool.tryTake(job)
+        self.jobs.clear()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.waitForDone()
+
+    def _drop(self, linkId: int, rects: List[QRectF]):
+        route = self.routes.pop(linkId, None)
+        if route is not None:
+            if route.bounds is not None:
+                rects.append(bounds_to_rect(route.bounds))
+            self.paths.remove(linkId)
+            self.corridors.remove(linkId)
+        self.stale.discard(linkId)
+
+    def _onModelChanged(self, rects: List[QRectF]):
+        changed = set()
+        for rect in rects:
+            changed.update(self.corridors.query_rect(rect))
+            changed.update(self.model.link_ids_in_rect(rect).tolist())
+        if not changed:
+            return
+        existing = set(self.model.existing_ids(sorted(changed)).tolist())
+        repaint = []
+        for linkId in changed - existing:
+            self._drop(linkId, repaint)
+            self.generations.pop(linkId, None)
+            self.attempts.pop(linkId, None)
+            self._dirty.discard(linkId)
+        # Stale routes are drawn straight until routed again: repaint their detours now.
+        repaint += [bounds_to_rect(self.routes[i].bounds) for i in existing
+                    if i in self.routes and i not in self.stale and self.routes[i].bounds is not None]
+        self.invalidate(existing)
+        if repaint:
+            self.routesChanged.emit(merged_rects(repaint))
+        self._timer.start(self.rerouteDelay)
+
+    def _onJobFinished(self, job: RouteJob):
+        self.jobs.discard(job)
+        if job.cancelled:
+            return
+        repaint = []
+        generations = self.generations
+        retry = False
+        stored = []
+        for linkId, route in job.routes.items():
+            if generations.get(linkId) != job.generation:
+                continue
+            del generations[linkId]
+            attempt = self.attempts.get(linkId, 0)
+            if route.points is None and attempt < self.corridorGrowth:
+                # No route in this corridor: try a wider one, keeping the current state meanwhile.
+                self.attempts[linkId] = attempt + 1
+                self._dirty.add(linkId)
+                retry = True
+                continue
+            self.attempts.pop(linkId, None)
+            self._drop(linkId, repaint)
+            stored.append(linkId)
+            self.routes[linkId] = route
+            self.corridors.insert(linkId, bounds_to_rect(route.corridor))
+            if route.bounds is not None:
+                # Indexed along the polyline, so hit-tests and tiles only find it near its segments.
+                self.paths.insert(linkId, bounds_to_rect(route.bounds),
+                                  [(a.x(), a.y(), b.x(), b.y()) for a, b in zip(route.points, route.points[1:])])
+                repaint.append(bounds_to_rect(route.bounds))
+        # Tiles may still show the straight lines of the links, drawn before their routes arrived.
+        straight = self.model.existing_ids(stored)
+        repaint += [bounds_to_rect(tuple(b)) for b in self.model.bounds_of(straight).tolist()]
+        if repaint:
+            self.routesChanged.emit(merged_rects(repaint))
+        if retry and not self._timer.isActive():
+            self.schedule()
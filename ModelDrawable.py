@@ -1,14 +1,407 @@
-from Drawable import Drawable, BoxDrawable
+import math
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PySide6.QtCore import QPointF, QRectF
+
+from Drawable import Drawable, BoxDrawable, LinkDrawable
+from SpatialIndex import GridIndex, bounds_to_rect
+from geometry import point_segment_distance
+
+# Above this many changed items, change notifications are merged into a single union rect.
+MAX_NOTIFIED_RECTS = 64
+
+
+def merged_rects(rects: List[QRectF]) -> List[QRectF]:
+    """The rects themselves, or their union when there are too many to invalidate one by one."""
+    if len(rects) <= MAX_NOTIFIED_RECTS:
+        return rects
+    union = QRectF()
+    for rect in rects:
+        union = union.united(rect)
+    return [union]
+
+
+class ModelRecords(NamedTuple):
+    """
+    Compact, storage-independent copy of some boxes and links, used by the undo history.
+    Boxes are (x, y, w, h) rows and links (source id, target id) rows, keyed by their ids;
+    `names` holds the box names then the link names, `extra` the metadata other than "name" by id.
+    """
+    boxIds: np.ndarray
+    boxGeometry: np.ndarray
+    linkIds: np.ndarray
+    linkEnds: np.ndarray
+    names: List[str]
+    extra: Dict[int, dict]
+
+    def ids(self) -> np.ndarray:
+        return np.concatenate([self.boxIds, self.linkIds])
+
+    def size(self) -> int:
+        return len(self.boxIds) + len(self.linkIds)
 
 
 class ModelDrawable(Drawable):
     def __init__(self):
         self.drawables = []
-        # Optionally store metamodel data for each box.
+        # Optionally store metamodel data for each box, keyed by stable id.
         self.metamodel = {}
+        # Spatial index over drawable bounding rects, used for hit-testing and viewport queries.
+        self.index = GridIndex()
+        # Stable integer id of each drawable. Ids are never reused, so they also give the z-order of `drawables`.
+        self.ids = {}
+        self.byId = {}
+        self._nextId = 0
+        # Links attached to each box, so box edits only touch their own links.
+        self.adjacency = {}
+        # Callables notified with the list of model rects touched by each mutation.
+        self.listeners = []
+        # Widest pen of any link stored so far, style overrides included; widens the hit-test query.
+        self.widestLink = LinkDrawable.style.width
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def _notify(self, rects: List[QRectF]):
+        for listener in self.listeners:
+            listener(rects)
 
     def add_drawable(self, drawable: Drawable):
+        self._insert(drawable)
+        self._notify([drawable.boundingRect()])
+        return drawable
+
+    def add_drawables(self, drawables: List[Drawable], ids: List[int] = None) -> List[Drawable]:
+        """
+        Bulk insert in one pass, with a single change notification (one repaint) for the whole batch.
+        `ids` reuses stored ids (e.g. from a model file) instead of allocating new ones.
+        """
+        bounds = QRectF()
+        for i, drawable in enumerate(drawables):
+            self._insert(drawable, None if ids is None else ids[i])
+            bounds = bounds.united(drawable.boundingRect())
+        if drawables:
+            self._notify([bounds])
+        return drawables
+
+    def _insert(self, drawable: Drawable, drawableId: int = None):
+        if drawableId is None:
+            drawableId = self._nextId
+        elif drawableId in self.byId:
+            raise KeyError(f"id {drawableId} already in use")
+        self._nextId = max(self._nextId, drawableId + 1)
         self.drawables.append(drawable)
+        self.ids[drawable] = drawableId
+        self.byId[drawableId] = drawable
+        self.index.insert(drawable, drawable.boundingRect(), drawable.segments())
         # If it's a box, store its metadata.
         if isinstance(drawable, BoxDrawable):
-            self.metamodel[id(drawable)] = drawable.metadata
+            self.metamodel[drawableId] = drawable.metadata
+        elif isinstance(drawable, LinkDrawable):
+            self.adjacency.setdefault(drawable.box1, set()).add(drawable)
+            self.adjacency.setdefault(drawable.box2, set()).add(drawable)
+            self.widestLink = max(self.widestLink, drawable.draw_style().width)
+
+    def remove_drawable(self, drawable: Drawable):
+        """Removes a drawable; removing a box also removes the links attached to it."""
+        self.remove_ids([self.ids[drawable]])
+
+    def remove_ids(self, ids: Iterable[int]):
+        """Removes drawables by id in one pass, with one change notification; links attached to removed boxes go too."""
+        rects = []
+        removed = set()
+        for drawableId in ids:
+            drawable = self.byId.get(drawableId)
+            if drawable is None or drawable in removed:
+                continue
+            for link in self.adjacency.pop(drawable, ()):
+                rects.append(link.boundingRect())
+                removed.add(link)
+                self._forget(link)
+            rects.append(drawable.boundingRect())
+            removed.add(drawable)
+            self._forget(drawable)
+        if removed:
+            self.drawables = [d for d in self.drawables if d not in removed]
+            self._notify(merged_rects(rects))
+
+    def _forget(self, drawable: Drawable):
+        """Drops a drawable from the ids, index and adjacency; the caller removes it from `drawables`."""
+        drawableId = self.ids.pop(drawable)
+        del self.byId[drawableId]
+        self.index.remove(drawable)
+        self.metamodel.pop(drawableId, None)
+        if isinstance(drawable, LinkDrawable):
+            for box in (drawable.box1, drawable.box2):
+                links = self.adjacency.get(box)
+                if links is not None:
+                    links.discard(drawable)
+                    if not links:
+                        del self.adjacency[box]
+
+    def links_of(self, box: BoxDrawable) -> List[LinkDrawable]:
+        """Links attached to a box, in z-order."""
+        return self._sorted(self.adjacency.get(box, ()))
+
+    def id_of(self, drawable: Drawable) -> int:
+        return self.ids[drawable]
+
+    def next_id(self) -> int:
+        """The id the next drawable inserted without a stored id gets; later ones follow in order."""
+        return self._nextId
+
+    def drawable_for(self, drawableId: int) -> Drawable:
+        return self.byId[drawableId]
+
+    def update_drawable(self, drawable: Drawable):
+        """Re-indexes a drawable (and the links attached to it) after its geometry changed in place."""
+        self._notify(self._reindex([drawable]))
+
+    def _reindex(self, drawables: Iterable[Drawable]) -> List[QRectF]:
+        """Re-indexes drawables and their links; returns the old and new rects to repaint."""
+        changed = set()
+        for drawable in drawables:
+            changed.add(drawable)
+            changed.update(self.adjacency.get(drawable, ()))
+        rects = []
+        for d in changed:
+            old = self.index.bounds.get(d)
+            if old is not None:
+                rects.append(bounds_to_rect(old))
+            rect = d.boundingRect()
+            self.index.update(d, rect, d.segments())
+            rects.append(rect)
+            if isinstance(d, LinkDrawable):
+                self.widestLink = max(self.widestLink, d.draw_style().width)
+        return merged_rects(rects)
+
+    def move_drawable(self, drawable: Drawable, dx: float, dy: float):
+        drawable.translate(dx, dy)
+        self.update_drawable(drawable)
+
+    # ------------------ id-based edits (see History) ------------------
+
+    def all_ids(self) -> List[int]:
+        """Every live id, in z-order."""
+        return sorted(self.byId)
+
+    def translate_ids(self, ids: Iterable[int], dx: float, dy: float):
+        """Moves many drawables at once, with one change notification; links follow their boxes."""
+        drawables = [self.byId[i] for i in ids]
+        for drawable in drawables:
+            drawable.translate(dx, dy)
+        self._notify(self._reindex(drawables))
+
+    def name_of(self, drawableId: int) -> str:
+        return self.byId[drawableId].metadata.get("name", "")
+
+    def set_name(self, drawableId: int, name: str):
+        drawable = self.byId[drawableId]
+        drawable.metadata["name"] = name
+        self._notify([drawable.boundingRect()])
+
+    def incident_link_ids(self, boxIds: Iterable[int]) -> List[int]:
+        """Ids of the links attached to any of the boxes."""
+        links = set()
+        for boxId in boxIds:
+            links.update(self.adjacency.get(self.byId.get(boxId), ()))
+        return sorted(self.ids[link] for link in links)
+
+    def existing_ids(self, ids: Iterable[int]) -> np.ndarray:
+        """The ids still in the model, in the given order."""
+        byId = self.byId
+        return np.array([i for i in ids if i in byId], np.int64)
+
+    def ids_in_rect(self, rect: QRectF, contained: bool = False) -> np.ndarray:
+        """Ids of the drawables intersecting a model rect (or, with `contained`, inside it), sorted."""
+        rect = rect.normalized()
+        ids = self.ids
+        if contained:
+            found = [ids[d] for d in self.index.query_rect(rect) if rect.contains(d.boundingRect())]
+        else:
+            found = [ids[d] for d in self.index.query_rect(rect)]
+        return np.sort(np.array(found, np.int64))
+
+    def box_ids_in_rect(self, rect: QRectF) -> np.ndarray:
+        """Ids of the boxes intersecting a model rect, sorted."""
+        ids = self.ids
+        return np.sort(np.array([ids[d] for d in self.index.query_rect(rect.normalized())
+                                 if isinstance(d, BoxDrawable)], np.int64))
+
+    def link_ids_in_rect(self, rect: QRectF) -> np.ndarray:
+        """Ids of the links whose bounds intersect a model rect, sorted."""
+        ids = self.ids
+        return np.sort(np.array([ids[d] for d in self.index.query_rect(rect.normalized())
+                                 if isinstance(d, LinkDrawable)], np.int64))
+
+    def ids_where(self, predicate: Callable[[Drawable], bool]) -> np.ndarray:
+        """Ids of the drawables matching a predicate, sorted."""
+        ids = self.ids
+        return np.sort(np.array([ids[d] for d in self.drawables if predicate(d)], np.int64))
+
+    def bounds_of(self, ids: Iterable[int]) -> np.ndarray:
+        """(left, top, right, bottom) rows of the drawables' bounds."""
+        bounds = self.index.bounds
+        return np.array([bounds[self.byId[i]] for i in ids], np.float64).reshape(-1, 4)
+
+    def box_graph(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The boxes and links as a graph: sorted box ids, their (x, y, w, h) rows, and the links as
+        (source, target) rows of indices into the box ids.
+        """
+        boxes = sorted((self.ids[d], d) for d in self.drawables if isinstance(d, BoxDrawable))
+        ids = np.array([i for i, _ in boxes], np.int64)
+        geometry = np.array([(b.rect.x(), b.rect.y(), b.rect.width(), b.rect.height()) for _, b in boxes],
+                            np.float64).reshape(-1, 4)
+        ends = np.array([(self.ids[d.box1], self.ids[d.box2]) for d in self.drawables
+                         if isinstance(d, LinkDrawable)], np.int64).reshape(-1, 2)
+        return ids, geometry, np.searchsorted(ids, ends)
+
+    def set_box_positions(self, ids: Iterable[int], positions: np.ndarray):
+        """Moves boxes so their top-left corners are at `positions` ((n, 2) rows), with one change notification."""
+        boxes = [self.byId[i] for i in ids]
+        for box, (x, y) in zip(boxes, np.asarray(positions, np.float64).tolist()):
+            box.rect.moveTo(x, y)
+        if boxes:
+            self._notify(self._reindex(boxes))
+
+    def styles_of(self, ids: Iterable[int]) -> List[Optional[dict]]:
+        """The style overrides (metadata["style"]) of drawables, None where there is none."""
+        return [self.byId[i].metadata.get("style") for i in ids]
+
+    def set_styles(self, ids: Iterable[int], styles: Iterable[Optional[dict]]):
+        """Sets the style overrides of many drawables, with one change notification; None restores the class style."""
+        rects = []
+        for drawableId, style in zip(ids, styles):
+            drawable = self.byId[drawableId]
+            if style:
+                drawable.metadata["style"] = dict(style)
+            else:
+                drawable.metadata.pop("style", None)
+            if isinstance(drawable, LinkDrawable):
+                self.widestLink = max(self.widestLink, drawable.draw_style().width)
+            rects.append(drawable.boundingRect())
+        if rects:
+            self._notify(merged_rects(rects))
+
+    def records_for(self, ids: Iterable[int]) -> ModelRecords:
+        """Copies the listed boxes and links; links attached to listed boxes are only copied when listed too."""
+        boxIds, geometry, boxNames = [], [], []
+        linkIds, ends, linkNames = [], [], []
+        extra = {}
+        for drawableId in sorted(set(ids)):
+            drawable = self.byId[drawableId]
+            others = {k: v for k, v in drawable.metadata.items() if k != "name"}
+            if others:
+                extra[drawableId] = others
+            if isinstance(drawable, BoxDrawable):
+                r = drawable.rect.normalized()
+                boxIds.append(drawableId)
+                geometry.append((r.x(), r.y(), r.width(), r.height()))
+                boxNames.append(drawable.metadata.get("name") or "")
+            elif isinstance(drawable, LinkDrawable):
+                linkIds.append(drawableId)
+                ends.append((self.ids[drawable.box1], self.ids[drawable.box2]))
+                linkNames.append(drawable.metadata.get("name") or "")
+            else:
+                raise TypeError(f"{type(drawable).__name__} cannot be recorded")
+        return ModelRecords(np.array(boxIds, np.int64), np.array(geometry, np.float64).reshape(-1, 4),
+                            np.array(linkIds, np.int64), np.array(ends, np.int64).reshape(-1, 2),
+                            boxNames + linkNames, extra)
+
+    def positions_of(self, ids: Iterable[int]) -> np.ndarray:
+        """Indices of drawables in `drawables`, e.g. to restore their z-order with insert_records."""
+        wanted = {self.byId[i]: k for k, i in enumerate(ids)}
+        positions = np.empty(len(wanted), np.int64)
+        # Searched from the end, where new drawables are, and only until every one is found.
+        drawables = self.drawables
+        for position in range(len(drawables) - 1, -1, -1):
+            if not wanted:
+                break
+            k = wanted.pop(drawables[position], None)
+            if k is not None:
+                positions[k] = position
+        return positions
+
+    def insert_records(self, records: ModelRecords, positions: np.ndarray = None):
+        """
+        Inserts copied drawables back under their ids, with one change notification.
+        `positions` (from positions_of, in `records.ids()` order) puts them back at those indices
+        of `drawables`; otherwise they are appended.
+        """
+        created = {}
+        drawables = []
+        names = iter(records.names)
+        for boxId, (x, y, w, h) in zip(records.boxIds.tolist(), records.boxGeometry.tolist()):
+            created[boxId] = box = BoxDrawable(QRectF(x, y, w, h), {"name": next(names), **records.extra.get(boxId, {})})
+            drawables.append(box)
+        for linkId, (source, target) in zip(records.linkIds.tolist(), records.linkEnds.tolist()):
+            box1 = created[source] if source in created else self.byId[source]
+            box2 = created[target] if target in created else self.byId[target]
+            drawables.append(LinkDrawable(box1, box2, {"name": next(names), **records.extra.get(linkId, {})}))
+        if positions is None or not drawables:
+            self.add_drawables(drawables, records.ids().tolist())
+            return
+        self.drawables, rest = [], self.drawables
+        self.add_drawables(drawables, records.ids().tolist())
+        # Merge the restored drawables back in one pass, by ascending position.
+        merged = []
+        others = iter(rest)
+        for k in np.argsort(positions, kind="stable").tolist():
+            merged.extend(islice(others, positions[k] - len(merged)))
+            merged.append(drawables[k])
+        merged.extend(others)
+        self.drawables = merged
+
+    def _sorted(self, drawables) -> List[Drawable]:
+        ids = self.ids
+        return sorted(drawables, key=lambda d: ids[d])
+
+    def query_point(self, point: QPointF, tolerance: float = 0.0) -> List[Drawable]:
+        """
+        Returns the drawables under a model point, in z-order.
+        Links are picked within `tolerance` model units (at least half their pen width) of any of their
+        segments, in one vectorized test (LinkRouter.pick corrects this for links drawn along a route).
+        """
+        t = max(tolerance, self.widestLink / 2)
+        under = []
+        links = []
+        for d in self.index.query_rect(QRectF(point.x() - t, point.y() - t, 2 * t, 2 * t)):
+            if isinstance(d, LinkDrawable):
+                links.append(d)
+            elif d.contains(point):
+                under.append(d)
+        if links:
+            segments = self.index.segments
+            owner = np.repeat(np.arange(len(links)), [len(segments[l]) for l in links])
+            ends = np.array([s for l in links for s in segments[l]], np.float64)
+            tolerances = np.maximum(tolerance, np.array([l.draw_style().width / 2 for l in links]))
+            hits = np.zeros(len(links), bool)
+            hits[owner[point_segment_distance(point.x(), point.y(), *ends.T) <= tolerances[owner]]] = True
+            under += [l for l, hit in zip(links, hits) if hit]
+        return self._sorted(under)
+
+    def query_rect(self, rect: QRectF) -> List[Drawable]:
+        """Returns the drawables whose bounds intersect a model rect (links only near their line, see GridIndex), in z-order."""
+        return self._sorted(self.index.query_rect(rect))
+
+    def query_rect_lod(self, rect: QRectF, minExtent: float, pixelSize: float) -> Tuple[List[Drawable], List[QPointF]]:
+        """
+        Level-of-detail viewport query. Drawables spanning at least `minExtent` are returned in z-order;
+        smaller ones are reduced to their centers, keeping one point per `pixelSize` cell.
+        """
+        drawables = []
+        points = {}
+        for drawable in self.query_rect(rect):
+            bounds = drawable.boundingRect()
+            if max(bounds.width(), bounds.height()) < minExtent:
+                center = bounds.center()
+                points.setdefault((math.floor(center.x() / pixelSize), math.floor(center.y() / pixelSize)), center)
+            else:
+                drawables.append(drawable)
+        return drawables, list(points.values())
@@ -0,0 +1,314 @@
+import json
+import mmap
+import struct
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+import numpy as np
+from PySide6.QtCore import QRectF
+
+from ColumnarModel import ColumnarModelDrawable
+from Drawable import BoxDrawable, LinkDrawable
+from ModelDrawable import ModelDrawable
+
+MAGIC = b"CNVM"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+CHUNK_HEADER = struct.Struct("<4sIQQ")  # tag, reserved, record count, payload size
+# Box and link records are written in chunks of at most this many rows.
+CHUNK_RECORDS = 65536
+
+BOX_RECORD = np.dtype([("id", "<i8"), ("x", "<f8"), ("y", "<f8"), ("w", "<f8"), ("h", "<f8"),
+                       ("name", "<i4"), ("reserved", "<i4")])
+LINK_RECORD = np.dtype([("id", "<i8"), ("source", "<i8"), ("target", "<i8"),
+                        ("name", "<i4"), ("reserved", "<i4")])
+
+
+class ModelFile:
+    """
+    Read access to a binary model file through mmap.
+
+    Layout (little endian): a header (magic, version, reserved) followed by chunks, each a
+    (tag, reserved, record count, payload size) header and a payload padded to 8 bytes:
+
+        STRS  string table: (count + 1) u64 offsets, then the UTF-8 blob
+        BOXS  BOX_RECORD rows, name is a string table index
+        LNKS  LINK_RECORD rows, source/target are box ids
+        META  JSON {id: {key: value}} for metadata other than "name"
+
+    BOXS and LNKS repeat for large models. Opening a file only walks the chunk headers;
+    record chunks are exposed as zero-copy NumPy views over the mapping.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a model file")
+        if version > VERSION:
+            self.close()
+            raise ValueError(f"{path} has unsupported version {version}")
+        # (tag, record count, payload offset, payload size) of every chunk.
+        self.chunks: List[Tuple[bytes, int, int, int]] = []
+        offset = HEADER.size
+        while offset < len(self._map):
+            tag, _, count, size = CHUNK_HEADER.unpack_from(self._map, offset)
+            offset += CHUNK_HEADER.size
+            self.chunks.append((tag, count, offset, size))
+            offset += _padded(size)
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Record views handed out are still alive; the mapping is released along with them.
+                pass
+            self._file.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _records(self, tag: bytes, dtype: np.dtype) -> Iterator[np.ndarray]:
+        for chunkTag, count, offset, _ in self.chunks:
+            if chunkTag == tag:
+                yield np.frombuffer(self._map, dtype, count, offset)
+
+    def box_chunks(self) -> Iterator[np.ndarray]:
+        return self._records(b"BOXS", BOX_RECORD)
+
+    def link_chunks(self) -> Iterator[np.ndarray]:
+        return self._records(b"LNKS", LINK_RECORD)
+
+    def box_count(self) -> int:
+        return sum(count for tag, count, _, _ in self.chunks if tag == b"BOXS")
+
+    def link_count(self) -> int:
+        return sum(count for tag, count, _, _ in self.chunks if tag == b"LNKS")
+
+    def strings(self) -> List[str]:
+        for tag, count, offset, size in self.chunks:
+            if tag == b"STRS":
+                offsets = np.frombuffer(self._map, "<u8", count + 1, offset).tolist()
+                blob = self._map[offset + 8 * (count + 1):offset + size]
+                return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(count)]
+        return []
+
+    def metadata(self) -> Dict[int, dict]:
+        for tag, _, offset, size in self.chunks:
+            if tag == b"META":
+                return {int(k): v for k, v in json.loads(self._map[offset:offset + size]).items()}
+        return {}
+
+
+def _padded(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _write_chunk(stream, tag: bytes, count: int, payload: bytes):
+    stream.write(CHUNK_HEADER.pack(tag, 0, count, len(payload)))
+    stream.write(payload)
+    stream.write(b"\0" * (_padded(len(payload)) - len(payload)))
+
+
+def _model_chunks(model: ModelDrawable) -> Tuple[Iterator[np.ndarray], Iterator[np.ndarray], List[str], Dict[int, dict]]:
+    """Box and link record chunks, string table and extra metadata of a model, in either storage mode."""
+    if isinstance(model, ColumnarModelDrawable):
+        def boxChunks():
+            b = model.boxes
+            for start in range(0, len(b), CHUNK_RECORDS):
+                rows = slice(start, start + CHUNK_RECORDS)
+                chunk = np.zeros(len(b["id"][rows]), BOX_RECORD)
+                for field in ("id", "x", "y", "w", "h", "name"):
+                    chunk[field] = b[field][rows]
+                yield chunk
+
+        def linkChunks():
+            l = model.links
+            for start in range(0, len(l), CHUNK_RECORDS):
+                rows = slice(start, start + CHUNK_RECORDS)
+                chunk = np.zeros(len(l["id"][rows]), LINK_RECORD)
+                for field in ("id", "source", "target", "name"):
+                    chunk[field] = l[field][rows]
+                yield chunk
+
+        return boxChunks(), linkChunks(), model.names.strings, model.extraMetadata
+
+    strings: List[str] = []
+    lookup: Dict[str, int] = {}
+    extra: Dict[int, dict] = {}
+
+    def intern(drawableId: int, metadata: dict) -> int:
+        others = {k: v for k, v in metadata.items() if k != "name"}
+        if others:
+            extra[drawableId] = others
+        name = metadata.get("name") or ""
+        if name not in lookup:
+            lookup[name] = len(strings)
+            strings.append(name)
+        return lookup[name]
+
+    def chunked(kind, dtype, row):
+        chunk = []
+        for drawable in model.drawables:
+            if isinstance(drawable, kind):
+                chunk.append(row(drawable))
+                if len(chunk) == CHUNK_RECORDS:
+                    yield np.array(chunk, dtype)
+                    chunk = []
+        if chunk:
+            yield np.array(chunk, dtype)
+
+    def boxRow(box: BoxDrawable):
+        boxId = model.id_of(box)
+        r = box.rect.normalized()
+        return (boxId, r.x(), r.y(), r.width(), r.height(), intern(boxId, box.metadata), 0)
+
+    def linkRow(link: LinkDrawable):
+        linkId = model.id_of(link)
+        return (linkId, model.id_of(link.box1), model.id_of(link.box2), intern(linkId, link.metadata), 0)
+
+    return chunked(BoxDrawable, BOX_RECORD, boxRow), chunked(LinkDrawable, LINK_RECORD, linkRow), strings, extra
+
+
+def _in_id_order(boxChunks: Iterator[np.ndarray], linkChunks: Iterator[np.ndarray]) -> Iterator[Tuple[bool, tuple]]:
+    """(is box, record) pairs of the box and link records together, by id, i.e. in z-order."""
+    boxes = np.concatenate([np.empty(0, BOX_RECORD), *boxChunks])
+    links = np.concatenate([np.empty(0, LINK_RECORD), *linkChunks])
+    order = np.argsort(np.concatenate([boxes["id"], links["id"]]), kind="stable").tolist()
+    boxRows, linkRows = boxes.tolist(), links.tolist()
+    n = len(boxRows)
+    for k in order:
+        yield (True, boxRows[k]) if k < n else (False, linkRows[k - n])
+
+
+def save_model(model: ModelDrawable, path: str):
+    """Writes boxes and links chunk by chunk; the string table is written last, once it is complete."""
+    boxChunks, linkChunks, strings, extra = _model_chunks(model)
+    with open(path, "wb") as stream:
+        stream.write(HEADER.pack(MAGIC, VERSION, 0))
+        for chunk in boxChunks:
+            _write_chunk(stream, b"BOXS", len(chunk), chunk.tobytes())
+        for chunk in linkChunks:
+            _write_chunk(stream, b"LNKS", len(chunk), chunk.tobytes())
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, "<u8")
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        _write_chunk(stream, b"STRS", len(encoded), offsets.tobytes() + b"".join(encoded))
+        if extra:
+            _write_chunk(stream, b"META", len(extra), json.dumps(extra).encode("utf-8"))
+
+
+def load_model(path: str, columnar: bool = True) -> ModelDrawable:
+    """
+    Builds a model from a binary model file in one pass, keeping the stored ids.
+    Each record chunk is inserted in bulk, so listeners see one notification per chunk.
+    """
+    with ModelFile(path) as f:
+        strings = f.strings()
+        extra = f.metadata()
+        if columnar:
+            model = ColumnarModelDrawable(max(f.box_count(), f.link_count(), 1))
+            nameMap = np.array([model.names.intern(s) for s in strings] or [0], np.int32)
+            for chunk in f.box_chunks():
+                model.add_boxes(chunk["x"], chunk["y"], chunk["w"], chunk["h"], nameMap[chunk["name"]], ids=chunk["id"])
+            for chunk in f.link_chunks():
+                model.add_links(chunk["source"], chunk["target"], nameMap[chunk["name"]], ids=chunk["id"])
+            model.extraMetadata.update(extra)
+            return model
+
+        model = ModelDrawable()
+        boxes: Dict[int, BoxDrawable] = {}
+        for chunk in f.box_chunks():
+            for boxId, x, y, w, h, name, _ in chunk.tolist():
+                boxes[boxId] = BoxDrawable(QRectF(x, y, w, h), {"name": strings[name], **extra.get(boxId, {})})
+        # Boxes and links are inserted together by id, so `drawables` keeps the saved z-order.
+        ids, drawables = [], []
+        for isBox, record in _in_id_order(f.box_chunks(), f.link_chunks()):
+            if isBox:
+                drawables.append(boxes[record[0]])
+            else:
+                linkId, source, target, name, _ = record
+                drawables.append(LinkDrawable(boxes[source], boxes[target],
+                                              {"name": strings[name], **extra.get(linkId, {})}))
+            ids.append(record[0])
+            if len(drawables) == CHUNK_RECORDS:
+                model.add_drawables(drawables, ids)
+                ids, drawables = [], []
+        if drawables:
+            model.add_drawables(drawables, ids)
+        return model
+
+
+def export_ndjson(model: ModelDrawable, stream: TextIO):
+    """Streams the model as one JSON object per line, boxes and links in z-order."""
+    boxChunks, linkChunks, strings, extra = _model_chunks(model)
+    for isBox, row in _in_id_order(boxChunks, linkChunks):
+        if isBox:
+            drawableId, x, y, w, h, name, _ = row
+            record = {"type": "box", "id": drawableId, "x": x, "y": y, "w": w, "h": h, "name": strings[name]}
+        else:
+            drawableId, source, target, name, _ = row
+            record = {"type": "link", "id": drawableId, "source": source, "target": target, "name": strings[name]}
+        if drawableId in extra:
+            record["metadata"] = extra[drawableId]
+        stream.write(json.dumps(record) + "\n")
+
+
+def import_ndjson(stream: TextIO, model: Optional[ModelDrawable] = None) -> ModelDrawable:
+    """
+    Reads line-delimited JSON into `model` (a new columnar model by default).
+    Ids in the stream are only used to resolve link endpoints; drawables get fresh ids in the model,
+    allocated in stream order so the z-order of the stream is kept. Drawables are inserted in bulk.
+    """
+    if model is None:
+        model = ColumnarModelDrawable()
+    boxIds, boxes, boxExtra = [], [], []
+    links, linkExtra = [], []
+    # Position of each record in the stream, which gives its new id.
+    boxOrder, linkOrder = [], []
+    for line in stream:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record["type"] == "box":
+            boxOrder.append(len(boxOrder) + len(linkOrder))
+            boxIds.append(record["id"])
+            boxes.append((record["x"], record["y"], record["w"], record["h"], record.get("name", "")))
+            boxExtra.append(record.get("metadata"))
+        elif record["type"] == "link":
+            linkOrder.append(len(boxOrder) + len(linkOrder))
+            links.append((record["source"], record["target"], record.get("name", "")))
+            linkExtra.append(record.get("metadata"))
+        else:
+            raise ValueError(f"unknown record type {record['type']!r}")
+    first = model.next_id()
+    newBoxIds = [first + k for k in boxOrder]
+    newLinkIds = [first + k for k in linkOrder]
+    mapping = dict(zip(boxIds, newBoxIds))
+
+    if isinstance(model, ColumnarModelDrawable):
+        x, y, w, h = (np.array([b[i] for b in boxes], np.float64) for i in range(4))
+        model.add_boxes(x, y, w, h, [b[4] for b in boxes], ids=np.array(newBoxIds, np.int64))
+        model.add_links([mapping[l[0]] for l in links], [mapping[l[1]] for l in links],
+                        [l[2] for l in links], ids=np.array(newLinkIds, np.int64))
+        for drawableId, metadata in zip(newBoxIds + newLinkIds, boxExtra + linkExtra):
+            if metadata:
+                model.extraMetadata[drawableId] = metadata
+        return model
+
+    created = {}
+    for newId, (x, y, w, h, name), metadata in zip(newBoxIds, boxes, boxExtra):
+        created[newId] = BoxDrawable(QRectF(x, y, w, h), {"name": name, **(metadata or {})})
+    for newId, (source, target, name), metadata in zip(newLinkIds, links, linkExtra):
+        created[newId] = LinkDrawable(created[mapping[source]], created[mapping[target]],
+                                      {"name": name, **(metadata or {})})
+    ordered = sorted(created)
+    model.add_drawables([created[i] for i in ordered], ordered)
+    return model
@@ -0,0 +1,204 @@
+import ast
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import tracing
+
+log = tracing.get_logger("plugins")
+
+# Entry point group of installed tool plugins: `<tool name> = "<module>:<drawable class>"`.
+ENTRY_POINT_GROUP = "canvas.tools"
+MANIFEST_VERSION = 1
+
+
+class ToolSpec(NamedTuple):
+    """
+    A tool known by name only: its drawable class is `attribute` of `module`, an importable module
+    name, or the plugin file `path` when set. Nothing is imported until `load_drawable_class()`.
+    """
+    name: str
+    module: str
+    attribute: str
+    path: Optional[str] = None
+
+
+def load_drawable_class(spec: ToolSpec) -> type:
+    """Imports the module of a tool and returns its drawable class."""
+    if spec.path is None:
+        module = importlib.import_module(spec.module)
+    else:
+        module = sys.modules.get(spec.module)
+        if module is None:
+            moduleSpec = importlib.util.spec_from_file_location(spec.module, spec.path)
+            module = importlib.util.module_from_spec(moduleSpec)
+            sys.modules[spec.module] = module
+            try:
+                moduleSpec.loader.exec_module(module)
+            except BaseException:
+                del sys.modules[spec.module]
+                raise
+    return getattr(module, spec.attribute)
+
+
+def plugin_module_name(path: str) -> str:
+    """
+    The module name a plugin file is imported under: its file name plus a hash of its absolute path,
+    so files of the same name in different plugin directories stay distinct modules.
+    """
+    path = os.path.abspath(path)
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+    return f"canvas_plugin_{os.path.splitext(os.path.basename(path))[0]}_{digest}"
+
+
+def declared_tools(path: str) -> Dict[str, str]:
+    """
+    Reads the TOOLS literal of a plugin file without importing it, e.g.
+    `TOOLS = {"Ellipse": "EllipseDrawable"}` maps tool names to drawable classes of the file.
+    """
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == "TOOLS" for t in node.targets):
+            tools = ast.literal_eval(node.value)
+            if not (isinstance(tools, dict) and all(isinstance(k, str) and isinstance(v, str)
+                                                    for k, v in tools.items())):
+                raise ValueError("TOOLS must map tool names to drawable class names")
+            return tools
+    raise ValueError("no TOOLS declaration")
+
+
+def default_plugin_dirs() -> List[str]:
+    """The `plugins` directory next to this file, then the CANVAS_PLUGIN_PATH entries."""
+    dirs = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "plugins")]
+    dirs += [d for d in os.environ.get("CANVAS_PLUGIN_PATH", "").split(os.pathsep) if d]
+    return dirs
+
+
+def default_manifest_path() -> str:
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache, "canvas", "plugin_manifest.json")
+
+
+class PluginManager:
+    """
+    Discovers tools from built-in specs, installed entry points (ENTRY_POINT_GROUP) and plugin
+    files (`*.py` declaring TOOLS, see declared_tools) in `pluginDirs`, without importing them.
+
+    What discovery found is cached in a JSON manifest: plugin files are only parsed again when
+    their size or modification time changes, and entry points are only enumerated again when a
+    directory of sys.path changes (a package was installed or removed). A warm start therefore
+    costs one stat per plugin file and directory, whatever the plugins contain.
+    """
+
+    def __init__(self, builtins: Iterable[ToolSpec] = (), pluginDirs: Optional[List[str]] = None,
+                 manifestPath: Optional[str] = None, entryPoints: bool = True):
+        self.builtins = list(builtins)
+        self.pluginDirs = default_plugin_dirs() if pluginDirs is None else pluginDirs
+        self.manifestPath = default_manifest_path() if manifestPath is None else manifestPath
+        self.entryPoints = entryPoints
+        self.manifest = {}
+        self._dirty = False
+
+    def discover(self) -> List[ToolSpec]:
+        """Every known tool, built-ins first; a name already taken by an earlier tool is skipped."""
+        self.manifest = self._read_manifest()
+        self._dirty = False
+        specs = list(self.builtins)
+        if self.entryPoints:
+            specs += self._entry_point_specs()
+        for directory in self.pluginDirs:
+            specs += self._directory_specs(directory)
+        if self._dirty:
+            self._write_manifest()
+        tools = {}
+        for spec in specs:
+            if spec.name in tools:
+                log.warning("tool %s from %s ignored: name already used by %s", spec.name,
+                            spec.path or spec.module, tools[spec.name].path or tools[spec.name].module)
+            else:
+                tools[spec.name] = spec
+        return list(tools.values())
+
+    def tools(self, parent=None) -> list:
+        """Discovers the tools and wraps each in a LazyTool, ready for its activation button."""
+        from Tool import LazyTool
+        return [LazyTool(spec, parent) for spec in self.discover()]
+
+    # ------------------ discovery ------------------
+
+    def _entry_point_specs(self) -> List[ToolSpec]:
+        # sys.path[0] is the script directory, which holds no installed distributions and changes often.
+        fingerprint = [[d, _mtime(d)] for d in sys.path[1:] if d and os.path.isdir(d)]
+        cached = self.manifest.get("entry_points")
+        if cached is None or cached["fingerprint"] != fingerprint:
+            from importlib.metadata import entry_points
+            tools = []
+            for entryPoint in sorted(entry_points(group=ENTRY_POINT_GROUP), key=lambda e: e.name):
+                module, _, attribute = entryPoint.value.partition(":")
+                tools.append([entryPoint.name, module.strip(), attribute.strip()])
+            cached = self.manifest["entry_points"] = {"fingerprint": fingerprint, "tools": tools}
+            self._dirty = True
+        return [ToolSpec(name, module, attribute) for name, module, attribute in cached["tools"]]
+
+    def _directory_specs(self, directory: str) -> List[ToolSpec]:
+        try:
+            names = sorted(n for n in os.listdir(directory) if n.endswith(".py") and not n.startswith("_"))
+        except OSError:
+            return []
+        files = self.manifest.setdefault("files", {})
+        specs = []
+        for name in names:
+            path = os.path.abspath(os.path.join(directory, name))
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = files.get(path)
+            if entry is None or entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                try:
+                    tools = declared_tools(path)
+                except (OSError, SyntaxError, ValueError) as e:
+                    log.warning("plugin %s skipped: %s", path, e)
+                    tools = {}
+                entry = files[path] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "tools": tools}
+                self._dirty = True
+            module = plugin_module_name(path)
+            specs += [ToolSpec(tool, module, attribute, path) for tool, attribute in entry["tools"].items()]
+        return specs
+
+    # ------------------ manifest ------------------
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifestPath, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {"version": MANIFEST_VERSION}
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {"version": MANIFEST_VERSION}
+        return manifest
+
+    def _write_manifest(self):
+        # Files gone from the plugin directories are dropped.
+        files = self.manifest.get("files", {})
+        self.manifest["files"] = {path: entry for path, entry in files.items() if os.path.exists(path)}
+        try:
+            os.makedirs(os.path.dirname(self.manifestPath), exist_ok=True)
+            temporary = self.manifestPath + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(json.dumps(self.manifest))
+            os.replace(temporary, self.manifestPath)
+        except OSError as e:
+            log.warning("plugin manifest %s not written: %s", self.manifestPath, e)
+
+
+def _mtime(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
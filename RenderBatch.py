@@ -0,0 +1,134 @@
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from PySide6.QtCore import QLineF, QPointF, QRectF, Qt
+from PySide6.QtGui import QColor, QPainter, QPen
+
+from TextCache import text_cache
+
+_TOP_LEFT = Qt.AlignLeft | Qt.AlignTop
+
+
+class DrawStyle(NamedTuple):
+    color: str
+    width: float
+    cosmetic: bool = False
+
+    def overridden(self, override: Optional[dict]) -> "DrawStyle":
+        """This style with the fields set in `override`; keys that are not DrawStyle fields are ignored."""
+        if not override:
+            return self
+        return self._replace(**{k: v for k, v in override.items() if k in self._fields})
+
+
+class RenderBatch:
+    """
+    Collects drawable geometry grouped by style and emits it with one bulk
+    QPainter call per (primitive, style) group.
+
+    Drawables describe themselves through `Drawable.batch()` instead of
+    painting one at a time. The batch also carries the render parameters
+    drawables need for level-of-detail decisions (`scale`, `lodTextMinPixels`),
+    and optionally the routed polylines of links (`routeOf`, see LinkRouter).
+    Groups are flushed as rects, lines, points, then texts, so labels stay on
+    top of the geometry.
+    """
+
+    # QPen objects shared by every batch, across frames.
+    _pens: Dict[DrawStyle, QPen] = {}
+
+    def __init__(self, scale: float = 1.0, lodTextMinPixels: float = 0.0):
+        self.scale = scale
+        self.lodTextMinPixels = lodTextMinPixels
+        self.rects: Dict[DrawStyle, List[QRectF]] = defaultdict(list)
+        self.lines: Dict[DrawStyle, List[QLineF]] = defaultdict(list)
+        self.points: Dict[DrawStyle, List[QPointF]] = defaultdict(list)
+        self.texts: Dict[DrawStyle, List[Tuple[QRectF, int, str]]] = defaultdict(list)
+        # Routed polyline of a link drawable, or None to draw it straight.
+        self.routeOf: Optional[Callable[[object], Optional[List[QPointF]]]] = None
+
+    @classmethod
+    def pen_for(cls, style: DrawStyle) -> QPen:
+        pen = cls._pens.get(style)
+        if pen is None:
+            pen = QPen(QColor(style.color))
+            pen.setWidthF(style.width)
+            pen.setCosmetic(style.cosmetic)
+            cls._pens[style] = pen
+        return pen
+
+    def add_rect(self, style: DrawStyle, rect: QRectF):
+        self.rects[style].append(rect)
+
+    def add_line(self, style: DrawStyle, line: QLineF):
+        self.lines[style].append(line)
+
+    def add_polyline(self, style: DrawStyle, points: List[QPointF]):
+        lines = self.lines[style]
+        for i in range(1, len(points)):
+            lines.append(QLineF(points[i - 1], points[i]))
+
+    def route_of(self, link) -> Optional[List[QPointF]]:
+        return self.routeOf(link) if self.routeOf is not None else None
+
+    def add_point(self, style: DrawStyle, point: QPointF):
+        self.points[style].append(point)
+
+    def add_text(self, style: DrawStyle, rect: QRectF, flags: int, text: str):
+        self.texts[style].append((rect, flags, text))
+
+    def detached(self) -> "RenderBatch":
+        """
+        A copy of the batch holding its own geometry instead of references to drawable state,
+        so it can be flushed from another thread while the model keeps changing.
+        """
+        copy = RenderBatch(self.scale, self.lodTextMinPixels)
+        for style, rects in self.rects.items():
+            copy.rects[style] = [QRectF(r) for r in rects]
+        for style, lines in self.lines.items():
+            copy.lines[style] = [QLineF(l) for l in lines]
+        for style, points in self.points.items():
+            copy.points[style] = [QPointF(p) for p in points]
+        for style, texts in self.texts.items():
+            copy.texts[style] = [(QRectF(r), flags, text) for r, flags, text in texts]
+        return copy
+
+    def flush_texts(self, painter: QPainter):
+        """
+        Paints the labels. Top-left aligned ones (box names) are drawn from cached, pre-shaped
+        QStaticText elided to their rect width (see TextCache), so unchanged labels are not laid out again.
+        """
+        cache = text_cache()
+        font = painter.font()
+        fontKey = font.key()
+        for style, texts in self.texts.items():
+            painter.setPen(self.pen_for(style))
+            for rect, flags, text in texts:
+                if flags == _TOP_LEFT:
+                    staticText = cache.get(text, rect.width(), font, fontKey, self.scale)
+                    if staticText is not None:
+                        painter.drawStaticText(rect.topLeft(), staticText)
+                else:
+                    painter.drawText(rect, flags, text)
+
+    def is_empty(self) -> bool:
+        return not (self.rects or self.lines or self.points or self.texts)
+
+    def flush(self, painter: QPainter):
+        """Paints every group and empties the batch."""
+        painter.setBrush(Qt.NoBrush)
+        for style, rects in self.rects.items():
+            painter.setPen(self.pen_for(style))
+            painter.drawRects(rects)
+        for style, lines in self.lines.items():
+            painter.setPen(self.pen_for(style))
+            painter.drawLines(lines)
+        for style, points in self.points.items():
+            painter.setPen(self.pen_for(style))
+            painter.drawPoints(points)
+        if self.texts:
+            self.flush_texts(painter)
+        self.rects.clear()
+        self.lines.clear()
+        self.points.clear()
+        self.texts.clear()
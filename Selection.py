@@ -0,0 +1,81 @@
+from typing import Callable, Iterable
+
+import numpy as np
+from PySide6.QtCore import QRectF
+
+from Drawable import Drawable
+from ModelDrawable import ModelDrawable
+
+
+class Selection:
+    """
+    Set of selected drawable ids of a model, kept as a sorted id array so bulk edits
+    (History.move, remove, restyle) take it as is. Ids removed from the model are dropped.
+    """
+
+    def __init__(self, model: ModelDrawable):
+        self.model = None
+        self.ids = np.empty(0, np.int64)
+        # Callables notified after every change of the selected ids.
+        self.listeners = []
+        self.set_model(model)
+
+    def set_model(self, model: ModelDrawable):
+        if self.model is not None:
+            self.model.remove_listener(self._onModelChanged)
+        self.model = model
+        model.add_listener(self._onModelChanged)
+        self.clear()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def _notify(self):
+        for listener in self.listeners:
+            listener()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, drawableId: int) -> bool:
+        i = np.searchsorted(self.ids, drawableId)
+        return i < len(self.ids) and self.ids[i] == drawableId
+
+    def contains_drawable(self, drawable: Drawable) -> bool:
+        return drawable is not None and self.model.id_of(drawable) in self
+
+    def set(self, ids: Iterable[int], add: bool = False):
+        """Selects `ids`, replacing the selection or, with `add`, extending it."""
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, np.int64)
+        self.ids = np.union1d(self.ids, ids) if add else np.unique(ids)
+        self._notify()
+
+    def remove(self, ids: Iterable[int]):
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, np.int64)
+        self.ids = np.setdiff1d(self.ids, ids, assume_unique=True)
+        self._notify()
+
+    def clear(self):
+        self.ids = np.empty(0, np.int64)
+        self._notify()
+
+    def select_rect(self, rect: QRectF, add: bool = False, contained: bool = True):
+        """Rubber-band selection of the drawables inside a model rect (intersecting it when not `contained`)."""
+        self.set(self.model.ids_in_rect(rect, contained), add)
+
+    def select_where(self, predicate: Callable[[Drawable], bool], add: bool = False):
+        self.set(self.model.ids_where(predicate), add)
+
+    def select_all(self):
+        self.set(self.model.all_ids())
+
+    def _onModelChanged(self, rects):
+        if not len(self.ids):
+            return
+        existing = self.model.existing_ids(self.ids)
+        if len(existing) != len(self.ids):
+            self.ids = existing
+            self._notify()
@@ -0,0 +1,342 @@
+import math
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from PySide6.QtCore import QPointF, QRectF
+
+# (left, top, right, bottom) in model coordinates.
+Bounds = Tuple[float, float, float, float]
+# (x1, y1, x2, y2) in model coordinates.
+Segment = Tuple[float, float, float, float]
+
+
+def rect_to_bounds(rect: QRectF) -> Bounds:
+    rect = rect.normalized()
+    return (rect.left(), rect.top(), rect.right(), rect.bottom())
+
+
+def bounds_to_rect(bounds: Bounds) -> QRectF:
+    return QRectF(bounds[0], bounds[1], bounds[2] - bounds[0], bounds[3] - bounds[1])
+
+
+def segment_cells(segment: Segment, size: float) -> List[Tuple[int, int]]:
+    """The grid cells of side `size` that a segment passes through, walking it column by column."""
+    x1, y1, x2, y2 = segment
+    if x2 < x1:
+        x1, y1, x2, y2 = x2, y2, x1, y1
+    floor = math.floor
+    first, last = floor(x1 / size), floor(x2 / size)
+    # y of the segment where it enters and leaves each column.
+    if first == last:
+        ys = [y1, y2]
+    else:
+        slope = (y2 - y1) / (x2 - x1)
+        ys = [y1] + [y1 + (cx * size - x1) * slope for cx in range(first + 1, last + 1)] + [y2]
+    cells = []
+    for i, cx in enumerate(range(first, last + 1)):
+        a, b = ys[i], ys[i + 1]
+        if a > b:
+            a, b = b, a
+        cells.extend([(cx, cy) for cy in range(floor(a / size), floor(b / size) + 1)])
+    return cells
+
+
+class GridIndex:
+    """
+    Hierarchical uniform grid spatial index keyed on bounding rects.
+
+    Level l has cells of `cellSize * 2**l`, and each key is registered at the finest level where it
+    covers at most `maxCellsPerItem` cells: the cells its bounds overlap or, for keys indexed with
+    segments (e.g. links), only the cells the segments cross. A point query looks up one cell per
+    populated level, so it costs O(levels + k) and a rect query O(cells + k), independent of model
+    size, and a long diagonal link is only found near its line rather than anywhere in its bounds.
+    """
+
+    def __init__(self, cellSize: float = 256.0, maxCellsPerItem: int = 64):
+        self.cellSize = cellSize
+        self.maxCellsPerItem = maxCellsPerItem
+        # Cells of each populated level: level -> {(cx, cy): keys}.
+        self.levels: Dict[int, Dict[Tuple[int, int], Set[Hashable]]] = {}
+        self.bounds: Dict[Hashable, Bounds] = {}
+        # Level of the keys above level 0, and segments of the keys indexed with segments.
+        self.levelOf: Dict[Hashable, int] = {}
+        self.segments: Dict[Hashable, Tuple[Segment, ...]] = {}
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __contains__(self, key):
+        return key in self.bounds
+
+    def _cell_size(self, level: int) -> float:
+        return self.cellSize * (1 << level)
+
+    def _cell_range(self, bounds: Bounds, level: int = 0):
+        size = self._cell_size(level)
+        return (math.floor(bounds[0] / size), math.floor(bounds[1] / size),
+                math.floor(bounds[2] / size), math.floor(bounds[3] / size))
+
+    def _cells(self, bounds: Bounds, segments: Optional[Tuple[Segment, ...]], level: int):
+        """The cells a key covers at a level, or None when they are more than `maxCellsPerItem`."""
+        if segments is None:
+            cx1, cy1, cx2, cy2 = self._cell_range(bounds, level)
+            if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > self.maxCellsPerItem:
+                return None
+            return [(cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)]
+        size = self._cell_size(level)
+        if len(segments) == 1:
+            cells = segment_cells(segments[0], size)
+            return cells if len(cells) <= self.maxCellsPerItem else None
+        cells = set()
+        for segment in segments:
+            cells.update(segment_cells(segment, size))
+            if len(cells) > self.maxCellsPerItem:
+                return None
+        return cells
+
+    def _min_level(self, bounds: Bounds, segments: Optional[Tuple[Segment, ...]]) -> int:
+        """A lower bound of the level of a key, so that most keys are rasterized once."""
+        if segments is None:
+            # At least area / size² cells.
+            ratio = math.sqrt((bounds[2] - bounds[0]) * (bounds[3] - bounds[1]) / self.maxCellsPerItem) / self.cellSize
+        else:
+            # At least about (|dx| + |dy|) / size - 1 cells per segment.
+            length = sum(abs(x2 - x1) + abs(y2 - y1) for x1, y1, x2, y2 in segments)
+            ratio = length / (self.maxCellsPerItem + 2) / self.cellSize
+        return math.ceil(math.log2(ratio)) if ratio > 1 else 0
+
+    def insert(self, key: Hashable, rect: QRectF, segments: Optional[Iterable[Segment]] = None):
+        """Indexes a key by its bounds or, when given, by the cells its segments (within the bounds) cross."""
+        if key in self.bounds:
+            self.remove(key)
+        bounds = rect_to_bounds(rect)
+        self.bounds[key] = bounds
+        if segments is not None:
+            segments = self.segments[key] = tuple(segments)
+        level = self._min_level(bounds, segments)
+        cells = self._cells(bounds, segments, level)
+        while cells is None:
+            level += 1
+            cells = self._cells(bounds, segments, level)
+        if level:
+            self.levelOf[key] = level
+        grid = self.levels.get(level)
+        if grid is None:
+            self.levels[level] = grid = {}
+        for c in cells:
+            cell = grid.get(c)
+            if cell is None:
+                grid[c] = cell = set()
+            cell.add(key)
+
+    def remove(self, key: Hashable):
+        bounds = self.bounds.pop(key, None)
+        if bounds is None:
+            return
+        level = self.levelOf.pop(key, 0)
+        segments = self.segments.pop(key, None)
+        grid = self.levels[level]
+        for c in self._cells(bounds, segments, level):
+            cell = grid.get(c)
+            if cell is not None:
+                cell.discard(key)
+                if not cell:
+                    del grid[c]
+        if not grid:
+            del self.levels[level]
+
+    def update(self, key: Hashable, rect: QRectF, segments: Optional[Iterable[Segment]] = None):
+        """Re-index a key after its geometry changed."""
+        old = self.bounds.get(key)
+        bounds = rect_to_bounds(rect)
+        # Small moves of rects usually stay within the same cells: only the stored bounds change.
+        if old is not None and segments is None and key not in self.segments:
+            level = self.levelOf.get(key, 0)
+            if self._cell_range(old, level) == self._cell_range(bounds, level):
+                self.bounds[key] = bounds
+                return
+        self.insert(key, rect, segments)
+
+    def clear(self):
+        self.levels.clear()
+        self.bounds.clear()
+        self.levelOf.clear()
+        self.segments.clear()
+
+    def query_point(self, point: QPointF) -> Set[Hashable]:
+        """Returns the keys whose bounds contain the point (and, for segment keys, whose segments cross its cell)."""
+        x, y = point.x(), point.y()
+        result = set()
+        for level, grid in self.levels.items():
+            size = self._cell_size(level)
+            for key in grid.get((math.floor(x / size), math.floor(y / size)), ()):
+                b = self.bounds[key]
+                if b[0] <= x <= b[2] and b[1] <= y <= b[3]:
+                    result.add(key)
+        return result
+
+    def query_rect(self, rect: QRectF) -> Set[Hashable]:
+        """Returns the keys whose bounds intersect the rect (and, for segment keys, whose segments cross its cells)."""
+        qb = rect_to_bounds(rect)
+        result = set()
+        for level, grid in self.levels.items():
+            cx1, cy1, cx2, cy2 = self._cell_range(qb, level)
+            if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(grid):
+                # Query area larger than the populated grid: walk the populated cells instead.
+                candidates = (key for (cx, cy), cell in grid.items()
+                              if cx1 <= cx <= cx2 and cy1 <= cy <= cy2 for key in cell)
+            else:
+                candidates = (key for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)
+                              for key in grid.get((cx, cy), ()))
+            for key in candidates:
+                if key in result:
+                    continue
+                b = self.bounds[key]
+                if b[0] <= qb[2] and qb[0] <= b[2] and b[1] <= qb[3] and qb[1] <= b[3]:
+                    result.add(key)
+        return result
+
+
+# Cell coordinates are packed into int64 keys: 13 bits of level, then 25 bits per axis.
+_AXIS_BITS = 25
+_AXIS_OFFSET = 1 << (_AXIS_BITS - 1)
+_AXIS_MAX = (1 << _AXIS_BITS) - 1
+
+
+def _cell_keys(level, cx, cy) -> np.ndarray:
+    cx = np.clip(cx + _AXIS_OFFSET, 0, _AXIS_MAX)
+    cy = np.clip(cy + _AXIS_OFFSET, 0, _AXIS_MAX)
+    return (np.asarray(level, np.int64) << (2 * _AXIS_BITS)) | (cx << _AXIS_BITS) | cy
+
+
+def _expand(counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """For items with the given counts: the item of each expanded entry, and its index within the item."""
+    item = np.repeat(np.arange(len(counts)), counts)
+    return item, np.arange(len(item)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+class CellIndex:
+    """
+    Vectorized counterpart of GridIndex for coordinate columns: (cell, key) pairs sorted by cell.
+
+    It is built in one pass from arrays of bounds, or of segments, with the same levels as GridIndex:
+    each key is registered at the finest level where it covers at most `maxCellsPerItem` cells, and
+    segments only in the cells they cross. The index is static; queries return the candidate keys
+    of the cells they touch, which callers test against the current geometry.
+    """
+
+    def __init__(self, cellSize: float = 256.0, maxCellsPerItem: int = 64):
+        self.cellSize = cellSize
+        self.maxCellsPerItem = maxCellsPerItem
+        self.cells = np.zeros(0, np.int64)
+        self.keys = np.zeros(0, np.int64)
+        # Populated levels, and the (min cx, min cy, max cx, max cy) of each one's cells.
+        self.extents: Dict[int, Tuple[int, int, int, int]] = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _min_levels(self, ratio: np.ndarray) -> np.ndarray:
+        """Smallest levels l with ratio <= 2**l (see GridIndex._min_level)."""
+        levels = np.zeros(len(ratio), np.int64)
+        big = ratio > 1
+        levels[big] = np.ceil(np.log2(ratio[big]))
+        return levels
+
+    def _rect_cells(self, bounds, levels):
+        size = self.cellSize * np.exp2(levels)
+        left, top, right, bottom = (np.floor(b / size).astype(np.int64) for b in bounds)
+        return left, top, right - left + 1, bottom - top + 1
+
+    def _segment_columns(self, segments, levels):
+        """Per (segment, column) crossed: the segment, cx, and the first and last cy."""
+        x1, y1, x2, y2 = segments
+        swap = x2 < x1
+        x1, x2 = np.where(swap, x2, x1), np.where(swap, x1, x2)
+        y1, y2 = np.where(swap, y2, y1), np.where(swap, y1, y2)
+        size = self.cellSize * np.exp2(levels)
+        first = np.floor(x1 / size).astype(np.int64)
+        item, within = _expand(np.floor(x2 / size).astype(np.int64) - first + 1)
+        cx = first[item] + within
+        s = size[item]
+        dx = (x2 - x1)[item]
+        slope = np.divide((y2 - y1)[item], dx, out=np.zeros_like(dx), where=dx > 0)
+        sx1, sy1 = x1[item], y1[item]
+        ya = np.where(dx > 0, sy1 + (np.maximum(sx1, cx * s) - sx1) * slope, sy1)
+        yb = np.where(dx > 0, sy1 + (np.minimum(x2[item], (cx + 1) * s) - sx1) * slope, y2[item])
+        lo = np.floor(np.minimum(ya, yb) / s).astype(np.int64)
+        hi = np.floor(np.maximum(ya, yb) / s).astype(np.int64)
+        return item, cx, lo, hi
+
+    def build(self, keys: np.ndarray, bounds: Tuple[np.ndarray, ...], segments: Optional[Tuple[np.ndarray, ...]] = None):
+        """Indexes keys by their (left, top, right, bottom) arrays or, when given, their (x1, y1, x2, y2) segments."""
+        keys = np.asarray(keys, np.int64)
+        if not len(keys):
+            self.cells = np.empty(0, np.int64)
+            self.keys = keys
+            self.extents = {}
+            return
+        cap = self.maxCellsPerItem
+        if segments is None:
+            left, top, right, bottom = bounds
+            levels = self._min_levels(np.sqrt((right - left) * (bottom - top) / cap) / self.cellSize)
+        else:
+            x1, y1, x2, y2 = segments
+            levels = self._min_levels((np.abs(x2 - x1) + np.abs(y2 - y1)) / (cap + 2) / self.cellSize)
+        # Items still to place, moved one level up while they cover too many cells.
+        todo = np.arange(len(keys))
+        parts = []
+        while len(todo):
+            level = levels[todo]
+            if segments is None:
+                cx, cy, w, h = self._rect_cells([b[todo] for b in bounds], level)
+                over = w * h > cap
+                item, within = _expand(np.where(over, 0, w * h))
+                cellX = cx[item] + within // h[item]
+                cellY = cy[item] + within % h[item]
+            else:
+                item, cx, lo, hi = self._segment_columns([s[todo] for s in segments], level)
+                over = np.bincount(item, hi - lo + 1, len(todo)) > cap
+                column, within = _expand(np.where(over[item], 0, hi - lo + 1))
+                item = item[column]
+                cellX = cx[column]
+                cellY = lo[column] + within
+            parts.append((todo[item], level[item], cellX, cellY))
+            todo = todo[over]
+            levels[todo] += 1
+        item, level, cellX, cellY = (np.concatenate(p) for p in zip(*parts))
+        cells = _cell_keys(level, cellX, cellY)
+        order = np.argsort(cells)
+        self.cells = cells[order]
+        self.keys = keys[item[order]]
+        self.extents = {}
+        # Cells are sorted by level, then column, then row.
+        levelOf = self.cells >> (2 * _AXIS_BITS)
+        bounds = np.flatnonzero(np.diff(levelOf)) + 1
+        for begin, end in zip([0] + bounds.tolist(), bounds.tolist() + [len(self.cells)]):
+            rows = (self.cells[begin:end] & _AXIS_MAX) - _AXIS_OFFSET
+            columns = ((self.cells[[begin, end - 1]] >> _AXIS_BITS) & _AXIS_MAX) - _AXIS_OFFSET
+            self.extents[int(levelOf[begin])] = (int(columns[0]), int(rows.min()), int(columns[1]), int(rows.max()))
+
+    def query_rect(self, left: float, top: float, right: float, bottom: float) -> np.ndarray:
+        """Sorted keys registered in the cells touching the rect."""
+        found = []
+        for level, (minX, minY, maxX, maxY) in self.extents.items():
+            size = self.cellSize * (1 << level)
+            cx1, cy1 = max(math.floor(left / size), minX), max(math.floor(top / size), minY)
+            cx2, cy2 = min(math.floor(right / size), maxX), min(math.floor(bottom / size), maxY)
+            if cx1 > cx2 or cy1 > cy2:
+                continue
+            # One contiguous run of cell keys per column.
+            columns = (np.arange(cx1, cx2 + 1, dtype=np.int64) + _AXIS_OFFSET) << _AXIS_BITS
+            base = level << (2 * _AXIS_BITS)
+            starts = np.searchsorted(self.cells, columns + (base + cy1 + _AXIS_OFFSET), "left")
+            ends = np.searchsorted(self.cells, columns + (base + cy2 + _AXIS_OFFSET), "right")
+            item, within = _expand(ends - starts)
+            found.append(self.keys[starts[item] + within])
+        if not found:
+            return np.zeros(0, np.int64)
+        return np.unique(np.concatenate(found))
+
+    def query_point(self, x: float, y: float) -> np.ndarray:
+        return self.query_rect(x, y, x, y)
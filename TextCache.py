@@ -0,0 +1,89 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QFont, QFontMetricsF, QStaticText
+
+# (text, width, font key, scale bucket)
+TextKey = Tuple[str, float, str, int]
+
+
+class TextCache:
+    """
+    LRU cache of laid out labels, as QStaticText keyed on the font and a bucketed painter scale, so
+    repaints draw pre-shaped glyphs instead of laying every label out again.
+
+    Entries are keyed on the label text itself, so renaming a drawable simply misses the cache and the
+    stale layout ages out. Labels wider than their box are elided once. QStaticText is not thread-safe:
+    use `text_cache()`, which gives each rendering thread its own cache.
+    """
+
+    def __init__(self, maxEntries: int = 4096, bucketsPerOctave: int = 8):
+        self.maxEntries = maxEntries
+        self.bucketsPerOctave = bucketsPerOctave
+        self.entries: "OrderedDict[TextKey, Optional[QStaticText]]" = OrderedDict()
+        # Elided labels by (text, width, font key): elision is in model units, so it holds at every scale.
+        self.elisions: "OrderedDict[Tuple[str, float, str], str]" = OrderedDict()
+        self.metrics: Dict[str, QFontMetricsF] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, text: str, width: float, font: QFont, fontKey: str, scale: float) -> Optional[QStaticText]:
+        """
+        The label laid out in `font` and elided to `width` model units, or None when nothing fits.
+        `fontKey` is font.key(), passed in so callers compute it once per batch.
+        """
+        width = round(width, 1)
+        key = (text, width, fontKey, round(math.log2(scale) * self.bucketsPerOctave))
+        entries = self.entries
+        if key in entries:
+            self.hits += 1
+            entries.move_to_end(key)
+            return entries[key]
+        self.misses += 1
+        text = self.elided(text, width, font, fontKey)
+        staticText = None
+        if text:
+            # Shaped on first draw, then reused while the painter scale stays in the bucket.
+            staticText = QStaticText(text)
+            staticText.setTextFormat(Qt.PlainText)
+        entries[key] = staticText
+        while len(entries) > self.maxEntries:
+            entries.popitem(last=False)
+        return staticText
+
+    def elided(self, text: str, width: float, font: QFont, fontKey: str) -> str:
+        """The label, elided with an ellipsis when wider than `width`; empty when not even that fits."""
+        key = (text, width, fontKey)
+        elisions = self.elisions
+        elided = elisions.get(key)
+        if elided is not None:
+            elisions.move_to_end(key)
+            return elided
+        metrics = self.metrics.get(fontKey)
+        if metrics is None:
+            metrics = self.metrics[fontKey] = QFontMetricsF(font)
+        elided = elisions[key] = metrics.elidedText(text, Qt.ElideRight, width)
+        while len(elisions) > self.maxEntries:
+            elisions.popitem(last=False)
+        return elided
+
+    def clear(self):
+        self.entries.clear()
+        self.elisions.clear()
+
+
+_local = threading.local()
+
+
+def text_cache() -> TextCache:
+    """The text cache of the calling thread."""
+    cache = getattr(_local, "cache", None)
+    if cache is None:
+        cache = _local.cache = TextCache()
+    return cache
@@ -0,0 +1,76 @@
+import math
+from collections import OrderedDict
+from typing import Iterator, Optional, Tuple
+
+from PySide6.QtCore import QRectF
+from PySide6.QtGui import QImage
+
+# (scale bucket, tile x, tile y)
+TileKey = Tuple[int, int, int]
+
+
+class TileCache:
+    """
+    LRU cache of rasterized model tiles.
+
+    Tiles are `tileSize` screen pixels square and are rendered at a bucketed
+    scale, so small zoom changes reuse existing tiles (drawn slightly scaled)
+    instead of re-rasterizing the whole model. Scales are bucketed on a log2
+    grid with `bucketsPerOctave` steps, rounding up so tiles are only ever
+    downsampled.
+    """
+
+    def __init__(self, tileSize: int = 256, maxTiles: int = 512, bucketsPerOctave: int = 8):
+        self.tileSize = tileSize
+        self.maxTiles = maxTiles
+        self.bucketsPerOctave = bucketsPerOctave
+        # How far drawing may spill outside a drawable's bounds, in tile pixels (pens, LOD points).
+        self.bleedPixels = 2.0
+        self.tiles: "OrderedDict[TileKey, QImage]" = OrderedDict()
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def bucket_for(self, scale: float) -> int:
+        return math.ceil(math.log2(scale) * self.bucketsPerOctave - 1e-9)
+
+    def bucket_scale(self, bucket: int) -> float:
+        return 2.0 ** (bucket / self.bucketsPerOctave)
+
+    def tile_model_rect(self, key: TileKey) -> QRectF:
+        bucket, tx, ty = key
+        size = self.tileSize / self.bucket_scale(bucket)
+        return QRectF(tx * size, ty * size, size, size)
+
+    def tiles_for_rect(self, bucket: int, rect: QRectF) -> Iterator[TileKey]:
+        """Keys of the tiles of a bucket covering a model rect."""
+        size = self.tileSize / self.bucket_scale(bucket)
+        for tx in range(math.floor(rect.left() / size), math.floor(rect.right() / size) + 1):
+            for ty in range(math.floor(rect.top() / size), math.floor(rect.bottom() / size) + 1):
+                yield (bucket, tx, ty)
+
+    def get(self, key: TileKey) -> Optional[QImage]:
+        image = self.tiles.get(key)
+        if image is not None:
+            self.tiles.move_to_end(key)
+        return image
+
+    def put(self, key: TileKey, image: QImage):
+        self.tiles[key] = image
+        self.tiles.move_to_end(key)
+        while len(self.tiles) > self.maxTiles:
+            self.tiles.popitem(last=False)
+
+    def touches(self, key: TileKey, rect: QRectF) -> bool:
+        """Whether drawing inside the model rect `rect` can show on the tile, bleed included."""
+        m = self.bleedPixels / self.bucket_scale(key[0])
+        return self.tile_model_rect(key).adjusted(-m, -m, m, m).intersects(rect)
+
+    def invalidate(self, rect: QRectF):
+        """Drops every cached tile, at any scale, whose model rect (plus bleed) touches `rect`."""
+        stale = [key for key in self.tiles if self.touches(key, rect)]
+        for key in stale:
+            del self.tiles[key]
+
+    def clear(self):
+        self.tiles.clear()
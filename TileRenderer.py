@@ -0,0 +1,122 @@
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from PySide6.QtCore import QCoreApplication, QEvent, QObject, QRunnable, QThread, QThreadPool, Signal
+from PySide6.QtGui import QColor, QImage, QPainter
+
+from RenderBatch import RenderBatch
+from TileCache import TileCache, TileKey
+
+
+def rasterize_tile(cache: TileCache, key: TileKey, dpr: float, antialias: bool,
+                   paint: Callable[[QPainter], None]) -> QImage:
+    """Paints one tile into a new image; `paint` draws in model coordinates. Safe to call from any thread."""
+    bucket, tx, ty = key
+    size = cache.tileSize
+    image = QImage(int(size * dpr), int(size * dpr), QImage.Format_RGB32)
+    image.setDevicePixelRatio(dpr)
+    image.fill(QColor("white"))
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing, antialias)
+    painter.translate(-tx * size, -ty * size)
+    scale = cache.bucket_scale(bucket)
+    painter.scale(scale, scale)
+    paint(painter)
+    painter.end()
+    return image
+
+
+class TileJob(QRunnable):
+    """Rasterizes a detached render batch for one tile on a worker thread."""
+
+    def __init__(self, renderer: "TileRenderer", key: TileKey, draft: bool, batch: RenderBatch, dpr: float):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.renderer = renderer
+        self.key = key
+        self.draft = draft
+        self.batch = batch
+        self.dpr = dpr
+        self.cancelled = False
+        self.image: Optional[QImage] = None
+
+    def run(self):
+        if self.cancelled:
+            return
+        self.image = rasterize_tile(self.renderer.cache, self.key, self.dpr, not self.draft, self.batch.flush)
+        try:
+            self.renderer._finished.emit(self)
+        except RuntimeError:
+            # The renderer was destroyed with its widget while this job ran; nobody wants the tile.
+            pass
+
+
+class TileRenderer(QObject):
+    """
+    Pool of worker threads rasterizing model tiles.
+
+    Jobs only hold a detached RenderBatch, an immutable copy of the tile content taken on the GUI thread,
+    so workers never touch the model. Finished tiles are delivered on the GUI thread through `tileReady`;
+    cancelled jobs are dropped from the queue, or their result discarded if they already started.
+    """
+
+    # (tile key, draft, image), on the thread of the renderer.
+    tileReady = Signal(object, bool, QImage)
+    # Emitted by workers; queued to the renderer's thread.
+    _finished = Signal(object)
+
+    def __init__(self, cache: TileCache, workers: Optional[int] = None, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.pool = QThreadPool(self)
+        self.pending: Dict[Tuple[TileKey, bool], TileJob] = {}
+        self.set_workers(workers)
+        self._finished.connect(self._onJobFinished)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
+    def set_workers(self, workers: Optional[int]):
+        """Sets the worker thread count; None uses every core."""
+        self.pool.setMaxThreadCount(workers if workers else QThread.idealThreadCount())
+
+    def workers(self) -> int:
+        return self.pool.maxThreadCount()
+
+    def is_pending(self, key: TileKey, draft: bool) -> bool:
+        return (key, draft) in self.pending
+
+    def submit(self, key: TileKey, draft: bool, batch: RenderBatch, dpr: float):
+        job = TileJob(self, key, draft, batch, dpr)
+        self.pending[(key, draft)] = job
+        self.pool.start(job)
+
+    def cancel_where(self, predicate: Callable[[TileJob], bool]):
+        for jobKey, job in list(self.pending.items()):
+            if predicate(job):
+                job.cancelled = True
+                self.pool.tryTake(job)
+                del self.pending[jobKey]
+
+    def retain(self, keys: Iterable[TileKey]):
+        """Cancels the jobs of tiles not in `keys`, e.g. those no longer in the viewport."""
+        keys = set(keys)
+        self.cancel_where(lambda job: job.key not in keys)
+
+    def cancel_all(self):
+        self.cancel_where(lambda job: True)
+
+    def wait(self):
+        """Blocks until every queued job ran and delivers the finished tiles."""
+        self.pool.waitForDone()
+        QCoreApplication.sendPostedEvents(self, QEvent.MetaCall)
+
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.waitForDone()
+
+    def _onJobFinished(self, job: TileJob):
+        jobKey = (job.key, job.draft)
+        if job.cancelled or self.pending.get(jobKey) is not job:
+            return
+        del self.pending[jobKey]
+        self.tileReady.emit(job.key, job.draft, job.image)
@@ -4,7 +4,11 @@ from PySide6.QtGui import QPen, QColor
 from PySide6.QtWidgets import QPushButton, QWidget, QVBoxLayout, QLabel
 
 from Drawable import BoxDrawable, Drawable, LinkDrawable
-from ModelDrawable import ModelDrawable
+from PluginManager import ToolSpec, load_drawable_class
+import tracing
+
+log = tracing.get_logger("tools")
+
 class Tool:
     def __init__(self, name: str, drawable_class, parent=None):
         raise NotImplementedError
@@ -36,6 +40,8 @@ class MultipointTool(QObject):
         self.name = name
         self.drawable_class = drawable_class
         self.inputs = []
+        # Persistent preview drawable, updated in place through drawable_class.update_preview when supported.
+        self.preview = None
 
     def add_input(self, input_value):
         """Append an input and evaluate the accumulated inputs via the drawable's build() method."""
@@ -46,30 +52,81 @@ class MultipointTool(QObject):
             self.finished.emit(self, drawable)
             # Clear inputs for next construction.
             self.inputs = []
+            self.preview = None
         else:
             # Build incomplete; simply notify listeners of the updated inputs.
+            self.preview = drawable
             self.changed.emit(self,drawable,errors)
 
     def set_last_input(self, input_value):
-        """Append an input and evaluate the accumulated inputs via the drawable's build() method."""
-        errors, drawable = self.drawable_class.build(self.inputs + [input_value])
-        self.changed.emit(self, drawable,errors)
+        """
+        Preview the accumulated inputs plus a tentative last one. The current preview is updated
+        in place when the drawable class supports it, otherwise rebuilt with build().
+        """
+        errors = None
+        if self.preview is not None:
+            errors = self.drawable_class.update_preview(self.preview, self.inputs, input_value)
+        if errors is None:
+            errors, self.preview = self.drawable_class.build(self.inputs + [input_value])
+        self.changed.emit(self, self.preview, errors)
 
     def reset(self):
         self.inputs = []
+        self.preview = None
 
     def create_activation_button(self):
         """Factory method to create a button with the tool's name."""
         btn = QPushButton(f"{self.name}")
         # Prevent button from stealing focus.
         btn.setFocusPolicy(Qt.NoFocus)
-        btn.clicked.connect(lambda: self.activated.emit(self))
+        btn.clicked.connect(self.activate)
         return btn
 
+    def activate(self) -> bool:
+        """Makes this the current tool (emits activated); returns whether it could be activated."""
+        self.activated.emit(self)
+        return True
+
     def create_settings_widget(self):
         """Factory method to create a simple settings widget."""
         widget = QWidget()
         layout = QVBoxLayout(widget)
         label = QLabel(f"{self.name} Settings:")
         layout.addWidget(label)
-        return widget
\ No newline at end of file
+        return widget
+
+
+class LazyTool(MultipointTool):
+    """
+    MultipointTool created from a ToolSpec: only its name is needed for the activation button, and the
+    module defining its drawable class is imported when the tool is first activated.
+    """
+
+    def __init__(self, spec: ToolSpec, parent=None):
+        super().__init__(spec.name, None, parent)
+        self.spec = spec
+
+    @property
+    def drawable_class(self):
+        if self._drawableClass is None:
+            self._drawableClass = load_drawable_class(self.spec)
+        return self._drawableClass
+
+    @drawable_class.setter
+    def drawable_class(self, drawableClass):
+        self._drawableClass = drawableClass
+
+    def is_loaded(self) -> bool:
+        return self._drawableClass is not None
+
+    def load(self) -> type:
+        """Imports the tool's module, if not done yet, and returns its drawable class."""
+        return self.drawable_class
+
+    def activate(self) -> bool:
+        try:
+            self.load()
+        except Exception:
+            log.exception("tool %s could not be loaded from %s", self.name, self.spec.path or self.spec.module)
+            return False
+        return super().activate()
@@ -0,0 +1,311 @@
+"""
+Headless benchmark suite for CanvasQWidget.
+
+Runs offscreen (QT_QPA_PLATFORM=offscreen), painting into a QImage, against synthetic models of
+increasing size, and reports p50/p99 timings per scenario and the peak memory of the process:
+
+    python benchmark.py --sizes 1000,10000,100000,1000000 --output results.json
+    python benchmark.py --sizes 1000,10000 --baseline results.json
+
+Scenarios:
+    paint_cold   first frame, every tile rasterized
+    paint        panning frames over a warm tile cache
+    pointer      get_canvas_pointer_event hit-tests at random screen points
+    wheel        wheel zoom in/out sequences, each event followed by one animation step and a frame
+                 (the interactive path: snapshot plus draft tiles within the frame budget)
+    settle       the full quality frame after a zoom gesture settles
+    preview      MultipointTool preview loop (set_last_input + feedback frame)
+
+Results are written as JSON; with --baseline, p50/p99 values slower than the baseline by more than
+--tolerance are reported and the exit status is 1.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+import PySide6
+from PySide6.QtCore import QEvent, QPoint, QPointF, QRectF, Qt
+from PySide6.QtGui import QImage, QMouseEvent, QWheelEvent
+from PySide6.QtWidgets import QApplication
+
+from CanvasQWidget import CanvasQWidget
+from ColumnarModel import ColumnarModelDrawable
+from Drawable import BoxDrawable, LinkDrawable
+from ModelDrawable import ModelDrawable
+from Tool import MultipointTool
+import tracing
+
+# Model units between the anchors of neighbouring boxes in the synthetic grid.
+SPACING = 200.0
+BOX_SIZE = (150.0, 50.0)
+
+
+def summarize(samples: List[float]) -> dict:
+    """Timing summary in milliseconds of samples in seconds."""
+    ms = [s * 1000.0 for s in samples]
+    return {
+        "count": len(ms),
+        "p50_ms": tracing.percentile(ms, 50),
+        "p99_ms": tracing.percentile(ms, 99),
+        "mean_ms": sum(ms) / len(ms),
+        "max_ms": max(ms),
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of the process so far, or None where it is not available."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def synthetic_model(size: int, links: int, storage: str, seed: int = 1) -> ModelDrawable:
+    """
+    `size` boxes on a jittered square grid and `links` links, half between grid neighbours
+    and half between random boxes.
+    """
+    rng = np.random.default_rng(seed)
+    side = max(1, math.ceil(math.sqrt(size)))
+    cells = np.arange(size)
+    x = (cells % side) * SPACING + rng.uniform(0, SPACING - BOX_SIZE[0], size)
+    y = (cells // side) * SPACING + rng.uniform(0, SPACING - BOX_SIZE[1], size)
+    neighbours = min(links // 2, max(size - 1, 0))
+    sources = np.concatenate([np.arange(neighbours), rng.integers(0, size, links - neighbours)])
+    targets = np.concatenate([np.arange(1, neighbours + 1), rng.integers(0, size, links - neighbours)])
+    names = [f"box {i}" for i in range(size)]
+
+    if storage == "columnar":
+        model = ColumnarModelDrawable(max(size, links, 1))
+        boxIds = model.add_boxes(x, y, np.full(size, BOX_SIZE[0]), np.full(size, BOX_SIZE[1]), names)
+        model.add_links(boxIds[sources], boxIds[targets], [""] * links)
+        return model
+
+    model = ModelDrawable()
+    boxes = [BoxDrawable(QRectF(bx, by, *BOX_SIZE), {"name": name})
+             for bx, by, name in zip(x.tolist(), y.tolist(), names)]
+    model.add_drawables(boxes)
+    model.add_drawables([LinkDrawable(boxes[s], boxes[t]) for s, t in zip(sources.tolist(), targets.tolist())])
+    return model
+
+
+class CanvasBenchmark:
+    """Drives one canvas over one model; each scenario returns per-sample durations in seconds."""
+
+    def __init__(self, model: ModelDrawable, width: int, height: int, seed: int = 1, workers: Optional[int] = 0):
+        self.canvas = CanvasQWidget()
+        self.canvas.resize(width, height)
+        self.canvas.set_render_workers(workers)
+        self.canvas.set_model(model)
+        self.image = QImage(width, height, QImage.Format_ARGB32)
+        self.random = random.Random(seed)
+        self.home()
+
+    def home(self):
+        """Scale 1, looking at the top-left corner of the grid."""
+        self.canvas.finish_interaction()
+        self.canvas.scale = 1.0
+        self.canvas.offset = QPointF(0, 0)
+
+    def frame(self):
+        self.canvas.render(self.image)
+
+    def timed(self, count: int, step: Callable[[int], None]) -> List[float]:
+        samples = []
+        for i in range(count):
+            start = tracing.now()
+            step(i)
+            samples.append(tracing.now() - start)
+        return samples
+
+    def paint_cold(self, count: int) -> List[float]:
+        def step(_):
+            self.canvas.tileCache.clear()
+            self.frame()
+        return self.timed(count, step)
+
+    def paint(self, count: int) -> List[float]:
+        self.frame()
+        def step(i):
+            # Pan back and forth so most tiles are reused and a strip is rasterized now and then.
+            direction = 1 if (i // 50) % 2 == 0 else -1
+            self.canvas.offset += QPointF(7 * direction, 3 * direction)
+            self.frame()
+        return self.timed(count, step)
+
+    def pointer(self, count: int) -> List[float]:
+        w, h = self.canvas.width(), self.canvas.height()
+        events = [QMouseEvent(QEvent.MouseMove, QPointF(self.random.uniform(0, w), self.random.uniform(0, h)),
+                              QPointF(0, 0), Qt.NoButton, Qt.NoButton, Qt.NoModifier)
+                  for _ in range(count)]
+        return self.timed(count, lambda i: self.canvas.get_canvas_pointer_event(events[i]))
+
+    def wheel(self, count: int) -> List[float]:
+        center = QPointF(self.canvas.width() / 2, self.canvas.height() / 2)
+        def step(i):
+            # Sequences of ten notches in, then ten out, around the viewport center. A -80 notch
+            # (x2/3) undoes a +120 one (x1.5), so every sequence returns to the starting scale.
+            delta = 120 if (i // 10) % 2 == 0 else -80
+            self.zoom(center, delta)
+            self.frame()
+        samples = self.timed(count, step)
+        self.canvas.finish_interaction()
+        self.home()
+        return samples
+
+    def settle(self, count: int) -> List[float]:
+        center = QPointF(self.canvas.width() / 2, self.canvas.height() / 2)
+        samples = []
+        for i in range(count):
+            self.zoom(center, 120 if i % 2 == 0 else -80)
+            self.frame()
+            start = tracing.now()
+            self.canvas.finish_interaction()
+            self.frame()
+            samples.append(tracing.now() - start)
+        self.home()
+        return samples
+
+    def zoom(self, center: QPointF, delta: int):
+        """One wheel notch and one display frame worth of zoom animation."""
+        self.canvas.wheelEvent(QWheelEvent(center, center, QPoint(0, 0), QPoint(0, delta), Qt.NoButton,
+                                           Qt.NoModifier, Qt.NoScrollPhase, False))
+        self.canvas.advance_animation(1.0 / 60.0)
+
+    def preview(self, count: int) -> List[float]:
+        tool = MultipointTool("Box", BoxDrawable)
+        tool.changed.connect(lambda t, drawable, messages: self.canvas.set_feedback_drawables([drawable]))
+        center = self.canvas.screen_to_model(QPointF(self.canvas.width() / 2, self.canvas.height() / 2))
+        def step(i):
+            angle = i * 0.1
+            tool.set_last_input(center + QPointF(math.cos(angle) * 200, math.sin(angle) * 120))
+            self.frame()
+        samples = self.timed(count, step)
+        tool.reset()
+        self.canvas.set_feedback_drawables([])
+        return samples
+
+
+SCENARIOS = ("paint_cold", "paint", "pointer", "wheel", "settle", "preview")
+
+
+def run(sizes: List[int], storage: str, linkRatio: float, frames: int, width: int, height: int,
+        scenarios=SCENARIOS, workers: Optional[int] = 0) -> dict:
+    app = QApplication.instance() or QApplication([])
+    results = []
+    for size in sizes:
+        start = tracing.now()
+        model = synthetic_model(size, int(size * linkRatio), storage)
+        buildTime = tracing.now() - start
+        bench = CanvasBenchmark(model, width, height, workers=workers)
+        timings: Dict[str, dict] = {}
+        for name in scenarios:
+            count = max(3, frames // 10) if name in ("paint_cold", "settle") else frames
+            timings[name] = summarize(getattr(bench, name)(count))
+            app.processEvents()
+        results.append({
+            "size": size,
+            "links": int(size * linkRatio),
+            "storage": storage,
+            "build_s": buildTime,
+            "peak_rss_mb": peak_rss_mb(),
+            "scenarios": timings,
+        })
+        print(format_result(results[-1]), file=sys.stderr)
+        bench.canvas.deleteLater()
+        del bench, model
+        app.processEvents()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "pyside6": PySide6.__version__,
+            "platform": platform.platform(),
+            "qpa": os.environ.get("QT_QPA_PLATFORM"),
+            "viewport": [width, height],
+            "frames": frames,
+            "workers": workers,
+        },
+        "results": results,
+    }
+
+
+def format_result(result: dict) -> str:
+    lines = [f"{result['storage']} model, {result['size']} boxes, {result['links']} links: "
+             f"built in {result['build_s']:.2f}s, peak RSS {result['peak_rss_mb'] or 0:.0f} MB"]
+    for name, t in result["scenarios"].items():
+        lines.append(f"  {name:<11} p50 {t['p50_ms']:8.2f} ms  p99 {t['p99_ms']:8.2f} ms  ({t['count']} samples)")
+    return "\n".join(lines)
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Descriptions of the p50/p99 timings of `report` slower than `baseline` by more than `tolerance`."""
+    previous = {(r["storage"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get((result["storage"], result["size"]))
+        if old is None:
+            continue
+        for name, timing in result["scenarios"].items():
+            for stat in ("p50_ms", "p99_ms"):
+                before = old["scenarios"].get(name, {}).get(stat)
+                if before and timing[stat] > before * (1.0 + tolerance):
+                    regressions.append(f"{result['storage']} {result['size']} {name} {stat}: "
+                                       f"{before:.2f} -> {timing[stat]:.2f} ms")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="comma separated box counts (default: %(default)s)")
+    parser.add_argument("--storage", choices=("object", "columnar"), default="object")
+    parser.add_argument("--link-ratio", type=float, default=0.5, help="links per box (default: %(default)s)")
+    parser.add_argument("--frames", type=int, default=200, help="samples per scenario (default: %(default)s)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated subset of scenarios")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=800)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="render worker threads, -1 for every core; frame times then measure the GUI thread "
+                             "only, tiles still being rasterized show placeholders (default: %(default)s)")
+    parser.add_argument("--output", default="-", help="JSON output file, - for stdout")
+    parser.add_argument("--baseline", help="previous JSON output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown against the baseline (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    report = run([int(s) for s in args.sizes.split(",")], args.storage, args.link_ratio, args.frames,
+                 args.width, args.height, scenarios, None if args.workers < 0 else args.workers)
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as stream:
+            json.dump(report, stream, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as stream:
+            regressions = compare(report, json.load(stream), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,13 @@
+import numpy as np
+
+
+def point_segment_distance(px, py, x1, y1, x2, y2):
+    """
+    Distance from the point (px, py) to the segments (x1, y1)-(x2, y2).
+    Works on scalars and on NumPy arrays of segments alike.
+    """
+    dx = x2 - x1
+    dy = y2 - y1
+    lengthSq = dx * dx + dy * dy
+    t = np.clip(((px - x1) * dx + (py - y1) * dy) / np.where(lengthSq == 0, 1.0, lengthSq), 0.0, 1.0)
+    return np.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
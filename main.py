@@ -1,16 +1,26 @@
+import logging
 import sys
 from PySide6.QtWidgets import (
     QApplication, QWidget, QMainWindow, QPushButton,
     QVBoxLayout, QHBoxLayout, QLabel
 )
-from PySide6.QtCore import QRectF, Qt
+from PySide6.QtCore import QPointF, QRectF, Qt
+from PySide6.QtGui import QKeySequence, QShortcut
 
 import Tool
 from CanvasQWidget import CanvasQWidget
+from GraphLayout import LayoutRunner
+from History import History
+from LinkRouter import LinkRouter
+from Selection import Selection
 from Drawable import BoxDrawable, LinkDrawable, Drawable
 from events import CanvasPointerEvent, CanvasKeyEvent, CanvasZoomEvent
 
+from PluginManager import PluginManager
 from tools_registry import tools_registry
+import tracing
+
+log = tracing.get_logger("app")
 
 
 # Base Drawable interface
@@ -29,10 +39,19 @@ class MainWindow(QMainWindow):
         self.infoLabel = None
         self.setWindowTitle("PySide Canvas Application")
         self.canvas = CanvasQWidget()
+        self.history = History(self.canvas.model)
+        self.selection = Selection(self.canvas.model)
+        self.canvas.set_selection(self.selection)
+        self.graphLayout = LayoutRunner(self.canvas.model, self.history, parent=self)
+        # Links are routed around boxes on worker threads; edits only reroute the links they touch.
+        self.router = LinkRouter(self.canvas.model, parent=self)
+        self.canvas.set_router(self.router)
         self.initUI()
 
         # For link creation: store the first selected box.
         self.pendingBox = None
+        # Selection drag without an active tool: ("move", model start) or ("band", screen start).
+        self.drag = None
 
         # Connect canvas signals for demonstration.
         self.canvas.pointerDown.connect(self.onPointerDown)
@@ -41,22 +60,34 @@ class MainWindow(QMainWindow):
         self.canvas.bufferChanged.connect(self.onBufferChanged)
         self.canvas.bufferFinished.connect(self.onBufferFinished)
         self.canvas.zoomFinished.connect(self.onZoomFinished)
+        # Rasterize model tiles on every core, keeping the GUI thread for input and compositing.
+        self.canvas.set_render_workers(None)
+        QShortcut(QKeySequence("Ctrl+Shift+T"), self, activated=self.dump_trace)
+        QShortcut(QKeySequence("Ctrl+Shift+H"), self, activated=self.toggle_hud)
+        QShortcut(QKeySequence.Undo, self, activated=self.history.undo)
+        QShortcut(QKeySequence.Redo, self, activated=self.history.redo)
+        QShortcut(QKeySequence.SelectAll, self, activated=self.selection.select_all)
+        QShortcut(QKeySequence.Delete, self, activated=self.delete_selection)
 
     def on_tool_activated(self,tool:Tool):
-        print(f"Activated Tool: {tool.name}")
+        log.info("Activated Tool: %s", tool.name)
         self.currentTool = tool
 
     def on_tool_changed(self,tool:Tool,drawable:Drawable):
-        print(f"Changed Tool: {tool.name} Drawable {drawable}")
+        log.debug("Changed Tool: %s Drawable %s", tool.name, drawable)
         # self.currentTool = tool
-        self.canvas.feedbackDrawables = [drawable]
-        self.canvas.update()
+        self.canvas.set_feedback_drawables([drawable])
 
     def on_tool_finished(self,tool:Tool,drawable:Drawable):
-        print(f"Finished Tool: {tool.name} Drawable {drawable}")
-        self.canvas.model.add_drawable(drawable)
-        self.canvas.feedbackDrawables = []
-        self.canvas.update()
+        log.info("Finished Tool: %s Drawable %s", tool.name, drawable)
+        added = self.history.add([drawable], tool.name)[0]
+        self.canvas.set_feedback_drawables([])
+        if self.autoLayoutButton.isChecked():
+            model = self.canvas.model
+            if isinstance(added, LinkDrawable):
+                self.graphLayout.relayout_around([model.id_of(added.box1), model.id_of(added.box2)])
+            elif isinstance(added, BoxDrawable):
+                self.graphLayout.relayout_around([model.id_of(added)])
 
 
     def initUI(self):
@@ -71,8 +102,22 @@ class MainWindow(QMainWindow):
         mainLayout.addWidget(self.infoLabel)
         # Button bar.
         buttonBar = QHBoxLayout()
-
-        for tool in tools_registry:
+        selectButton = QPushButton("Select")
+        selectButton.setFocusPolicy(Qt.NoFocus)
+        selectButton.clicked.connect(self.on_select_activated)
+        buttonBar.addWidget(selectButton)
+        layoutButton = QPushButton("Layout")
+        layoutButton.setFocusPolicy(Qt.NoFocus)
+        layoutButton.clicked.connect(self.on_layout_activated)
+        buttonBar.addWidget(layoutButton)
+        # When checked, boxes and links added by tools relayout their neighbourhood.
+        self.autoLayoutButton = QPushButton("Auto Layout")
+        self.autoLayoutButton.setFocusPolicy(Qt.NoFocus)
+        self.autoLayoutButton.setCheckable(True)
+        buttonBar.addWidget(self.autoLayoutButton)
+
+        self.tools = PluginManager(tools_registry).tools(self)
+        for tool in self.tools:
             btn=tool.create_activation_button()
             # Use a lambda with a default argument to capture the current tool.
             tool.activated.connect(lambda tt: self.on_tool_activated(tt))
@@ -85,46 +130,105 @@ class MainWindow(QMainWindow):
         # print("Pointer Moved through ", screenPoint, "with drawables:", [type(d).__name__ for d in drawables])
         if self.currentTool is not None:
             self.currentTool.set_last_input(event.modelPoint)
+        elif self.drag is not None:
+            mode, start = self.drag
+            if mode == "move":
+                self.canvas.set_selection_offset(event.modelPoint - start)
+            else:
+                self.canvas.set_rubber_band(QRectF(start, event.screenPoint).normalized())
 
     def onPointerDown(self, event:CanvasPointerEvent):
-        print("Pointer Down at", event.modelPoint, "with drawables:", [type(d).__name__ for d in event.targetPath])
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Pointer Down at %s with drawables: %s", event.modelPoint, [type(d).__name__ for d in event.targetPath])
         if self.currentTool is not None:
             pass
+        elif event.targetPath and self.selection.contains_drawable(event.targetPath[-1]):
+            self.drag = ("move", event.modelPoint)
+        else:
+            self.drag = ("band", event.screenPoint)
 
     def onPointerUp(self, event:CanvasPointerEvent):
-        print("Pointer Up at", event.modelPoint, "with drawables:", [type(d).__name__ for d in event.targetPath])
-        print(self.currentTool)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Pointer Up at %s with drawables: %s", event.modelPoint, [type(d).__name__ for d in event.targetPath])
         if self.currentTool is not None:
             self.currentTool.add_input(event.modelPoint)
-            (messages,result) =self.currentTool.drawable_class.build(self.currentTool.inputs)
-            print(messages)
-            print(result)
-            print(self.currentTool.inputs)
-            print(self.canvas.model.drawables)
-            print(self.canvas.feedbackDrawables)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Tool %s inputs: %s, %d drawables in model, feedback: %s", self.currentTool.name,
+                          self.currentTool.inputs, len(self.canvas.model.drawables), self.canvas.feedbackDrawables)
+        elif self.drag is not None:
+            self.finish_drag(event)
+
+    def finish_drag(self, event: CanvasPointerEvent):
+        """Moves the dragged selection in one edit, or selects what the rubber band (or a click) picked."""
+        mode, start = self.drag
+        self.drag = None
+        add = bool(QApplication.keyboardModifiers() & Qt.ShiftModifier)
+        if mode == "move":
+            delta = event.modelPoint - start
+            self.canvas.set_selection_offset(QPointF())
+            if not delta.isNull():
+                self.history.move(self.selection.ids, delta.x(), delta.y())
+            return
+        self.canvas.set_rubber_band(None)
+        band = QRectF(start, event.screenPoint).normalized()
+        if band.width() < 3 and band.height() < 3:
+            # A click selects the topmost drawable under the pointer, or clears the selection.
+            under = [self.canvas.model.id_of(event.targetPath[-1])] if event.targetPath else []
+            self.selection.set(under, add)
+        else:
+            self.selection.select_rect(QRectF(self.canvas.screen_to_model(band.topLeft()),
+                                              self.canvas.screen_to_model(band.bottomRight())), add)
+
+    def on_select_activated(self):
+        if self.currentTool is not None:
+            self.currentTool.reset()
+        self.currentTool = None
+        self.canvas.set_feedback_drawables([])
+
+    def on_layout_activated(self):
+        """Lays out the selected boxes among the others, or every box when none is selected."""
+        model = self.canvas.model
+        boxIds = [i for i in self.selection.ids.tolist() if isinstance(model.drawable_for(i), BoxDrawable)]
+        self.graphLayout.relayout(boxIds or None)
+
+    def delete_selection(self):
+        if len(self.selection):
+            self.history.remove(self.selection.ids)
     def onBufferChanged(self,event:CanvasKeyEvent):
+        if event.key == Qt.Key_Escape and self.currentTool is None:
+            self.selection.clear()
         if self.currentTool:
-            print(f"Setting buffer '{event.buffer}' to tool {self.currentTool.name}.")
+            log.debug("Setting buffer '%s' to tool %s.", event.buffer, self.currentTool.name)
             self.currentTool.set_last_input(event.buffer)
         else:
-            print(f"No tool is active to receive input {event.buffer}.")
+            log.debug("No tool is active to receive input %s.", event.buffer)
         self.infoLabel.setText(f"Input Buffer: {event.buffer}")
         pass
     def onBufferFinished(self,event:CanvasKeyEvent):
         if self.currentTool:
-            print(f"Buffer finished '{event.buffer}' to tool {self.currentTool.name}.")
+            log.debug("Buffer finished '%s' to tool %s.", event.buffer, self.currentTool.name)
             self.currentTool.add_input(event.buffer)
         else:
-            print(f"No tool is active to receive input {event.buffer}.")
+            log.debug("No tool is active to receive input %s.", event.buffer)
         self.infoLabel.setText(f"Input Buffer: {event.buffer}")
         pass
 
 
 
     def onZoomFinished(self, event:CanvasZoomEvent):
-        print("Zoom finished. Scale:", event.zoomValue, "Center:", event.modelPoint)
+        log.debug("Zoom finished. Scale: %s Center: %s", event.zoomValue, event.modelPoint)
+
+    def toggle_hud(self):
+        """Toggles the canvas frame instrumentation and its HUD."""
+        self.canvas.set_instrumentation(self.canvas.frameStats is None)
+
+    def dump_trace(self):
+        """Dumps the trace recorder (enabled with CANVAS_TRACE_RECORD) to stderr."""
+        if tracing.recorder is not None:
+            tracing.recorder.dump()
 
 if __name__ == '__main__':
+    tracing.configure_from_env()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.resize(800, 600)
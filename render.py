@@ -0,0 +1,325 @@
+"""
+Headless batch renderer: loads model files, applies scripted tool inputs and renders them to PNG or SVG.
+
+No window is created: each process runs an offscreen Qt application (QT_QPA_PLATFORM=offscreen) and
+draws through the same CanvasQWidget/Drawable code as the application. Files are processed in
+parallel on a process pool:
+
+    python render.py diagrams/*.cnvm --format png,svg --size 1920x1080 --output-dir out
+    python render.py base.cnvm --script steps.json --save-model --output-dir out
+
+A script is a JSON list of steps. Each step feeds tool inputs through the drawable's build() protocol,
+once with "inputs" or once per entry of "batch":
+
+    [{"tool": "Box", "inputs": [[0, 0], "server"]},
+     {"tool": "Box", "batch": [[[200, 0], "db"], [[200, 120], "cache"]]},
+     {"tool": "Link", "inputs": [{"box": "server"}, {"box": "db"}, "queries"]}]
+
+Inputs are points ([x, y]), text, or boxes of the model given by id ({"box": 12}), by name
+({"box": "db"}) or by position ({"at": [x, y]}). Tools are the built-in and plugin tools
+(see PluginManager).
+
+A JSON report of per-file timings and of the throughput per core is written to stdout (or --report).
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtCore import QPointF, QRectF, QSize
+from PySide6.QtGui import QColor, QImage, QPainter
+from PySide6.QtSvg import QSvgGenerator
+from PySide6.QtWidgets import QApplication
+
+from CanvasQWidget import CanvasQWidget
+from ColumnarModel import ColumnarModelDrawable
+from Drawable import BoxDrawable, Drawable
+from ModelDrawable import ModelDrawable
+from ModelFile import import_ndjson, load_model, save_model
+from PluginManager import PluginManager, load_drawable_class
+from tools_registry import tools_registry
+
+FORMATS = ("png", "svg")
+
+
+class ScriptError(ValueError):
+    pass
+
+
+class RenderOptions(NamedTuple):
+    outputDir: str
+    formats: Tuple[str, ...] = ("png",)
+    size: Tuple[int, int] = (1280, 800)
+    # Model rect (x, y, w, h) to render; None fits the model bounds plus `margin` model units.
+    viewport: Optional[Tuple[float, float, float, float]] = None
+    margin: float = 20.0
+    script: Optional[list] = None
+    saveModel: bool = False
+    columnar: bool = True
+
+
+def read_model(path: str, columnar: bool = True) -> ModelDrawable:
+    """Loads a binary model file, or line-delimited JSON (.ndjson, .jsonl)."""
+    if path.endswith((".ndjson", ".jsonl")):
+        with open(path, "r", encoding="utf-8") as stream:
+            return import_ndjson(stream, ColumnarModelDrawable() if columnar else ModelDrawable())
+    return load_model(path, columnar)
+
+
+def model_bounds(model: ModelDrawable) -> QRectF:
+    ids = model.all_ids()
+    if not len(ids):
+        return QRectF()
+    bounds = model.bounds_of(ids)
+    left, top = bounds[:, 0].min(), bounds[:, 1].min()
+    return QRectF(QPointF(left, top), QPointF(bounds[:, 2].max(), bounds[:, 3].max()))
+
+
+class ScriptRunner:
+    """Applies script steps to a model; every drawable a tool builds is added to the model right away."""
+
+    def __init__(self, model: ModelDrawable, tools: Dict[str, type]):
+        self.model = model
+        self.tools = tools
+        # Box ids by name, built on the first reference by name and kept up to date with added boxes.
+        self._boxesByName: Optional[Dict[str, int]] = None
+        self.added = 0
+
+    def run(self, script: list):
+        for index, step in enumerate(script):
+            drawableClass = self.tools.get(step.get("tool"))
+            if drawableClass is None:
+                raise ScriptError(f"step {index}: unknown tool {step.get('tool')!r}")
+            batch = step["batch"] if "batch" in step else [step.get("inputs", [])]
+            for inputs in batch:
+                errors, drawable = drawableClass.build([self.resolve(value, index) for value in inputs])
+                if errors:
+                    raise ScriptError(f"step {index} ({step['tool']}): incomplete inputs: {'; '.join(errors)}")
+                self.add(drawable)
+
+    def add(self, drawable: Drawable):
+        stored = self.model.add_drawable(drawable)
+        self.added += 1
+        if self._boxesByName is not None and isinstance(stored, BoxDrawable):
+            self._boxesByName.setdefault(stored.metadata.get("name", ""), self.model.id_of(stored))
+
+    def resolve(self, value, index: int):
+        if isinstance(value, str):
+            return value
+        if isinstance(value, list) and len(value) == 2:
+            return QPointF(float(value[0]), float(value[1]))
+        if isinstance(value, dict) and "box" in value:
+            return self.box(value["box"], index)
+        if isinstance(value, dict) and "at" in value:
+            x, y = value["at"]
+            boxes = [d for d in self.model.query_point(QPointF(x, y)) if isinstance(d, BoxDrawable)]
+            if not boxes:
+                raise ScriptError(f"step {index}: no box at {value['at']}")
+            return boxes[-1]
+        raise ScriptError(f"step {index}: unsupported input {value!r}")
+
+    def box(self, reference, index: int) -> BoxDrawable:
+        if isinstance(reference, str):
+            if self._boxesByName is None:
+                self._boxesByName = {}
+                for drawableId in self.model.ids_where(lambda d: isinstance(d, BoxDrawable)).tolist():
+                    self._boxesByName.setdefault(self.model.name_of(drawableId), drawableId)
+            reference = self._boxesByName.get(reference, reference)
+        try:
+            box = self.model.drawable_for(reference)
+        except (KeyError, TypeError):
+            box = None
+        if not isinstance(box, BoxDrawable):
+            raise ScriptError(f"step {index}: no box {reference!r}")
+        return box
+
+
+def render_view(canvas: CanvasQWidget, path: str, fmt: str):
+    """Writes the canvas' current view to a PNG or SVG file."""
+    size = canvas.size()
+    if fmt == "svg":
+        device = QSvgGenerator()
+        device.setFileName(path)
+        device.setSize(size)
+        device.setViewBox(QRectF(0, 0, size.width(), size.height()))
+    else:
+        device = QImage(size, QImage.Format_RGB32)
+    painter = QPainter(device)
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.fillRect(QRectF(0, 0, size.width(), size.height()), QColor("white"))
+    canvas.paint_model(painter)
+    painter.end()
+    if fmt != "svg" and not device.save(path):
+        raise OSError(f"cannot write {path}")
+
+
+_app = None
+_tools: Optional[Dict[str, type]] = None
+
+
+def _init_process():
+    """Per process: the offscreen Qt application, and the tools, loaded at most once."""
+    global _app
+    if _app is None:
+        _app = QApplication.instance() or QApplication([])
+
+
+def _tools_for(script: list) -> Dict[str, type]:
+    global _tools
+    if _tools is None:
+        _tools = {}
+    wanted = {step.get("tool") for step in script} - set(_tools)
+    if wanted:
+        for spec in PluginManager(tools_registry).discover():
+            if spec.name in wanted:
+                _tools[spec.name] = load_drawable_class(spec)
+    return _tools
+
+
+def process_file(path: str, options: RenderOptions) -> dict:
+    """Loads, transforms and renders one model file; returns its timings. Runs in a pool process."""
+    _init_process()
+    cpuStart = time.process_time()
+    start = time.perf_counter()
+    result = {"path": path, "outputs": []}
+    try:
+        model = read_model(path, options.columnar)
+        loaded = time.perf_counter()
+        added = 0
+        if options.script:
+            runner = ScriptRunner(model, _tools_for(options.script))
+            runner.run(options.script)
+            added = runner.added
+        scripted = time.perf_counter()
+
+        canvas = CanvasQWidget()
+        canvas.set_model(model)
+        canvas.resize(QSize(*options.size))
+        if options.viewport is not None:
+            viewport = QRectF(*options.viewport)
+        else:
+            m = options.margin
+            viewport = model_bounds(model).adjusted(-m, -m, m, m)
+        canvas.fit_rect(viewport)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        for fmt in options.formats:
+            output = os.path.join(options.outputDir, f"{stem}.{fmt}")
+            render_view(canvas, output, fmt)
+            result["outputs"].append(output)
+        rendered = time.perf_counter()
+        canvas.deleteLater()
+        if options.saveModel:
+            output = os.path.join(options.outputDir, f"{stem}.cnvm")
+            save_model(model, output)
+            result["outputs"].append(output)
+        end = time.perf_counter()
+        result.update(drawables=len(model.drawables), added=added, load_s=loaded - start,
+                      script_s=scripted - loaded, render_s=rendered - scripted, save_s=end - rendered)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["wall_s"] = time.perf_counter() - start
+    result["cpu_s"] = time.process_time() - cpuStart
+    return result
+
+
+def run(paths: List[str], options: RenderOptions, jobs: int = 1) -> dict:
+    """Processes every file, on `jobs` processes (1 processes them in this process); returns the report."""
+    os.makedirs(options.outputDir, exist_ok=True)
+    start = time.perf_counter()
+    if jobs <= 1:
+        results = [process_file(path, options) for path in paths]
+    else:
+        # Qt does not survive fork: workers are spawned and each starts its own application.
+        with ProcessPoolExecutor(jobs, multiprocessing.get_context("spawn"), initializer=_init_process) as pool:
+            results = list(pool.map(process_file, paths, [options] * len(paths)))
+    wall = time.perf_counter() - start
+    done = [r for r in results if "error" not in r]
+    cpu = sum(r["cpu_s"] for r in results)
+    drawables = sum(r["drawables"] for r in done)
+    return {
+        "files": results,
+        "summary": {
+            "files": len(results),
+            "failed": len(results) - len(done),
+            "jobs": jobs,
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "files_per_s": len(done) / wall if wall else None,
+            # Per core: work done per CPU second spent in the file jobs, independent of the job count.
+            "files_per_core_s": len(done) / cpu if cpu else None,
+            "drawables_per_core_s": drawables / cpu if cpu else None,
+            "parallel_efficiency": cpu / (wall * jobs) if wall else None,
+        },
+    }
+
+
+def parse_size(text: str) -> Tuple[int, int]:
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="model files (.cnvm, .ndjson, .jsonl) or glob patterns")
+    parser.add_argument("--output-dir", default=".", help="directory of the rendered files (default: %(default)s)")
+    parser.add_argument("--format", default="png", help="comma separated output formats: png, svg (default: %(default)s)")
+    parser.add_argument("--size", type=parse_size, default=(1280, 800), help="output size WxH in pixels (default: 1280x800)")
+    parser.add_argument("--viewport", help="model rect x,y,w,h to render, e.g. --viewport=-100,-100,800,600 (default: the model bounds)")
+    parser.add_argument("--margin", type=float, default=20.0, help="margin around the model bounds, in model units")
+    parser.add_argument("--script", help="JSON script of tool inputs applied to every model before rendering")
+    parser.add_argument("--save-model", action="store_true", help="also write the transformed model as .cnvm")
+    parser.add_argument("--storage", choices=("object", "columnar"), default="columnar")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="worker processes, 1 to run in this process (default: %(default)s)")
+    parser.add_argument("--report", default="-", help="JSON report file, - for stdout")
+    args = parser.parse_args(argv)
+
+    formats = tuple(f for f in args.format.split(",") if f)
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"unknown formats: {', '.join(sorted(unknown))}")
+    viewport = None
+    if args.viewport:
+        viewport = tuple(float(v) for v in args.viewport.split(","))
+        if len(viewport) != 4 or viewport[2] <= 0 or viewport[3] <= 0:
+            parser.error("--viewport expects x,y,w,h with a positive size")
+    script = None
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as stream:
+            script = json.load(stream)
+        if not isinstance(script, list):
+            parser.error("the script must be a JSON list of steps")
+    paths = []
+    for pattern in args.inputs:
+        matches = sorted(glob.glob(pattern))
+        paths += matches if matches else [pattern]
+
+    options = RenderOptions(args.output_dir, formats, args.size, viewport, args.margin, script,
+                            args.save_model, args.storage == "columnar")
+    report = run(paths, options, max(1, min(args.jobs, len(paths))))
+
+    for result in report["files"]:
+        if "error" in result:
+            print(f"FAILED {result['path']}: {result['error']}", file=sys.stderr)
+    s = report["summary"]
+    print(f"{s['files'] - s['failed']}/{s['files']} files in {s['wall_s']:.2f}s on {s['jobs']} processes: "
+          f"{s['files_per_s'] or 0:.2f} files/s, {s['files_per_core_s'] or 0:.2f} files/s per core, "
+          f"{s['drawables_per_core_s'] or 0:.0f} drawables/s per core", file=sys.stderr)
+    if args.report == "-":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.report, "w") as stream:
+            json.dump(report, stream, indent=2)
+    return 1 if s["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
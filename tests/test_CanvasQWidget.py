@@ -0,0 +1,49 @@
+from PySide6.QtCore import QEvent, QPoint, QPointF, Qt
+from PySide6.QtGui import QMouseEvent
+from PySide6.QtTest import QTest
+
+from CanvasQWidget import CanvasQWidget
+from ColumnarModel import ColumnarModelDrawable
+
+
+def test_input_latency_only_counts_moves_that_request_a_paint(app):
+    canvas = CanvasQWidget()
+    canvas.resize(400, 300)
+    canvas.show()
+    QTest.qWaitForWindowExposed(canvas)
+    canvas.set_pointer_rate(0)
+    canvas.set_instrumentation(True, hud=False)
+    frames = []
+    canvas.frameStatsUpdated.connect(frames.append)
+
+    # A move nobody repaints for is not charged to the next, unrelated paint.
+    QTest.mouseMove(canvas, QPoint(10, 10))
+    canvas.grab()
+    assert frames[-1]["moves"] == 1 and frames[-1]["latency_ms"] is None
+
+    canvas.pointerMove.connect(lambda event: canvas.update())
+    QTest.mouseMove(canvas, QPoint(20, 20))
+    canvas.grab()
+    assert frames[-1]["latency_ms"] is not None
+
+
+def test_paints_an_empty_columnar_model(app):
+    canvas = CanvasQWidget()
+    canvas.resize(400, 300)
+    canvas.set_model(ColumnarModelDrawable())
+    assert not canvas.grab().isNull()
+
+
+def test_queued_pointer_moves_are_coalesced(app):
+    canvas = CanvasQWidget()
+    canvas.resize(400, 300)
+    moves = []
+    canvas.pointerMove.connect(moves.append)
+    for x in (10, 20, 30, 40):
+        point = QPointF(x, 15)
+        canvas.mouseMoveEvent(QMouseEvent(QEvent.MouseMove, point, point, Qt.NoButton, Qt.NoButton, Qt.NoModifier))
+    assert moves == []
+    QTest.qWait(int(3000 / canvas.pointerRate))
+    assert len(moves) == 1
+    assert moves[0].screenPoint == QPointF(40, 15)
+    assert canvas.pointer_stats() == {"received": 4, "processed": 1, "dropped": 3}
@@ -0,0 +1,96 @@
+import random
+
+import numpy as np
+from PySide6.QtCore import QPointF, QRectF
+
+import ColumnarModel
+from ColumnarModel import BOX, ColumnarModelDrawable
+from geometry import point_segment_distance
+
+
+def scan_rect(model, rect):
+    found = [ids[model._in_rect(bounds, rect)] for ids, bounds in ((model.boxes["id"], model.box_bounds()),
+                                                                   (model.links["id"], model.link_bounds()))]
+    return set(np.concatenate(found).tolist())
+
+
+def test_queries_match_a_full_scan_through_edits(monkeypatch):
+    # A small pending limit makes the edits go through both the pending ids and index rebuilds.
+    monkeypatch.setattr(ColumnarModel, "SPATIAL_MIN_PENDING", 20)
+    rng = random.Random(2)
+    model = ColumnarModelDrawable()
+    n = 500
+    ids = model.add_boxes([rng.uniform(0, 5000) for _ in range(n)], [rng.uniform(0, 5000) for _ in range(n)],
+                          np.full(n, 150.0), np.full(n, 50.0), ["box"] * n)
+    model.add_links(ids[:-1], ids[1:], [""] * (n - 1))
+    for step in range(200):
+        boxIds = model.boxes["id"].tolist()
+        if step % 3 == 0:
+            model.translate_ids(np.array(rng.sample(boxIds, 5)), rng.uniform(-800, 800), rng.uniform(-800, 800))
+        elif step % 7 == 0:
+            model.remove_ids(np.array(rng.sample(boxIds, 2)))
+        elif step % 11 == 0:
+            new = model.add_boxes([rng.uniform(0, 5000)], [rng.uniform(0, 5000)], [150.0], [50.0], ["new"])
+            model.add_links(new, [rng.choice(boxIds)], [""])
+
+        p = QPointF(rng.uniform(0, 5000), rng.uniform(0, 5000))
+        rect = QRectF(p, QPointF(p.x() + rng.uniform(1, 1500), p.y() + rng.uniform(1, 1500)))
+        found = set(model.ids_in_rect(rect).tolist())
+        scanned = scan_rect(model, rect)
+        # Boxes match exactly; links are only dropped when their line stays away from the rect.
+        assert found <= scanned
+        assert {i for i in scanned if model.kind_of(i) == BOX} <= found
+        x1, y1, x2, y2 = model.link_segments()
+        for linkId, mx, my in zip(model.links["id"].tolist(), ((x1 + x2) / 2).tolist(), ((y1 + y2) / 2).tolist()):
+            if rect.contains(QPointF(mx, my)):
+                assert linkId in found
+
+        left, top, right, bottom = model.box_bounds()
+        x, y = p.x(), p.y()
+        under = model.boxes["id"][(left <= x) & (x <= right) & (top <= y) & (y <= bottom)]
+        assert set(model.box_ids_at(p).tolist()) == set(under.tolist())
+        near = model.links["id"][point_segment_distance(x, y, x1, y1, x2, y2) <= 5]
+        assert set(model.link_ids_at(p, 5).tolist()) == set(near.tolist())
+
+
+def test_queries_on_an_empty_model():
+    model = ColumnarModelDrawable()
+    assert model.query_point(QPointF(10, 10)) == []
+    assert model.query_rect(QRectF(0, 0, 100, 100)) == []
+    assert len(model.ids_in_rect(QRectF(0, 0, 100, 100))) == 0
+    drawables, points = model.query_rect_lod(QRectF(0, 0, 100, 100), 1.0, 1.0)
+    assert list(drawables) == [] and len(points) == 0
+
+
+def test_queries_on_a_model_without_links():
+    model = ColumnarModelDrawable()
+    ids = model.add_boxes([0.0, 500.0], [0.0, 0.0], [100.0, 100.0], [50.0, 50.0], ["a", "b"])
+    assert [model.id_of(d) for d in model.query_point(QPointF(10, 10))] == [ids[0]]
+    assert [model.id_of(d) for d in model.query_rect(QRectF(0, 0, 1000, 100))] == ids.tolist()
+    assert len(model.link_ids_at(QPointF(10, 10), 5.0)) == 0
+    drawables, points = model.query_rect_lod(QRectF(0, 0, 1000, 100), 1.0, 1.0)
+    assert len(drawables) == 2
+
+
+def test_renames_keep_cached_geometry():
+    model = ColumnarModelDrawable()
+    ids = model.add_boxes([0.0, 500.0], [0.0, 0.0], [100.0, 100.0], [50.0, 50.0], ["a", "b"])
+    bounds = model.box_bounds()
+    view = model.drawable_for(int(ids[0]))
+    view.metadata["name"] = "renamed"
+    model.update_drawable(view)
+    assert model.box_bounds() is bounds
+    assert model.name_of(int(ids[0])) == "renamed"
+    view.rect = QRectF(10, 10, 100, 50)
+    assert model.box_bounds()[0][0] == 10
+
+
+def test_remove_ids_skips_unknown_ids():
+    model = ColumnarModelDrawable()
+    ids = model.add_boxes([0.0, 500.0], [0.0, 0.0], [100.0, 100.0], [50.0, 50.0], ["a", "b"])
+    notifications = []
+    model.add_listener(notifications.append)
+    model.remove_ids([ids[0], 99, -1])
+    assert model.boxes["id"].tolist() == [ids[1]]
+    model.remove_ids([ids[0]])
+    assert len(notifications) == 1
@@ -0,0 +1,34 @@
+from PySide6.QtCore import QPointF, QRectF
+
+from ColumnarModel import ColumnarModelDrawable
+from Drawable import BoxDrawable, LinkDrawable
+from History import History
+from ModelDrawable import ModelDrawable
+
+import pytest
+
+
+def test_link_contains_uses_the_width_override():
+    a = BoxDrawable(QRectF(0, 0, 100, 40), {"name": "a"})
+    b = BoxDrawable(QRectF(400, 0, 100, 40), {"name": "b"})
+    link = LinkDrawable(a, b, {"name": "ab"})
+    assert not link.contains(QPointF(250, 28))
+    link.metadata["style"] = {"width": 20}
+    assert link.contains(QPointF(250, 28))
+
+
+def test_draw_style_ignores_unknown_keys():
+    box = BoxDrawable(QRectF(0, 0, 100, 40), {"name": "a", "style": {"fill": "red", "color": "green"}})
+    assert box.draw_style() == BoxDrawable.style._replace(color="green")
+    model = ColumnarModelDrawable()
+    view = model.add_drawable(box)
+    assert view.draw_style() == BoxDrawable.style._replace(color="green")
+
+
+def test_restyle_rejects_unknown_keys():
+    model = ModelDrawable()
+    history = History(model)
+    (box,) = history.add([BoxDrawable(QRectF(0, 0, 100, 40), {"name": "a"})])
+    with pytest.raises(ValueError):
+        history.restyle([model.id_of(box)], {"fill": "red"})
+    assert "style" not in box.metadata and history.undo_label() == "Add"
@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+from PySide6.QtCore import QCoreApplication, QRectF
+
+from Drawable import BoxDrawable, LinkDrawable
+from GraphLayout import LayoutRunner, layout_graph
+from History import History
+from ModelDrawable import ModelDrawable
+
+
+def make_chain(history: History, count: int):
+    boxes = history.add([BoxDrawable(QRectF(i * 10, 0, 40, 20), {"name": str(i)}) for i in range(count)])
+    history.add([LinkDrawable(a, b) for a, b in zip(boxes, boxes[1:])], "Link")
+    return boxes
+
+
+def wait_for_frame(model: ModelDrawable, ids: np.ndarray, before: np.ndarray, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while np.array_equal(model.bounds_of(ids)[:, :2], before):
+        assert time.monotonic() < deadline, "no layout frame was applied"
+        QCoreApplication.processEvents()
+
+
+def test_undo_during_layout_keeps_redo_entries(app):
+    model = ModelDrawable()
+    history = History(model)
+    make_chain(history, 300)
+    ids = model.all_ids()
+    history.move(ids[:1], 100, 0)
+    moved = model.bounds_of(ids)[:, :2].copy()
+    runner = LayoutRunner(model, history)
+    runner.frameInterval = 0
+    try:
+        runner.relayout(iterations=100000)
+        wait_for_frame(model, ids, moved)
+
+        # Undo first records the layout reached so far, then undoes it.
+        assert history.undo()
+        assert not runner.is_running()
+        assert [entry.label for entry in history.entries] == ["Add", "Link", "Move", "Layout"]
+        assert history.redo_label() == "Layout"
+        np.testing.assert_array_equal(model.bounds_of(ids)[:, :2], moved)
+
+        assert history.undo()
+        assert history.redo_label() == "Move"
+        np.testing.assert_array_equal(model.bounds_of(ids[:1])[:, :2], [[0, 0]])
+        assert history.redo() and history.redo()
+        assert not np.array_equal(model.bounds_of(ids)[:, :2], moved)
+    finally:
+        runner.cancel()
+        runner.pool.waitForDone()
+
+
+def test_layout_records_the_converged_frame(app):
+    model = ModelDrawable()
+    history = History(model)
+    make_chain(history, 50)
+    runner = LayoutRunner(model, history)
+    runner.frameInterval = 0
+    graph = layout_graph(model)
+    *_, converged = runner.layout.run(graph, None, 40)
+    finished = []
+    runner.finished.connect(finished.append)
+    runner.relayout(iterations=40)
+    runner.wait()
+    assert finished == [True]
+    assert history.undo_label() == "Layout"
+    np.testing.assert_allclose(model.bounds_of(graph.ids)[:, :2], graph.top_lefts(converged))
@@ -0,0 +1,62 @@
+from PySide6.QtCore import QRectF
+
+from ColumnarModel import ColumnarModelDrawable
+from Drawable import BoxDrawable, LinkDrawable
+from History import History
+from ModelDrawable import ModelDrawable
+
+import pytest
+
+
+def names(model):
+    return [d.metadata["name"] for d in model.drawables]
+
+
+@pytest.mark.parametrize("modelClass", [ModelDrawable, ColumnarModelDrawable])
+def test_undo_delete_restores_z_order(app, modelClass):
+    model = modelClass()
+    history = History(model, snapshotInterval=2)
+    a, b, c = history.add([BoxDrawable(QRectF(i * 50, 0, 40, 40), {"name": name}) for i, name in enumerate("abc")])
+    history.add([LinkDrawable(a, c, {"name": "ac"}), BoxDrawable(QRectF(0, 100, 40, 40), {"name": "d"})])
+    before = names(model)
+    history.remove([model.id_of(a), model.id_of(b)])
+    assert names(model) == ["c", "d"]
+    history.undo()
+    assert names(model) == before
+    history.redo()
+    history.undo()
+    assert names(model) == before
+    # Restoring the snapshot after the first add keeps the order too.
+    history.goto(1)
+    history.goto(2)
+    assert names(model) == before
+
+
+def test_undo_delete_restores_positions_not_matching_ids(app):
+    model = ModelDrawable()
+    boxes = [BoxDrawable(QRectF(i * 50, 0, 40, 40), {"name": name}) for i, name in enumerate("abcd")]
+    # A file may list drawables in any order of their ids.
+    model.add_drawables(boxes, [3, 0, 2, 1])
+    history = History(model)
+    history.remove([0, 1])
+    assert names(model) == ["a", "c"]
+    history.undo()
+    assert names(model) == ["a", "b", "c", "d"]
+
+
+@pytest.mark.parametrize("modelClass", [ModelDrawable, ColumnarModelDrawable])
+def test_add_inserts_in_bulk(app, modelClass):
+    model = modelClass()
+    history = History(model)
+    notifications = []
+    model.add_listener(notifications.append)
+    a = BoxDrawable(QRectF(0, 0, 40, 40), {"name": "a"})
+    b = BoxDrawable(QRectF(100, 0, 40, 40), {"name": "b", "style": {"color": "red"}})
+    added = history.add([a, LinkDrawable(a, b, {"name": "ab"}), b])
+    assert names(model) == ["a", "ab", "b"]
+    assert added[1].box2 == added[2] and added[2].metadata["style"] == {"color": "red"}
+    # Boxes and links are inserted in one batch each.
+    assert len(notifications) <= 2
+    history.undo()
+    history.redo()
+    assert names(model) == ["a", "ab", "b"]
@@ -0,0 +1,102 @@
+from PySide6.QtCore import QPointF, QRectF
+
+from CanvasQWidget import CanvasQWidget
+from ColumnarModel import ColumnarModelDrawable
+from Drawable import BoxDrawable, LinkDrawable
+from LinkRouter import LinkRouter
+from ModelDrawable import ModelDrawable
+
+import pytest
+
+
+@pytest.mark.parametrize("modelClass", [ModelDrawable, ColumnarModelDrawable])
+def test_routed_links_are_hit_along_their_route(app, modelClass):
+    model = modelClass()
+    a = model.add_drawable(BoxDrawable(QRectF(0, 0, 100, 40), {"name": "a"}))
+    b = model.add_drawable(BoxDrawable(QRectF(600, 0, 100, 40), {"name": "b"}))
+    # A wall between the two boxes: the route goes around it, the straight line crosses it.
+    model.add_drawable(BoxDrawable(QRectF(300, -200, 40, 400), {"name": "wall"}))
+    link = model.add_drawable(LinkDrawable(a, b, {"name": "ab"}))
+    canvas = CanvasQWidget()
+    canvas.set_model(model)
+    router = LinkRouter(model, workers=1)
+    canvas.set_router(router)
+    router.wait()
+    route = router.route_of(link)
+    assert route is not None and len(route) > 2
+
+    # Clicking the empty straight line misses the link.
+    assert link not in canvas.hit_test(QPointF(480, 20))
+    # Clicking the middle of each routed segment hits it, above the boxes it crosses.
+    for p1, p2 in zip(route, route[1:]):
+        under = canvas.hit_test((p1 + p2) / 2)
+        assert link in under
+    assert link.contains(route[1], 0.0, route)
+    router.shutdown()
+
+
+@pytest.mark.parametrize("modelClass", [ModelDrawable, ColumnarModelDrawable])
+def test_links_are_routed_from_their_corridor(app, modelClass):
+    model = modelClass()
+    a = model.add_drawable(BoxDrawable(QRectF(0, 0, 100, 40), {"name": "a"}))
+    b = model.add_drawable(BoxDrawable(QRectF(600, 0, 100, 40), {"name": "b"}))
+    model.add_drawable(BoxDrawable(QRectF(300, -200, 40, 400), {"name": "wall"}))
+    far = model.add_drawable(BoxDrawable(QRectF(5000, 5000, 100, 40), {"name": "far"}))
+    link = model.add_drawable(LinkDrawable(a, b, {"name": "ab"}))
+    router = LinkRouter(model, workers=1)
+    router.pool.waitForDone()
+    # The first corridor is walled off: only the boxes inside it are snapshot.
+    (job,) = router.jobs
+    (row,) = job.links
+    assert job.routes[row[0]].points is None
+    assert len(row[4]) == 3
+    assert tuple(model.bounds_of([model.id_of(far)])[0].tolist()) not in map(tuple, row[4].tolist())
+    router.wait()
+    # The link is routed again in a wider corridor, which goes around the wall.
+    assert router.attempts == {}
+    assert len(router.route_of(link)) > 2
+    router.shutdown()
+
+
+def test_a_warm_canvas_matches_a_fresh_render_once_routed(app):
+    model = ModelDrawable()
+    a = model.add_drawable(BoxDrawable(QRectF(0, 0, 100, 40), {"name": "a"}))
+    # A large target box: the straight line reaches its center, tiles away from where the route ends.
+    b = model.add_drawable(BoxDrawable(QRectF(600, 0, 500, 600), {"name": "b"}))
+    model.add_drawable(BoxDrawable(QRectF(300, -200, 40, 400), {"name": "wall"}))
+    model.add_drawable(LinkDrawable(a, b, {"name": "ab"}))
+    router = LinkRouter(model, workers=1)
+    warm = CanvasQWidget()
+    warm.resize(1200, 700)
+    warm.set_router(router)
+    warm.set_model(model)
+    # Caches tiles with the straight link, then the route arrives.
+    warm.grab()
+    router.wait()
+    fresh = CanvasQWidget()
+    fresh.resize(1200, 700)
+    fresh.set_router(router)
+    fresh.set_model(model)
+    assert warm.grab().toImage() == fresh.grab().toImage()
+    router.shutdown()
+
+
+def test_routed_links_keep_their_z_order(app):
+    model = ModelDrawable()
+    a = model.add_drawable(BoxDrawable(QRectF(0, 0, 100, 40), {"name": "a"}))
+    b = model.add_drawable(BoxDrawable(QRectF(600, 0, 100, 40), {"name": "b"}))
+    # A wall open only at the top, so the route goes above it.
+    model.add_drawable(BoxDrawable(QRectF(300, -100, 40, 5000), {"name": "wall"}))
+    link = model.add_drawable(LinkDrawable(a, b, {"name": "ab"}))
+    above = model.add_drawable(BoxDrawable(QRectF(200, -300, 40, 40), {"name": "above"}))
+    canvas = CanvasQWidget()
+    canvas.set_model(model)
+    router = LinkRouter(model, workers=1)
+    canvas.set_router(router)
+    router.wait()
+    # Around the detour, away from the straight line: the link comes from the router.
+    rect = QRectF(150, -320, 250, 215)
+    assert link not in model.query_rect(rect)
+    drawn = canvas.with_routed_links(model.query_rect(rect), rect)
+    assert drawn == [link, above]
+    router.shutdown()
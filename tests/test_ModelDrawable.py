@@ -0,0 +1,44 @@
+from PySide6.QtCore import QPointF, QRectF
+
+from ColumnarModel import ColumnarModelDrawable
+from Drawable import BoxDrawable, LinkDrawable
+from ModelDrawable import ModelDrawable
+
+import pytest
+
+
+class ElbowLink(LinkDrawable):
+    """A link drawn through the corner below its source box."""
+
+    def corner(self) -> QPointF:
+        return QPointF(self.box1.rect.center().x(), self.box2.rect.center().y())
+
+    def boundingRect(self) -> QRectF:
+        return QRectF(self.box1.rect.center(), self.box2.rect.center()).normalized()
+
+    def segments(self) -> list:
+        p1, c, p2 = self.box1.rect.center(), self.corner(), self.box2.rect.center()
+        return [(p1.x(), p1.y(), c.x(), c.y()), (c.x(), c.y(), p2.x(), p2.y())]
+
+
+def test_query_point_tests_every_segment():
+    model = ModelDrawable()
+    a = model.add_drawable(BoxDrawable(QRectF(0, 0, 40, 40), {"name": "a"}))
+    b = model.add_drawable(BoxDrawable(QRectF(400, 400, 40, 40), {"name": "b"}))
+    link = model.add_drawable(ElbowLink(a, b, {"name": "ab"}))
+    # On the second segment, far from the first one.
+    assert link in model.query_point(QPointF(300, 420))
+    assert link in model.query_point(QPointF(20, 300))
+    assert link not in model.query_point(QPointF(220, 220))
+
+
+@pytest.mark.parametrize("modelClass", [ModelDrawable, ColumnarModelDrawable])
+def test_query_point_uses_width_overrides(modelClass):
+    model = modelClass()
+    a = model.add_drawable(BoxDrawable(QRectF(0, 0, 100, 40), {"name": "a"}))
+    b = model.add_drawable(BoxDrawable(QRectF(400, 0, 100, 40), {"name": "b"}))
+    link = model.add_drawable(LinkDrawable(a, b, {"name": "ab"}))
+    point = QPointF(250, 24)
+    assert link not in model.query_point(point)
+    model.set_styles([model.id_of(link)], [{"width": 12}])
+    assert link in model.query_point(point)
@@ -0,0 +1,64 @@
+import io
+
+from PySide6.QtCore import QRectF
+
+from ColumnarModel import ColumnarModelDrawable
+from Drawable import BoxDrawable, LinkDrawable
+from ModelDrawable import ModelDrawable
+from ModelFile import export_ndjson, import_ndjson, load_model, save_model
+
+import pytest
+
+
+def make_model(modelClass):
+    """Boxes a and b, their link, then box c: the link is below c."""
+    model = modelClass()
+    a = model.add_drawable(BoxDrawable(QRectF(0, 0, 100, 40), {"name": "a"}))
+    b = model.add_drawable(BoxDrawable(QRectF(300, 0, 100, 40), {"name": "b", "style": {"color": "red"}}))
+    model.add_drawable(LinkDrawable(a, b, {"name": "ab"}))
+    model.add_drawable(BoxDrawable(QRectF(150, -20, 100, 80), {"name": "c"}))
+    return model
+
+
+def contents(model):
+    result = []
+    for drawable in model.drawables:
+        if isinstance(drawable, LinkDrawable):
+            result.append(("link", drawable.box1.metadata["name"], drawable.box2.metadata["name"]))
+        else:
+            r = drawable.rect
+            result.append(("box", r.x(), r.y(), r.width(), r.height()))
+        result[-1] += (drawable.metadata["name"], drawable.metadata.get("style"))
+    return result
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+@pytest.mark.parametrize("modelClass", [ModelDrawable, ColumnarModelDrawable])
+def test_binary_round_trip_keeps_ids_and_z_order(tmp_path, modelClass, columnar):
+    model = make_model(modelClass)
+    path = str(tmp_path / "model.cnvm")
+    save_model(model, path)
+    loaded = load_model(path, columnar=columnar)
+    assert contents(loaded) == contents(model)
+    assert [loaded.id_of(d) for d in loaded.drawables] == [model.id_of(d) for d in model.drawables]
+
+
+@pytest.mark.parametrize("target", [ModelDrawable, ColumnarModelDrawable])
+@pytest.mark.parametrize("modelClass", [ModelDrawable, ColumnarModelDrawable])
+def test_ndjson_round_trip_keeps_z_order(modelClass, target):
+    model = make_model(modelClass)
+    stream = io.StringIO()
+    export_ndjson(model, stream)
+    stream.seek(0)
+    loaded = import_ndjson(stream, target())
+    assert contents(loaded) == contents(model)
+
+
+def test_ndjson_import_appends_after_existing_drawables():
+    model = make_model(ModelDrawable)
+    stream = io.StringIO()
+    export_ndjson(model, stream)
+    stream.seek(0)
+    loaded = import_ndjson(stream, make_model(ModelDrawable))
+    assert contents(loaded) == contents(model) * 2
+    assert len(set(loaded.ids.values())) == 8
@@ -0,0 +1,82 @@
+import os
+import sys
+
+import PluginManager
+from PluginManager import PluginManager as Manager, ToolSpec, load_drawable_class, plugin_module_name
+
+import pytest
+
+PLUGIN = '''
+from Drawable import BoxDrawable
+
+TOOLS = {{"{tool}": "{cls}"}}
+
+
+class {cls}(BoxDrawable):
+    origin = "{origin}"
+'''
+
+
+def write_plugin(directory, name, tool, cls, origin):
+    directory.mkdir(exist_ok=True)
+    path = directory / name
+    path.write_text(PLUGIN.format(tool=tool, cls=cls, origin=origin))
+    return str(path)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    def make(*dirs):
+        return Manager([ToolSpec("Box", "Drawable", "BoxDrawable")], [str(d) for d in dirs],
+                       str(tmp_path / "manifest.json"), entryPoints=False)
+    yield make
+    for name in [n for n in sys.modules if n.startswith("canvas_plugin_")]:
+        del sys.modules[name]
+
+
+def test_discovery_does_not_import_plugins(tmp_path, manager):
+    path = write_plugin(tmp_path / "plugins", "ellipse.py", "Ellipse", "EllipseDrawable", "one")
+    specs = manager(tmp_path / "plugins").discover()
+    assert [s.name for s in specs] == ["Box", "Ellipse"]
+    assert specs[1].path == os.path.abspath(path)
+    assert specs[1].module not in sys.modules
+    assert load_drawable_class(specs[1]).origin == "one"
+    assert specs[1].module in sys.modules
+
+
+def test_same_file_names_in_two_directories_load_separately(tmp_path, manager):
+    write_plugin(tmp_path / "a", "shapes.py", "Ellipse", "EllipseDrawable", "a")
+    write_plugin(tmp_path / "b", "shapes.py", "Star", "StarDrawable", "b")
+    specs = manager(tmp_path / "a", tmp_path / "b").discover()
+    ellipse, star = specs[1:]
+    assert ellipse.module != star.module
+    assert load_drawable_class(ellipse).origin == "a"
+    assert load_drawable_class(star).origin == "b"
+    assert plugin_module_name(ellipse.path) == ellipse.module
+
+
+def test_manifest_skips_unchanged_files(tmp_path, manager, monkeypatch):
+    path = write_plugin(tmp_path / "plugins", "ellipse.py", "Ellipse", "EllipseDrawable", "one")
+    manager(tmp_path / "plugins").discover()
+    assert os.path.exists(tmp_path / "manifest.json")
+
+    parsed = []
+    declared = PluginManager.declared_tools
+    monkeypatch.setattr(PluginManager, "declared_tools", lambda p: parsed.append(p) or declared(p))
+    assert [s.name for s in manager(tmp_path / "plugins").discover()] == ["Box", "Ellipse"]
+    assert parsed == []
+
+    # A changed file is parsed again.
+    write_plugin(tmp_path / "plugins", "ellipse.py", "Oval", "OvalDrawable", "two")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert [s.name for s in manager(tmp_path / "plugins").discover()] == ["Box", "Oval"]
+    assert parsed == [os.path.abspath(path)]
+
+
+def test_lazy_tool_loads_on_first_use(app, tmp_path, manager):
+    write_plugin(tmp_path / "plugins", "ellipse.py", "Ellipse", "EllipseDrawable", "one")
+    tools = manager(tmp_path / "plugins").tools()
+    ellipse = tools[1]
+    assert not ellipse.is_loaded()
+    assert ellipse.load().__name__ == "EllipseDrawable"
+    assert ellipse.is_loaded()
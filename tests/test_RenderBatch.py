@@ -0,0 +1,27 @@
+from PySide6.QtCore import QRectF
+
+from ColumnarModel import ColumnarModelDrawable
+from Drawable import BoxDrawable
+from RenderBatch import RenderBatch
+
+import pytest
+
+
+def labels(box, scale, lodTextMinPixels=8.0):
+    batch = RenderBatch(scale, lodTextMinPixels)
+    box.batch(batch)
+    assert sum(len(rects) for rects in batch.rects.values()) == 1
+    return [text for texts in batch.texts.values() for _, _, text in texts]
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_labels_below_the_lod_threshold_are_skipped(columnar):
+    box = BoxDrawable(QRectF(0, 0, 150, 40), {"name": "server"})
+    if columnar:
+        box = ColumnarModelDrawable().add_drawable(box)
+    # The box is 40 units high: 4 pixels at scale 0.1, 8 at 0.2, 20 at 0.5.
+    assert labels(box, 0.1) == []
+    assert labels(box, 0.2) == ["server"]
+    assert labels(box, 0.5) == ["server"]
+    # The narrower side counts: a tall, thin box is skipped too.
+    assert labels(BoxDrawable(QRectF(0, 0, 5, 400), {"name": "pole"}), 1.0) == []
@@ -0,0 +1,27 @@
+from PySide6.QtCore import QPointF, QRectF
+
+from SpatialIndex import GridIndex, segment_cells
+
+
+def test_segment_cells_follow_the_line():
+    assert segment_cells((10, 10, 1000, 500), 256) == [(0, 0), (1, 0), (1, 1), (2, 1), (3, 1)]
+    assert segment_cells((1000, 10, 10, 10), 256) == [(0, 0), (1, 0), (2, 0), (3, 0)]
+    assert segment_cells((10, 1000, 10, 10), 256) == [(0, 0), (0, 1), (0, 2), (0, 3)]
+
+
+def test_long_segments_are_found_near_their_line_only():
+    index = GridIndex(cellSize=100, maxCellsPerItem=64)
+    for i in range(1000):
+        index.insert(("box", i), QRectF(i * 20, 0, 10, 10))
+    index.insert("link", QRectF(0, 0, 100000, 100000), [(0, 0, 100000, 100000)])
+    # Every key stays in a grid level: nothing is scanned by every query.
+    assert sum(len(cell) for grid in index.levels.values() for cell in grid.values()) < 1000 * 4 + 64
+    assert "link" in index.query_point(QPointF(50000, 50000))
+    assert "link" not in index.query_point(QPointF(90000, 10000))
+    assert "link" in index.query_rect(QRectF(70000, 69000, 10, 10))
+    assert index.query_point(QPointF(19005, 5)) == {("box", 950)}
+
+    index.update("link", QRectF(0, 0, 100, 100000), [(0, 0, 100, 100000)])
+    assert "link" not in index.query_point(QPointF(50000, 50000))
+    index.remove("link")
+    assert not index.segments and "link" not in index
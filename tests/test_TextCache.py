@@ -0,0 +1,35 @@
+from PySide6.QtGui import QFont, QFontMetricsF
+
+from TextCache import TextCache
+
+
+def test_labels_wider_than_their_box_are_elided(app):
+    cache = TextCache()
+    font = QFont()
+    key = font.key()
+    label = "a rather long server name"
+    assert cache.get(label, 1000.0, font, key, 1.0).text() == label
+    width = QFontMetricsF(font).horizontalAdvance(label) / 2
+    elided = cache.get(label, width, font, key, 1.0).text()
+    assert elided.endswith("…") and len(elided) < len(label)
+    assert QFontMetricsF(font).horizontalAdvance(elided) <= width
+    # Nothing fits in a sliver: no text at all.
+    assert cache.get(label, 1.0, font, key, 1.0) is None
+
+
+def test_least_recently_used_labels_are_evicted(app):
+    cache = TextCache(maxEntries=2)
+    font = QFont()
+    key = font.key()
+    first = cache.get("a", 100.0, font, key, 1.0)
+    cache.get("b", 100.0, font, key, 1.0)
+    # Using "a" again makes "b" the least recently used.
+    assert cache.get("a", 100.0, font, key, 1.0) is first
+    cache.get("c", 100.0, font, key, 1.0)
+    assert len(cache) == 2
+    assert [k[0] for k in cache.entries] == ["a", "c"]
+    assert cache.hits == 1 and cache.misses == 3
+    # Scales in the same bucket share an entry, other buckets get their own.
+    assert cache.get("a", 100.0, font, key, 1.01) is first
+    assert cache.get("a", 100.0, font, key, 2.0) is not first
+    assert len(cache.elisions) == 2
@@ -0,0 +1,38 @@
+from PySide6.QtCore import QRectF
+from PySide6.QtGui import QImage
+
+from CanvasQWidget import CanvasQWidget
+from Drawable import BoxDrawable
+from ModelDrawable import ModelDrawable
+from TileCache import TileCache
+
+
+def test_invalidate_drops_exactly_the_touched_tiles():
+    cache = TileCache(tileSize=100)
+    cache.bleedPixels = 0.0
+    image = QImage(1, 1, QImage.Format_ARGB32)
+    keys = [(bucket, tx, ty) for bucket in (0, 8) for tx in range(4) for ty in range(4)]
+    for key in keys:
+        cache.put(key, image)
+    # At bucket 0 tiles are 100 model units, at bucket 8 (scale 2) 50 units.
+    cache.invalidate(QRectF(120, 10, 60, 20))
+    dropped = {key for key in keys if key not in cache.tiles}
+    assert dropped == {(0, 1, 0), (8, 2, 0), (8, 3, 0)}
+
+
+def test_a_model_edit_invalidates_the_overlapping_tiles(app):
+    model = ModelDrawable()
+    box = model.add_drawable(BoxDrawable(QRectF(20, 20, 100, 40), {"name": "a"}))
+    model.add_drawable(BoxDrawable(QRectF(600, 400, 100, 40), {"name": "b"}))
+    canvas = CanvasQWidget()
+    canvas.resize(800, 600)
+    canvas.set_model(model)
+    canvas.grab()
+    cache = canvas.tileCache
+    before = set(cache.tiles)
+    assert len(before) > 4
+    model.move_drawable(box, 10, 0)
+    m = canvas.cullMargin
+    changed = QRectF(20, 20, 110, 40).adjusted(-m, -m, m, m)
+    assert before - set(cache.tiles) == {key for key in before if cache.touches(key, changed)}
+    assert cache.tiles and all(not cache.touches(key, changed) for key in cache.tiles)
@@ -0,0 +1,40 @@
+from PySide6.QtCore import QPointF
+
+from Drawable import BoxDrawable
+from Tool import MultipointTool
+
+import pytest
+
+
+def state(errors, drawable):
+    return list(errors), drawable.rect.getRect(), drawable.metadata.get("name")
+
+
+@pytest.mark.parametrize("sequence", [
+    # Pointer moves before and after the anchor is picked, then typing.
+    [("move", QPointF(5, 5)), ("move", QPointF(-20, 40)), ("add", QPointF(10, 20)), ("move", QPointF(30, 30)),
+     ("move", "s"), ("move", "se"), ("move", QPointF(60, 60)), ("add", "server")],
+    # A name typed before any point, then moves.
+    [("move", "db"), ("move", QPointF(1, 2)), ("add", QPointF(3, 4)), ("move", QPointF(7, 8)), ("add", "db")],
+])
+def test_incremental_preview_matches_build(app, sequence):
+    tool = MultipointTool("Box", BoxDrawable)
+    changes = []
+    tool.changed.connect(lambda t, drawable, errors: changes.append((drawable, errors)))
+    finished = []
+    tool.finished.connect(lambda t, drawable: finished.append(drawable))
+    updated = 0
+    for action, value in sequence:
+        if action == "add":
+            tool.add_input(value)
+            continue
+        preview = tool.preview
+        tool.set_last_input(value)
+        drawable, errors = changes[-1]
+        if preview is not None:
+            # Updated in place rather than rebuilt.
+            assert drawable is preview
+            updated += 1
+        assert state(errors, drawable) == state(*BoxDrawable.build(tool.inputs + [value]))
+    assert updated >= 2
+    assert finished and finished[-1].metadata["name"] in ("server", "db")
@@ -0,0 +1,27 @@
+from PySide6.QtCore import QPointF, QRectF
+
+from Drawable import BoxDrawable
+
+import main
+
+
+def test_click_selects_the_topmost_drawable(app):
+    window = main.MainWindow()
+    window.resize(800, 600)
+    canvas = window.canvas
+    bottom = BoxDrawable(QRectF(10, 10, 200, 100), {"name": "bottom"})
+    top = BoxDrawable(QRectF(50, 30, 100, 40), {"name": "top"})
+    window.history.add([bottom, top])
+    window.on_select_activated()
+    point = canvas.model_to_screen(QPointF(80, 50))
+    event = canvas.canvas_pointer_event_at(point)
+    assert event.targetPath == [bottom, top]
+    window.onPointerDown(event)
+    window.onPointerUp(event)
+    assert window.selection.ids.tolist() == [canvas.model.id_of(top)]
+
+    # Dragging from the same point moves the selected top box, not a rubber band.
+    window.onPointerDown(event)
+    assert window.drag[0] == "move"
+    window.onPointerUp(canvas.canvas_pointer_event_at(point + QPointF(20, 0)))
+    assert top.rect.left() > 50 and bottom.rect.left() == 10
@@ -1,7 +1,8 @@
-from Drawable import BoxDrawable, LinkDrawable
-from Tool import MultipointTool
+from PluginManager import ToolSpec
 
+# Built-in tools, listed before the discovered plugins (see PluginManager). Their modules are
+# imported when a tool is first activated.
 tools_registry = [
-    MultipointTool("Box", BoxDrawable),
-    MultipointTool("Link", LinkDrawable),
-]
\ No newline at end of file
+    ToolSpec("Box", "Drawable", "BoxDrawable"),
+    ToolSpec("Link", "Drawable", "LinkDrawable"),
+]
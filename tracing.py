@@ -0,0 +1,167 @@
+import json
+import logging
+import math
+import os
+import sys
+import time
+from collections import deque
+from typing import Dict, List, Optional, TextIO
+
+# Leveled tracing goes through the standard logging tree under "canvas". Loggers are
+# disabled (WARNING) by default, so log.debug() calls cost one cached level check;
+# guard expensive arguments with log.isEnabledFor(logging.DEBUG).
+ROOT_LOGGER = "canvas"
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+class TraceRecorder:
+    """
+    Fixed-size ring buffer of timed events (paints, pointer and wheel handling...).
+    Recording is a deque append; old entries are overwritten once `capacity` is reached.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.entries = deque(maxlen=capacity)
+
+    def record(self, category: str, name: str, start: float, end: float, **fields):
+        """Records an event that ran from `start` to `end` (time.perf_counter() seconds)."""
+        self.entries.append((start, category, name, end - start, fields))
+
+    def snapshot(self) -> List[dict]:
+        return [dict(fields, time=start, category=category, name=name, duration_ms=duration * 1000.0)
+                for start, category, name, duration, fields in list(self.entries)]
+
+    def dump(self, stream: TextIO = None):
+        """Writes the recorded events as line-delimited JSON (stderr by default)."""
+        stream = stream if stream is not None else sys.stderr
+        for entry in self.snapshot():
+            stream.write(json.dumps(entry) + "\n")
+        stream.flush()
+
+    def clear(self):
+        self.entries.clear()
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """Nearest-rank percentile of `samples` (0 < p <= 100)."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100.0 * len(ordered)) - 1)]
+
+
+class FrameStats:
+    """
+    Per-frame timings and counters of a canvas, over the last `capacity` frames.
+
+    Each frame is a dict of phase times in milliseconds (hit_test_ms and dispatch_ms for the
+    pointer events handled since the previous frame, cull_ms, static_ms excluding culling,
+    feedback_ms, total_ms of the paint), latency_ms from the first pointer move not yet painted
+    to the end of the paint (None without input; moves whose handling requested no paint are not
+    counted), and counters. drawn, collapsed and culled
+    count the drawables rasterized, reduced to LOD points and left out by culling in the tiles
+    rendered during the frame; frames served from cached tiles do neither.
+    """
+
+    TIMES = ("hit_test_ms", "dispatch_ms", "cull_ms", "static_ms", "feedback_ms", "total_ms")
+    COUNTS = ("moves", "tiles_rendered", "tiles_cached", "drawn", "collapsed", "culled", "feedback")
+
+    def __init__(self, capacity: int = 240):
+        self.frames = deque(maxlen=capacity)
+        self.current: Dict[str, float] = {}
+        self.visible = set()
+        self.inputStart: Optional[float] = None
+        # Time of the first pointer move received but not handled yet (moves are coalesced).
+        self.pendingInput: Optional[float] = None
+        self.reset_current()
+
+    def reset_current(self):
+        self.current = dict.fromkeys(self.TIMES + self.COUNTS, 0)
+        self.visible.clear()
+
+    def input_received(self):
+        self.current["moves"] += 1
+        if self.pendingInput is None:
+            self.pendingInput = now()
+
+    def input_handled(self, updated: bool):
+        """Ends the pending moves: the next frame paints them if their handler requested an update, else none does."""
+        if updated and self.inputStart is None:
+            self.inputStart = self.pendingInput
+        self.pendingInput = None
+
+    def add_time(self, phase: str, seconds: float):
+        self.current[phase] += seconds * 1000.0
+
+    def count(self, counter: str, n: int = 1):
+        self.current[counter] += n
+
+    def end_frame(self, end: float, modelSize: int) -> dict:
+        """Closes the current frame at `end` and returns it."""
+        frame = self.current
+        frame["culled"] = modelSize - len(self.visible) if frame["tiles_rendered"] else 0
+        frame["latency_ms"] = (end - self.inputStart) * 1000.0 if self.inputStart is not None else None
+        self.inputStart = None
+        self.frames.append(frame)
+        self.reset_current()
+        return frame
+
+    def last(self) -> Optional[dict]:
+        return self.frames[-1] if self.frames else None
+
+    def summary(self) -> dict:
+        """p50/p99 of every phase time and of the input latency, and mean counters, over the recorded frames."""
+        frames = list(self.frames)
+        result = {"frames": len(frames)}
+        if not frames:
+            return result
+        for key in self.TIMES + ("latency_ms",):
+            samples = [f[key] for f in frames if f[key] is not None]
+            if samples:
+                result[key] = {"p50": percentile(samples, 50), "p99": percentile(samples, 99)}
+        for key in self.COUNTS:
+            result[key] = sum(f[key] for f in frames) / len(frames)
+        return result
+
+    def clear(self):
+        self.frames.clear()
+        self.inputStart = None
+        self.pendingInput = None
+        self.reset_current()
+
+
+# The active recorder, or None when recording is off. Hot paths check it before timing anything.
+recorder: Optional[TraceRecorder] = None
+
+
+def enable_recorder(capacity: int = 4096) -> TraceRecorder:
+    global recorder
+    recorder = TraceRecorder(capacity)
+    return recorder
+
+
+def disable_recorder():
+    global recorder
+    recorder = None
+
+
+def now() -> float:
+    return time.perf_counter()
+
+
+def configure_from_env():
+    """
+    CANVAS_TRACE=<level> (debug, info...) sends canvas logs at that level to stderr.
+    CANVAS_TRACE_RECORD=<capacity> enables the ring-buffer recorder.
+    """
+    level = os.environ.get("CANVAS_TRACE")
+    if level:
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.setLevel(level.upper())
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(relativeCreated)8.1fms %(name)s %(levelname)s %(message)s"))
+        logger.addHandler(handler)
+    capacity = os.environ.get("CANVAS_TRACE_RECORD")
+    if capacity:
+        enable_recorder(int(capacity))